@@ -1,6 +1,28 @@
-from flask import Flask, request, session, redirect
+from flask import Flask, request, session, redirect, g, render_template, stream_with_context, url_for, send_from_directory, abort
+from jinja2 import FileSystemBytecodeCache
+from jinja2.environment import TemplateStream
+from markupsafe import Markup, escape
 import sqlite3
 from datetime import datetime, timedelta
+from functools import wraps
+import hashlib
+import time
+from urllib.parse import urlencode
+
+import assets
+import catalog
+import compression
+import db
+import etags
+import fines
+import holds
+import loans
+import metrics
+import migrations
+import pagination
+import profiling
+import search
+import stats
 
 app = Flask(__name__)
 app.secret_key = "nuradila_secret"
@@ -8,81 +30,272 @@ app.secret_key = "nuradila_secret"
 import os
 import sqlite3
 
-def get_db():
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    DB_PATH = os.path.join(BASE_DIR, "library.db")
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# ==================== GLOBAL DESIGN ====================
-style = """
-<style>
-  @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@500;700&display=swap');
-  body { background:#1f3b1f url('https://images.unsplash.com/photo-1501785888041-af3ef285b470?q=80&w=1600&auto=format&fit=crop') center/cover no-repeat fixed;
-         color:#eef7e6; font-family:'Playfair Display',serif; text-align:center; margin:0; }
-  .overlay { background:rgba(23,46,23,.75); min-height:100vh; padding-bottom:60px; }
-  h1 { font-size:48px; margin:30px 0 10px; } h2 { font-size:36px; margin:20px 0 10px; } h3 { font-size:26px; margin:18px 0 8px; }
-  p, label { font-size:18px; }
-  .btn { background:#2f6b2f; color:#eef7e6; padding:16px 28px; margin:10px; border-radius:14px; text-decoration:none; display:inline-block; font-size:20px; border:2px solid #9dd49d; transition:all .2s; }
-  .btn:hover { background:#3f8f3f; color:#fff; transform:translateY(-2px); }
-  .grid { display:grid; grid-template-columns:repeat(auto-fit,minmax(350px,1fr)); gap:16px; width:92%; max-width:1200px; margin:0 auto 20px; }
-  .card { background:linear-gradient(135deg, rgba(58,110,58,.82), rgba(41,79,41,.88)); border:1px solid #9dd49d; box-shadow:0 6px 18px rgba(0,0,0,.35); border-radius:16px; padding:16px 18px; text-align:left; backdrop-filter:blur(2px); }
-  .card h3 { margin:0 0 10px; font-size:24px; } .card p { margin:6px 0; }
-  .actions { margin-top:10px; display:flex; flex-wrap:wrap; gap:10px; }
-  .pill { display:inline-block; padding:6px 12px; border-radius:999px; font-size:14px; border:1px solid #c6e8c6; background:rgba(255,255,255,.08); }
-  .section { margin:16px auto; width:92%; max-width:1200px; text-align:left; }
-  form.inline { display:inline-block; margin:6px 10px 0 0; }
-  input, select, textarea { padding:10px 12px; border-radius:10px; border:1px solid #9dd49d; background:rgba(255,255,255,.12); color:#eaf6e1; margin:6px 8px; font-size:16px; outline:none; width:min(280px,92%); }
-  input::placeholder, textarea::placeholder { color:#d6ead2; }
-  .muted { color:#cfe8c8; font-size:16px; }
-  .hr { height:1px; background:#9dd49d33; margin:18px 0; }
-  .center { text-align:center; }
-  .star-rating { color:#FFD700; font-size:20px; margin:5px 0; }
-  .btn-small { padding:10px 16px; font-size:14px; }
-  .btn-danger { background:#8b0000; border-color:#ff6b6b; }
-  .btn-warning { background:#8a6d00; border-color:#ffd700; }
-  .book-details { display:grid; grid-template-columns:repeat(auto-fit, minmax(200px, 1fr)); gap:10px; margin:15px 0; }
-  .detail-item { background:rgba(255,255,255,.05); padding:10px; border-radius:8px; }
-  .book-type { display:inline-block; padding:4px 10px; border-radius:6px; margin:2px; font-size:12px; }
-  .type-physical { background:rgba(46, 204, 113, 0.2); border:1px solid rgba(46, 204, 113, 0.5); }
-  .type-ebook { background:rgba(52, 152, 219, 0.2); border:1px solid rgba(52, 152, 219, 0.5); }
-  .type-audiobook { background:rgba(155, 89, 182, 0.2); border:1px solid rgba(155, 89, 182, 0.5); }
-  .type-reference { background:rgba(241, 196, 15, 0.2); border:1px solid rgba(241, 196, 15, 0.5); }
-  .stat-box { background:linear-gradient(135deg, rgba(58,110,58,.9), rgba(41,79,41,.95)); border:2px solid #9dd49d; border-radius:12px; padding:15px; margin:10px; text-align:center; }
-  .stat-value { font-size:32px; font-weight:bold; color:#fff; margin:5px 0; }
-  .stat-label { font-size:14px; color:#cfe8c8; }
-  .stats-grid { display:grid; grid-template-columns:repeat(auto-fit, minmax(200px, 1fr)); gap:15px; margin:20px auto; max-width:1200px; }
-  .overdue { color:#ff6b6b; font-weight:bold; }
-  .fine-due { background:rgba(255,0,0,0.1); padding:10px; border-radius:8px; border:1px solid #ff6b6b; margin:10px 0; }
-  .auto-fine { background:rgba(255,255,0,0.1); padding:10px; border-radius:8px; border:1px solid #ffd700; margin:10px 0; }
-</style>
-<div class='overlay'>
-"""
-def end(): return "</div>"
+# Warn when one request runs more statements than this (catches N+1 loops)
+QUERY_WARN_THRESHOLD = int(os.environ.get("LIBRARY_QUERY_WARN", "30"))
 
-# ==================== HELPER FUNCTIONS ====================
-def calculate_fine(borrow_date, return_date=None):
-    """Calculate fine based on borrow date"""
+def count_query(statement):
+    # Trigger bodies are reported as "-- TRIGGER ..." and are not separate statements
+    if not statement.startswith("--"):
+        g.query_count = g.get("query_count", 0) + 1
+
+def get_db():
+    """Get this request's database connection from the pool"""
+    if "db" not in g:
+        g.db = db.pool.acquire()
+        g.db_acquired = time.perf_counter()
+        g.query_count = 0
+        g.db.set_trace_callback(count_query)
+        # The request is gone by the time the app context tears down
+        g.db_request = f"{request.method} {request.path}"
+        if isinstance(g.db, profiling.ProfiledConnection):
+            g.db.queries = []
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.set_trace_callback(None)
+        queries = getattr(conn, "queries", None)
+        if queries is not None:
+            conn.queries = None
+            if profiling.ENABLED:
+                route = g.get("route", "other")
+                profiling.collector.record(route, queries)
+                profiling.log_slow(route, queries)
+        db.pool.release(conn)
+        count = g.pop("query_count", 0)
+        if count > QUERY_WARN_THRESHOLD:
+            app.logger.warning("%s ran %d SQL statements (threshold %d)",
+                               g.pop("db_request", "?"), count, QUERY_WARN_THRESHOLD)
+
+migrations.migrate()
+fines.load_policies()
+if profiling.ENABLED:
+    db.pool.factory = profiling.ProfiledConnection
+db.pool.warm()
+db.start_checkpointer()
+
+# ==================== TEMPLATES ====================
+# Pages are Jinja2 templates in templates/ with autoescaping on; the cards
+# shared between pages are macros in templates/macros.html. Compiled templates
+# are kept as bytecode on disk (LIBRARY_TEMPLATE_CACHE, default a temp dir) so
+# new workers load them instead of parsing and compiling them again.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.environ.get("LIBRARY_TEMPLATE_CACHE"))
+
+BOOK_TYPES = ('Physical', 'E-book', 'Audiobook', 'Reference')
+
+# Match markers for search.search_books(), turned into <mark> by |highlight
+HIGHLIGHT = ("\x02", "\x03")
+
+@app.template_filter("type_class")
+def type_class(book_type):
+    """CSS class of a book type badge, 'E-book' -> 'type-ebook'"""
+    return f"type-{(book_type or '').lower().replace('-', '').replace(' ', '')}"
+
+@app.template_filter("rm")
+def rm(amount):
+    """Format an amount of money"""
+    return f"RM {float(amount or 0):.2f}"
+
+@app.template_filter("stars")
+def stars(rating):
+    return "⭐" * int(rating) if rating else "No rating"
+
+@app.template_filter("highlight")
+def highlight(text):
+    """Escape a highlighted search column and wrap its matches in <mark>"""
+    if not text:
+        return None
+    return escape(text).replace(HIGHLIGHT[0], Markup("<mark>")).replace(HIGHLIGHT[1], Markup("</mark>"))
+
+def message(title, back="/", back_label="⬅️ Back", heading="h3", detail=None):
+    """A one-line result or error page with a button back"""
+    return render_template("message.html", title=title, heading=heading, detail=detail,
+                           back=back, back_label=back_label)
+
+# Template pieces joined into each chunk of a streamed page
+STREAM_BUFFER = int(os.environ.get("LIBRARY_STREAM_BUFFER", "200"))
+
+def stream_page(template_name, **context):
+    """Like render_template(), but the page is sent while it is being rendered.
+
+    Long lists are passed as generators (db.iter_rows, pagination.StreamedPage)
+    that run their query when the template reaches them and fetch rows in
+    batches, so the top of the page goes out before the lists are read and no
+    list is ever held in memory whole. The request context, and with it the
+    pooled connection, stays open until the last chunk has been sent.
+    """
+    app.update_template_context(context)
+    stream = TemplateStream(app.jinja_env.get_template(template_name).generate(context))
+    stream.enable_buffering(STREAM_BUFFER)
+    return stream_with_context(stream)
+
+def book_details(entry, type_icon='', copies=None):
+    """The ui.book_details card of a cached book, rendered once per book version (see catalog.py)"""
+    return catalog.books.fragment(entry, (type_icon, copies), lambda b: Markup(
+        render_template("book_details.html", b=b, type_icon=type_icon, copies=copies)))
+
+def warm_templates():
+    """Compile every template (or load it from the bytecode cache) at startup"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+warm_templates()
+
+# ==================== STATIC ASSETS ====================
+@app.template_global()
+def asset_url(filename):
+    """url_for() for a static file, with its content hash in the name (see assets.py)"""
+    return url_for("asset", name=assets.asset_name(filename))
+
+@app.route("/assets/<path:name>")
+def asset(name):
+    filename, digest = assets.split_name(name)
     try:
-        if isinstance(borrow_date, str):
-            borrow_date = datetime.strptime(borrow_date, "%Y-%m-%d")
-        
-        if return_date:
-            if isinstance(return_date, str):
-                return_date = datetime.strptime(return_date, "%Y-%m-%d")
-            days_diff = (return_date - borrow_date).days
-        else:
-            days_diff = (datetime.now() - borrow_date).days
-        
-        # Fine calculation: RM 1 per day after 14 days
-        if days_diff > 14:
-            fine = (days_diff - 14) * 1.0  # RM 1 per day
-            return round(fine, 2)
-        return 0.0
-    except:
-        return 0.0
+        current = assets.content_hash(filename)
+    except OSError:
+        abort(404)
+    if digest != current:
+        # Unhashed or stale name (page cached across a deploy): current file, revalidated
+        return send_from_directory(assets.STATIC_DIR, filename, max_age=0)
+    response = send_from_directory(assets.STATIC_DIR, filename, max_age=assets.MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+# ==================== CONDITIONAL GET ====================
+# Pages tagged with @conditional get a weak ETag built from the data versions
+# of the tables they read (see etags.py). A browser revalidating with a tag
+# that still matches gets a 304 before the view runs.
+def build_version():
+    """Hash of every template and static file: a deploy that changes them changes every ETag"""
+    h = hashlib.sha256()
+    for name in sorted(app.jinja_env.list_templates()):
+        h.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode())
+    for root, dirs, files in sorted(os.walk(assets.STATIC_DIR)):
+        for name in sorted(files):
+            h.update(assets.content_hash(os.path.relpath(os.path.join(root, name), assets.STATIC_DIR)).encode())
+    return h.hexdigest()[:12]
+
+BUILD_VERSION = build_version()
+
+def conditional(*tables):
+    """Answer GETs of a page that only reads `tables` with 304 while none of them changed"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            versions = etags.read_versions(get_db(), tables)
+            # The same data renders differently per user, page URL and day (date defaults)
+            tag = etags.make_etag(versions, BUILD_VERSION, request.full_path,
+                                  session.get("role"), session.get("patron_id"), today())
+            if request.if_none_match.contains_weak(tag):
+                etags.counters.record(request.endpoint, 'not_modified')
+                response = app.response_class(status=304)
+            else:
+                etags.counters.record(request.endpoint, 'revalidated' if request.if_none_match else 'fresh')
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
+
+@app.route("/etag_stats")
+def etag_stats_api():
+    """API endpoint for conditional GET counters per page"""
+    return etags.counters.stats()
+
+# ==================== COMPRESSION ====================
+# gzip or brotli for every response, in front of the whole app (see compression.py)
+app.wsgi_app = compression.CompressionMiddleware(app.wsgi_app)
+
+@app.before_request
+def tag_route():
+    # Lets the middleware report savings per route instead of per URL
+    if request.url_rule is not None:
+        request.environ[compression.ROUTE_KEY] = request.url_rule.rule
+
+@app.route("/compression_stats")
+def compression_stats_api():
+    """API endpoint for bytes saved by compression per route"""
+    return app.wsgi_app.stats()
+
+# ==================== SQL PROFILING ====================
+# LIBRARY_SQL_PROFILE=1 times every statement (see profiling.py). Streamed
+# pages render after the headers are sent, so their Server-Timing only
+# covers the work done before the first byte; /sql_stats has all of it.
+if profiling.ENABLED:
+    @app.before_request
+    def start_profile():
+        g.profile_started = time.perf_counter()
+        g.route = request.url_rule.rule if request.url_rule is not None else "other"
+
+    @app.after_request
+    def add_server_timing(response):
+        if "profile_started" in g:
+            queries = g.db.queries if "db" in g and g.db.queries is not None else []
+            response.headers.add("Server-Timing",
+                                 profiling.server_timing(queries, time.perf_counter() - g.profile_started))
+        return response
+
+@app.route("/sql_stats")
+def sql_stats_api():
+    """API endpoint for SQL time per route and its most expensive statements"""
+    if not profiling.ENABLED:
+        return {'enabled': False, 'hint': "set LIBRARY_SQL_PROFILE=1"}
+    return {'enabled': True, 'slow_ms': profiling.SLOW_MS,
+            'routes': profiling.collector.stats(int(request.args.get("top", 10)))}
+
+# ==================== METRICS ====================
+# Prometheus metrics at /metrics (see metrics.py), on unless LIBRARY_METRICS=0.
+# A streamed page keeps its request context until the stream ends, so its
+# latency is observed in teardown and includes the rendering. How long the
+# request kept its pooled connection checked out is timed in get_db() and
+# here, so the statements themselves run unwrapped; that is checkout time
+# (streamed pages render while holding it), not SQL time, which is only
+# there when profiling times every statement.
+if metrics.ENABLED:
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def keep_status(response):
+        g.response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def observe_request(exc):
+        started = g.pop("request_started", None)
+        if started is None:
+            return
+        endpoint = (('endpoint', request.endpoint or "unmatched"),)
+        # An unhandled error skips after_request and becomes a 500
+        status = str(g.pop("response_status", 500))
+        metrics.registry.inc('library_http_requests_total', endpoint + (('method', request.method), ('status', status)))
+        metrics.registry.observe('library_http_request_duration_seconds', endpoint, time.perf_counter() - started)
+        if "db" not in g:
+            return
+        metrics.registry.inc('library_db_queries_total', endpoint, g.get("query_count", 0))
+        metrics.registry.observe('library_db_pool_checkout_seconds', endpoint, time.perf_counter() - g.db_acquired)
+        queries = getattr(g.db, "queries", None)
+        if queries is not None:
+            metrics.registry.observe('library_db_duration_seconds', endpoint, sum(q['seconds'] for q in queries))
+
+@app.route("/metrics")
+def metrics_api():
+    """Prometheus scrape endpoint, summed over all gunicorn workers"""
+    if not metrics.ENABLED:
+        abort(404)
+    return app.response_class(metrics.exposition(metrics.registry, get_db()), content_type=metrics.CONTENT_TYPE)
 
+# ==================== HELPER FUNCTIONS ====================
 def get_patron_total_fine(patron_id):
     """Get total fine for a patron"""
     conn = get_db()
@@ -90,6 +303,25 @@ def get_patron_total_fine(patron_id):
                          (patron_id,)).fetchone()
     return result['total'] or 0
 
+def get_patron_total_fines(patron_ids):
+    """Get total fine for many patrons in one query, as {patron_id: total}"""
+    if not patron_ids:
+        return {}
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT patron_id, SUM(fine) as total FROM Transactions
+        WHERE return_date IS NULL AND patron_id IN ({})
+        GROUP BY patron_id
+    """.format(','.join('?' * len(patron_ids))), list(patron_ids)).fetchall()
+    return {r['patron_id']: r['total'] or 0 for r in rows}
+
+def with_patron_fines(page):
+    """(patron, total fine) for a streamed page of patrons, one fines query per batch"""
+    for batch in page.batches():
+        totals = get_patron_total_fines([p['patron_id'] for p in batch])
+        for p in batch:
+            yield p, totals.get(p['patron_id'], 0)
+
 def get_patron_unpaid_fines(patron_id):
     """Get unpaid fines for a patron"""
     conn = get_db()
@@ -117,35 +349,45 @@ def get_patron_info(patron_id):
     patron = conn.execute("SELECT * FROM Patron WHERE patron_id = ?", (patron_id,)).fetchone()
     return patron
 
+# Sort orders for book lists (?sort=), last column must be unique
+BOOK_SORTS = {
+    'id': ('book_id',),
+    'title': ('title', 'book_id'),
+}
+
+def books_page(conn, param="after"):
+    """One streamed keyset page of Books using the request's ?sort=, ?size= and cursor"""
+    order_by = BOOK_SORTS.get(request.args.get("sort"), BOOK_SORTS['id'])
+    size = pagination.page_size(request.args.get("size"))
+    return pagination.StreamedPage(conn, "Books", order_by, request.args.get(param), size)
+
+@app.template_global()
+def pager(label, param, page, total):
+    """Navigation links for a streamed keyset page (see the ui.pager macro).
+
+    Called from the template after the page's rows, once its next cursor is known.
+    """
+    args = request.args.to_dict()
+    links = {'label': label, 'shown': page.shown, 'total': total, 'first': None, 'next': None}
+    if args.get(param):
+        first = {k: v for k, v in args.items() if k != param}
+        links['first'] = f"{request.path}?{urlencode(first)}"
+    if page.next_cursor:
+        args[param] = page.next_cursor
+        links['next'] = f"{request.path}?{urlencode(args)}"
+    return links
+
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
 # ==================== HOME ====================
 @app.route("/")
 def home():
-    return style + """
-      <h1>🌲 Library Borrowing System</h1>
-      
-      <div class='center'>
-        <a class='btn' href='/login_admin'>🛡️ Admin</a>
-        <a class='btn' href='/login_librarian'>📚 Librarian</a>
-        <a class='btn' href='/login_student'>🎓 Student</a>
-        <a class='btn' href='/guest'>👥 Guest</a>
-        <a class='btn' href='/login_bank'>🏦 Bank</a>
-        <a class='btn' href='/search_books'>🔍 Search books</a>
-      </div>
-    """ + end()
+    return render_template("home.html")
 
 # ==================== LOGIN HELPERS ====================
 def login_role_page(title, post_url):
-    return style + f"""
-      <h2>{title}</h2>
-      <form method='POST' action='{post_url}' class='center'>
-        <label>Email</label><br>
-        <input name='email' placeholder='email@example.com' required><br>
-        <label>Password</label><br>
-        <input type='password' name='password' placeholder='••••••••' required><br>
-        <button class='btn'>🔓 Login</button>
-      </form>
-      <div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>
-    """ + end()
+    return render_template("login.html", title=title, post_url=post_url)
 
 def login_role_submit(role, success_path):
     email = request.form.get("email","").strip()
@@ -157,7 +399,7 @@ def login_role_submit(role, success_path):
         session["patron_id"] = user["patron_id"]
         session["name"] = user["name"]
         return redirect(success_path)
-    return style + "<h2>❌ Invalid credentials</h2><div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>" + end()
+    return message("❌ Invalid credentials", "/", "⬅️ Kembali", heading="h2")
 
 # ==================== LOGIN ROUTES ====================
 @app.route("/login_admin", methods=["GET","POST"])
@@ -177,15 +419,7 @@ def login_bank():
 
 @app.route("/login_student", methods=["GET","POST"])
 def login_student():
-    return style + """
-      <h2>🎓 Student Login</h2>
-      <form method='POST' action='/student_login' class='center'>
-        <label>Nama</label><br>
-        <input name='name' placeholder='Nama dalam data' required><br>
-        <button class='btn'>🔓 Login</button>
-      </form>
-      <div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>
-    """ + end()
+    return render_template("login.html", title="🎓 Student Login", post_url="/student_login", by_name=True)
 
 @app.route("/student_login", methods=["POST"])
 def student_login():
@@ -197,120 +431,29 @@ def student_login():
         session["patron_id"] = user["patron_id"]
         session["name"] = user["name"]
         return redirect("/student")
-    return style + "<h2>❌ Tiada data untuk nama ini</h2><div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>" + end()
+    return message("❌ Tiada data untuk nama ini", "/", "⬅️ Kembali", heading="h2")
 
 # ==================== GUEST ACCESS ====================
 @app.route("/guest")
+@conditional("Books", "Feedback", "Patron")
 def guest():
     conn = get_db()
-    books = conn.execute("SELECT * FROM Books").fetchall()
-    feedbacks = conn.execute("SELECT * FROM Feedback").fetchall()
-    
-    html = style + "<h1>👥 Guest Access</h1>"
-    html += "<p class='muted center'>View books and manage feedback without login</p>"
-    
-    # Book Collection Section
-    html += "<h2>📚 Book Collection</h2>"
-    html += "<div class='section'><div class='grid'>"
-    for b in books:
-        status = "Available ✅" if b['available'] else "Borrowed ❌"
-        type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-        html += f"""
-        <div class='card'>
-          <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
-          <p><strong>Author:</strong> {b['author'] or '-'}</p>
-          <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-          <p><strong>Call Number:</strong> {b['call_number'] or '-'}</p>
-          <div class='actions'>
-            <a class='btn btn-small' href='/guest_view_book/{b['book_id']}'>👁️ View Details</a>
-          </div>
-        </div>
-        """
-    html += "</div></div>"
-    
-    # Feedback Section
-    html += "<div class='hr'></div>"
-    html += "<h2>💬 All Feedback</h2>"
-    
-    if feedbacks:
-        html += "<div class='section'><div class='grid'>"
-        for f in feedbacks:
-            rating_stars = "⭐" * int(f['rating']) if f['rating'] else "No rating"
-            patron_name = "Anonymous"
-            if f['patron_id']:
-                patron = conn.execute("SELECT name FROM Patron WHERE patron_id=?", (f['patron_id'],)).fetchone()
-                patron_name = patron['name'] if patron else "Anonymous"
-            
-            html += f"""
-            <div class='card'>
-              <h3>Feedback #{f['feedback_id']}</h3>
-              <p><strong>From:</strong> {patron_name}</p>
-              <p><strong>Date:</strong> {f['feedback_date'] or '-'}</p>
-              <div class='star-rating'>{rating_stars}</div>
-              <p><strong>Comment:</strong> {f['comment'][:100]}{'...' if len(f['comment']) > 100 else ''}</p>
-              <div class='actions'>
-                <a class='btn btn-small' href='/guest_view_feedback/{f['feedback_id']}'>👁️ View</a>
-                <a class='btn btn-small btn-warning' href='/guest_edit_feedback/{f['feedback_id']}'>✏️ Edit</a>
-                <form class='inline' method='POST' action='/guest_delete_feedback/{f['feedback_id']}'>
-                  <button class='btn btn-small btn-danger' type='submit' onclick='return confirm("Delete this feedback?")'>🗑️ Delete</button>
-                </form>
-              </div>
-            </div>
-            """
-        html += "</div></div>"
-    else:
-        html += "<p class='muted center'>No feedback yet. Be the first to add feedback!</p>"
-    
-    # Add Feedback Form
-    html += """
-    <div class='hr'></div>
-    <div class='section'>
-      <div class='card'>
-        <h3>➕ Add New Feedback</h3>
-        <form method='POST' action='/guest_create_feedback'>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Your Name (Optional)</label>
-            <input name='name' placeholder='Enter your name'>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Feedback Date</label>
-            <input type='date' name='feedback_date' value='""" + datetime.now().strftime("%Y-%m-%d") + """' required>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Rating (1-5 Stars)</label>
-            <select name='rating' required>
-              <option value=''>Select Rating</option>
-              <option value='5'>⭐⭐⭐⭐⭐ Excellent</option>
-              <option value='4'>⭐⭐⭐⭐ Very Good</option>
-              <option value='3'>⭐⭐⭐ Good</option>
-              <option value='2'>⭐⭐ Fair</option>
-              <option value='1'>⭐ Poor</option>
-            </select>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Your Comments</label>
-            <textarea name='comment' placeholder='Share your thoughts...' rows='4' required></textarea>
-          </div>
-          <button class='btn' type='submit'>💾 Submit Feedback</button>
-        </form>
-      </div>
-    </div>
-    """
+    total_books = stats.read_stats(conn)['books']
+    feedbacks = db.iter_rows(conn, "SELECT f.*, p.name AS patron_name FROM Feedback f LEFT JOIN Patron p ON p.patron_id = f.patron_id ORDER BY f.feedback_id")
     
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Back to Home</a></div>"
-    return html + end()
+    return stream_page("guest.html", books=books_page(conn), total_books=total_books,
+                       feedbacks=feedbacks, today=today())
 
 # ==================== GUEST VIEW BOOK DETAILS ====================
 @app.route("/guest_view_book/<int:book_id>")
+@conditional("Books")
 def guest_view_book(book_id):
     conn = get_db()
-    b = conn.execute("SELECT * FROM Books WHERE book_id=?", (book_id,)).fetchone()
+    entry = catalog.books.lookup(conn, book_id)
     
-    if not b:
-        return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/guest'>⬅️ Back</a></div>" + end()
-    
-    status = "Available ✅" if b['available'] else "Borrowed ❌"
-    type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
+    if not entry:
+        return message("❌ Book not found", "/guest")
+    b = entry['row']
     
     # Get book type icon
     type_icon = {
@@ -320,43 +463,7 @@ def guest_view_book(book_id):
         'Reference': '📚'
     }.get(b['type'], '📖')
     
-    return style + f"""
-      <h2>📖 Book Details</h2>
-      <div class='card'>
-        <h3>{b['title'] or '-'}</h3>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Author:</strong><br>{b['author'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>ISBN:</strong><br>{b['isbn'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Published Year:</strong><br>{b['published_year'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Genre:</strong><br>{b['genre'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Type:</strong><br>{type_icon} <span class='book-type {type_class}'>{b['type'] or '-'}</span>
-          </div>
-          <div class='detail-item'>
-            <strong>Call Number:</strong><br>{b['call_number'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Shelf Location:</strong><br>{b['shelf_location'] or 'Not specified'}
-          </div>
-          <div class='detail-item'>
-            <strong>Status:</strong><br>{status}
-          </div>
-        </div>
-        <p><strong>Book ID:</strong> {b['book_id']}</p>
-      </div>
-      <div class='center'>
-        <a class='btn' href='/guest'>⬅️ Back to Guest</a>
-        <a class='btn' href='/search_books'>🔍 Search More Books</a>
-      </div>
-    """ + end()
+    return render_template("guest_book.html", b=b, details=book_details(entry, type_icon))
 
 # ==================== GUEST FEEDBACK CRUD ====================
 @app.route("/guest_create_feedback", methods=["POST"])
@@ -396,31 +503,14 @@ def guest_view_feedback(feedback_id):
     f = conn.execute("SELECT * FROM Feedback WHERE feedback_id = ?", (feedback_id,)).fetchone()
     
     if not f:
-        return style + "<h3>❌ Feedback not found</h3><div class='center'><a class='btn' href='/guest'>⬅️ Back</a></div>" + end()
+        return message("❌ Feedback not found", "/guest")
     
-    rating_stars = "⭐" * int(f['rating']) if f['rating'] else "No rating"
     patron_name = "Anonymous"
     if f['patron_id']:
         patron = conn.execute("SELECT name FROM Patron WHERE patron_id=?", (f['patron_id'],)).fetchone()
         patron_name = patron['name'] if patron else "Anonymous"
     
-    return style + f"""
-      <h2>📝 Feedback Details</h2>
-      <div class='card'>
-        <h3>Feedback #{f['feedback_id']}</h3>
-        <p><strong>From:</strong> {patron_name}</p>
-        <p><strong>Date:</strong> {f['feedback_date']}</p>
-        <p><strong>Rating:</strong> {rating_stars} ({f['rating']}/5)</p>
-        <p><strong>Comment:</strong></p>
-        <div style='background: rgba(255,255,255,0.05); padding: 15px; border-radius: 10px; margin: 10px 0;'>
-          {f['comment']}
-        </div>
-        <div class='actions' style='justify-content: center; margin-top: 20px;'>
-          <a class='btn' href='/guest_edit_feedback/{feedback_id}'>✏️ Edit Feedback</a>
-          <a class='btn' href='/guest'>⬅️ Back to Guest</a>
-        </div>
-      </div>
-    """ + end()
+    return render_template("feedback_view.html", f=f, patron_name=patron_name)
 
 @app.route("/guest_edit_feedback/<int:feedback_id>", methods=["GET", "POST"])
 def guest_edit_feedback(feedback_id):
@@ -428,7 +518,7 @@ def guest_edit_feedback(feedback_id):
     f = conn.execute("SELECT * FROM Feedback WHERE feedback_id = ?", (feedback_id,)).fetchone()
     
     if not f:
-        return style + "<h3>❌ Feedback not found</h3><div class='center'><a class='btn' href='/guest'>⬅️ Back</a></div>" + end()
+        return message("❌ Feedback not found", "/guest")
     
     if request.method == "POST":
         comment = request.form.get("comment", f['comment'])
@@ -441,37 +531,7 @@ def guest_edit_feedback(feedback_id):
         return redirect(f"/guest_view_feedback/{feedback_id}")
     
     # GET request - show edit form
-    return style + f"""
-      <h2>✏️ Edit Feedback #{feedback_id}</h2>
-      <div class='card' style='max-width: 600px; margin: 30px auto;'>
-        <form method='POST'>
-          <div style='margin-bottom: 20px;'>
-            <label style='display: block; margin-bottom: 8px;'>Feedback Date</label>
-            <input type='date' name='feedback_date' value='{f['feedback_date']}' readonly>
-            <p class='muted' style='font-size: 14px;'>Date cannot be changed</p>
-          </div>
-          
-          <div style='margin-bottom: 20px;'>
-            <label style='display: block; margin-bottom: 8px;'>Rating (1-5 Stars)</label>
-            <select name='rating' required>
-              <option value='1' {'selected' if f['rating'] == 1 else ''}>⭐ Poor (1)</option>
-              <option value='2' {'selected' if f['rating'] == 2 else ''}>⭐⭐ Fair (2)</option>
-              <option value='3' {'selected' if f['rating'] == 3 else ''}>⭐⭐⭐ Good (3)</option>
-              <option value='4' {'selected' if f['rating'] == 4 else ''}>⭐⭐⭐⭐ Very Good (4)</option>
-              <option value='5' {'selected' if f['rating'] == 5 else ''}>⭐⭐⭐⭐⭐ Excellent (5)</option>
-            </select>
-          </div>
-          
-          <div style='margin-bottom: 30px;'>
-            <label style='display: block; margin-bottom: 8px;'>Your Comments</label>
-            <textarea name='comment' rows='6' required>{f['comment']}</textarea>
-          </div>
-          
-          <button class='btn' type='submit'>💾 Save Changes</button>
-          <a class='btn' href='/guest_view_feedback/{feedback_id}'>❌ Cancel</a>
-        </form>
-      </div>
-    """ + end()
+    return render_template("feedback_edit.html", f=f)
 
 @app.route("/guest_delete_feedback/<int:feedback_id>", methods=["POST"])
 def guest_delete_feedback(feedback_id):
@@ -482,280 +542,23 @@ def guest_delete_feedback(feedback_id):
 
 # ==================== ADMIN PANEL ====================
 @app.route("/admin")
+@conditional("Patron", "Books", "Transactions")
 def admin():
     if session.get("role") != "Admin":
         return redirect("/login_admin")
 
     conn = get_db()
     
-    # Statistics
-    total_patrons = conn.execute("SELECT COUNT(*) as count FROM Patron").fetchone()["count"]
-    total_books = conn.execute("SELECT COUNT(*) as count FROM Books").fetchall()[0]["count"]
-    total_transactions = conn.execute("SELECT COUNT(*) as count FROM Transactions").fetchone()["count"]
-    
-    # Total fines calculation
-    total_fines_result = conn.execute("SELECT SUM(fine) as total FROM Transactions").fetchone()
-    total_fines = total_fines_result["total"] or 0
-    
-    # Borrowed books
-    borrowed_books = conn.execute("SELECT COUNT(*) as count FROM Books WHERE available=0").fetchone()["count"]
-    
-    patrons = conn.execute("SELECT * FROM Patron").fetchall()
-    books = conn.execute("SELECT * FROM Books").fetchall()
-    txns = conn.execute("SELECT * FROM Transactions").fetchall()
-
-    html = style + "<h2>🛡️ Admin panel</h2>"
-    html += "<p class='muted center'>Manage all system data</p>"
-    
-    # Statistics Section
-    html += """
-    <div class='section'>
-      <h3>📊 System Statistics</h3>
-      <div class='stats-grid'>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Total Patrons</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Total Books</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Borrowed Books</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Total Transactions</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>RM {:.2f}</div>
-          <div class='stat-label'>Total Fines</div>
-        </div>
-      </div>
-    </div>
-    """.format(total_patrons, total_books, borrowed_books, total_transactions, total_fines)
-    
-    html += "<div class='hr'></div>"
-
-    # Patrons with fine information
-    html += "<div class='section'><h3>👥 Patrons</h3><div class='grid'>"
-    for p in patrons:
-        # Calculate patron's total fine
-        patron_fine = get_patron_total_fine(p['patron_id'])
-        
-        html += f"""
-        <div class='card'>
-          <h3>{p['name'] or '-'} <span class='pill'>{p['role'] or '-'}</span></h3>
-          <p>Email: {p['email'] or '-'}</p>
-          <p>Active: {'✅' if p['is_active'] else '❌'}</p>
-          {f"<div class='fine-due'><strong>Total Fine Due:</strong> RM {patron_fine:.2f}</div>" if patron_fine > 0 else ""}
-          <div class='actions'>
-            <a class='btn btn-small' href='/admin/view/patron/{p['patron_id']}'>👁️ View</a>
-            <form class='inline' method='POST' action='/admin/update/patron/{p['patron_id']}'>
-              <input name='name' placeholder='New name'>
-              <input name='email' placeholder='New email'>
-              <input name='role' placeholder='New role'>
-              <select name='is_active'>
-                <option value=''>Select Status</option>
-                <option value='1'>Active</option>
-                <option value='0'>Inactive</option>
-              </select>
-              <button class='btn btn-small'>✏️ Update</button>
-            </form>
-            <form class='inline' method='POST' action='/admin/delete/patron/{p['patron_id']}'>
-              <button class='btn btn-small btn-danger'>🗑️ Delete</button>
-            </form>
-          </div>
-        </div>
-        """
-    html += "</div><div class='hr'></div>"
-    html += """
-      <div class='card'>
-        <h3>➕ Add patron</h3>
-        <form method='POST' action='/admin/create/patron'>
-          <input name='name' placeholder='Name' required>
-          <input name='email' placeholder='Email' required>
-          <input name='password' placeholder='Password' required>
-          <input name='role' placeholder='Role (Admin/Librarian/Student/Guest/Bank)' required>
-          <button class='btn'>➕ Add</button>
-        </form>
-      </div>
-    """
-
-    # Books - ADMIN HANYA BOLEH VIEW SAJA
-    html += "<div class='section'><h3>📚 Books (View Only)</h3><div class='grid'>"
-    for b in books:
-        status = "Available ✅" if (b['available'] or 0) == 1 else "Borrowed ❌"
-        type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-        html += f"""
-        <div class='card'>
-          <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
-          <p><strong>Author:</strong> {b['author'] or '-'}</p>
-          <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-          <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
-          <div class='actions'>
-            <a class='btn btn-small' href='/admin/view/book/{b['book_id']}'>👁️ View</a>
-          </div>
-        </div>
-        """
-    html += "</div></div><div class='hr'></div>"
-
-    # Create Transaction Form with AUTO-FINE CALCULATION
-    html += """
-    <div class='section'>
-      <div class='card'>
-        <h3>➕ Create Transaction (Auto Fine Calculation)</h3>
-        <form method='POST' action='/admin/create/txn'>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Patron ID *</label>
-            <input type='number' name='patron_id' id='patron_id' placeholder='Enter Patron ID' required 
-                   onchange='checkPatronFine(this.value)'>
-            <div id='patron_fine_info' style='margin-top:10px; display:none;'></div>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Book ID *</label>
-            <input name='book_id' placeholder='Book ID' required>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Borrow Date *</label>
-            <input type='date' name='borrow_date' id='borrow_date' value='""" + datetime.now().strftime("%Y-%m-%d") + """' required 
-                   onchange='calculateFine()'>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Return Date (Leave empty if not returned)</label>
-            <input type='date' name='return_date' id='return_date' onchange='calculateFine()'>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Item Type</label>
-            <select name='item_type'>
-              <option value='Physical'>Physical</option>
-              <option value='E-book'>E-book</option>
-              <option value='Audiobook'>Audiobook</option>
-            </select>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Fine Amount (Auto-calculated)</label>
-            <input type='number' name='fine' id='fine' placeholder='Auto-calculated' step='0.01' readonly style='background:rgba(255,255,255,0.05);'>
-          </div>
-          <div id='fine_calculation' class='auto-fine' style='display:none; margin-bottom:15px;'>
-            <strong>Fine Calculation:</strong>
-            <div id='calculation_details'></div>
-          </div>
-          <button class='btn' type='submit'>➕ Create Transaction</button>
-        </form>
-      </div>
-    </div>
-    
-    <script>
-    function checkPatronFine(patronId) {
-        if (!patronId) return;
-        
-        fetch('/check_patron_fine/' + patronId)
-            .then(response => response.json())
-            .then(data => {
-                const infoDiv = document.getElementById('patron_fine_info');
-                if (data.patron_exists) {
-                    if (data.total_fine > 0) {
-                        infoDiv.innerHTML = `<div class='fine-due'>
-                            <strong>⚠️ This patron has outstanding fines!</strong><br>
-                            Total Fine Due: RM ${data.total_fine.toFixed(2)}<br>
-                            Currently Borrowed: ${data.total_borrowed} books
-                        </div>`;
-                    } else {
-                        infoDiv.innerHTML = `<div style='background:rgba(0,255,0,0.1); padding:10px; border-radius:8px;'>
-                            ✅ This patron has no outstanding fines
-                        </div>`;
-                    }
-                    infoDiv.style.display = 'block';
-                } else {
-                    infoDiv.innerHTML = `<div style='background:rgba(255,255,0,0.1); padding:10px; border-radius:8px;'>
-                        ⚠️ Patron ID not found in system
-                    </div>`;
-                    infoDiv.style.display = 'block';
-                }
-            });
-    }
-    
-    function calculateFine() {
-        const borrowDate = document.getElementById('borrow_date').value;
-        const returnDate = document.getElementById('return_date').value;
-        
-        if (!borrowDate) return;
-        
-        fetch('/calculate_fine', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/x-www-form-urlencoded'},
-            body: 'borrow_date=' + encodeURIComponent(borrowDate) + 
-                  '&return_date=' + encodeURIComponent(returnDate || '')
-        })
-        .then(response => response.json())
-        .then(data => {
-            const fineInput = document.getElementById('fine');
-            const fineDiv = document.getElementById('fine_calculation');
-            const detailsDiv = document.getElementById('calculation_details');
-            
-            fineInput.value = data.fine;
-            
-            if (data.fine > 0) {
-                detailsDiv.innerHTML = `
-                    Borrow Date: ${borrowDate}<br>
-                    ${returnDate ? 'Return Date: ' + returnDate : 'Not Returned Yet'}<br>
-                    Days Overdue: ${data.days_overdue}<br>
-                    Fine Rate: RM 1.00 per day after 14 days<br>
-                    Total Fine: RM ${data.fine.toFixed(2)}
-                `;
-                fineDiv.style.display = 'block';
-            } else {
-                fineDiv.style.display = 'none';
-            }
-        });
-    }
-    </script>
-    """
-    
-    html += "<div class='hr'></div>"
+    # Statistics (maintained by triggers, see stats.py)
+    counters = stats.read_stats(conn)
     
-    # Transactions list
-    html += "<div class='section'><h3>🎓 Transactions</h3><div class='grid'>"
-    for t in txns:
-        fine = float(t['fine'] or 0)
-        borrow_date = t['borrow_date'] or "-"
-        return_date = t['return_date'] or "Not returned"
-        
-        html += f"""
-        <div class='card'>
-          <h3>Txn #{t['transaction_id']}</h3>
-          <p>Patron: {t['patron_id'] or '-'} • Book: {t['book_id'] or '-'}</p>
-          <p>Borrow: {borrow_date} • Return: {return_date}</p>
-          <p>Type: {t['item_type'] or '-'}</p>
-          <p>Fine: RM {fine:.2f}</p>
-          <div class='actions'>
-            <a class='btn btn-small' href='/admin/view/txn/{t['transaction_id']}'>👁️ View</a>
-            <form class='inline' method='POST' action='/admin/update/txn/{t['transaction_id']}'>
-              <input name='patron_id' placeholder='New patron ID'>
-              <input name='book_id' placeholder='New book ID'>
-              <input name='borrow_date' placeholder='New borrow date'>
-              <input name='return_date' placeholder='New return date'>
-              <input name='fine' placeholder='New fine'>
-              <select name='item_type'>
-                <option value=''>Select Item Type</option>
-                <option value='Physical'>Physical</option>
-                <option value='E-book'>E-book</option>
-                <option value='Audiobook'>Audiobook</option>
-              </select>
-              <button class='btn btn-small'>✏️ Update</button>
-            </form>
-            <form class='inline' method='POST' action='/admin/delete/txn/{t['transaction_id']}'>
-              <button class='btn btn-small btn-danger'>🗑️ Delete</button>
-            </form>
-          </div>
-        </div>
-        """
-    html += "</div></div>"
-    
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>"
-    return html + end()
+    size = pagination.page_size(request.args.get("size"))
+    patrons = pagination.StreamedPage(conn, "Patron", ("patron_id",), request.args.get("patrons_after"), size)
+    txns = pagination.StreamedPage(conn, "Transactions", ("transaction_id",), request.args.get("txns_after"), size)
+
+    return stream_page("admin.html", counters=counters, today=today(),
+                       patrons=patrons, patron_rows=with_patron_fines(patrons),
+                       books=books_page(conn, "books_after"), txns=txns)
 
 # ----- Admin API endpoints for auto-calculation -----
 @app.route("/check_patron_fine/<int:patron_id>")
@@ -769,10 +572,14 @@ def calculate_fine_api():
     """API endpoint to calculate fine"""
     borrow_date = request.form.get("borrow_date")
     return_date = request.form.get("return_date")
+    item_type = request.form.get("item_type") or None
+    role = request.form.get("role") or None
     
     try:
         if borrow_date:
-            fine = calculate_fine(borrow_date, return_date if return_date else None)
+            conn = get_db()
+            fine = fines.calculate_fine(borrow_date, return_date if return_date else None,
+                                        item_type, role, conn)
             
             # Calculate days overdue
             borrow_dt = datetime.strptime(borrow_date, "%Y-%m-%d")
@@ -782,7 +589,8 @@ def calculate_fine_api():
             else:
                 days_diff = (datetime.now() - borrow_dt).days
             
-            days_overdue = max(0, days_diff - 14)
+            policy = fines.policies(conn).lookup(item_type, role)
+            days_overdue = max(0, days_diff - policy.grace_days)
             
             return {
                 'fine': fine,
@@ -795,6 +603,16 @@ def calculate_fine_api():
     
     return {'fine': 0, 'days_overdue': 0}
 
+@app.route("/pool_stats")
+def pool_stats_api():
+    """API endpoint for connection pool counters"""
+    return db.pool.stats()
+
+@app.route("/cache_stats")
+def cache_stats_api():
+    """API endpoint for the book detail cache counters"""
+    return catalog.books.stats()
+
 # ----- Admin view detail routes -----
 @app.route("/admin/view/patron/<int:id>")
 def admin_view_patron(id):
@@ -804,7 +622,7 @@ def admin_view_patron(id):
     conn = get_db()
     p = conn.execute("SELECT * FROM Patron WHERE patron_id=?", (id,)).fetchone()
     if not p: 
-        return style + "<h3>❌ Patron not found</h3><div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>" + end()
+        return message("❌ Patron not found", "/admin")
     
     # Get patron's transactions and fines
     transactions = conn.execute("""
@@ -817,98 +635,19 @@ def admin_view_patron(id):
     
     total_fine = get_patron_total_fine(id)
     
-    html = style + f"""
-      <h2>👁️ Patron Details - {p['name']}</h2>
-      <div class='card'>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Patron ID:</strong><br>{p['patron_id']}
-          </div>
-          <div class='detail-item'>
-            <strong>Name:</strong><br>{p['name']}
-          </div>
-          <div class='detail-item'>
-            <strong>Email:</strong><br>{p['email']}
-          </div>
-          <div class='detail-item'>
-            <strong>Role:</strong><br>{p['role']}
-          </div>
-          <div class='detail-item'>
-            <strong>Active:</strong><br>{'✅ Yes' if p['is_active'] else '❌ No'}
-          </div>
-          <div class='detail-item fine-due' style='grid-column: 1 / -1;'>
-            <strong>Total Fine Due:</strong><br>RM {total_fine:.2f}
-          </div>
-        </div>
-      </div>
-    """
-    
-    # Show transactions
-    if transactions:
-        html += "<div class='section'><h3>📋 Transaction History</h3><div class='grid'>"
-        for t in transactions:
-            return_date = t['return_date'] or "Not returned"
-            fine = float(t['fine'] or 0)
-            html += f"""
-            <div class='card'>
-              <h3>{t['title'] or f'Book #{t['book_id']}'}</h3>
-              <p><strong>Transaction ID:</strong> {t['transaction_id']}</p>
-              <p><strong>Borrow Date:</strong> {t['borrow_date']}</p>
-              <p><strong>Return Date:</strong> {return_date}</p>
-              <p><strong>Fine:</strong> RM {fine:.2f}</p>
-            </div>
-            """
-        html += "</div></div>"
-    
-    html += "<div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>"
-    return html + end()
+    return render_template("admin_patron.html", p=p, transactions=transactions, total_fine=total_fine)
 
 @app.route("/admin/view/book/<int:id>")
+@conditional("Books")
 def admin_view_book(id):
     if session.get("role") != "Admin":
         return redirect("/login_admin")
     conn = get_db()
-    b = conn.execute("SELECT * FROM Books WHERE book_id=?", (id,)).fetchone()
-    if not b:
-        return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>" + end()
-    
-    status = "Available ✅" if (b['available'] or 0) == 1 else "Borrowed ❌"
-    type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-    
-    return style + f"""
-      <h2>👁️ Book detail</h2>
-      <div class='card'>
-        <h3>{b['title'] or '-'}</h3>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Author:</strong><br>{b['author'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>ISBN:</strong><br>{b['isbn'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Published Year:</strong><br>{b['published_year'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Genre:</strong><br>{b['genre'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Type:</strong><br><span class='book-type {type_class}'>{b['type'] or '-'}</span>
-          </div>
-          <div class='detail-item'>
-            <strong>Call Number:</strong><br>{b['call_number'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Shelf Location:</strong><br>{b['shelf_location'] or 'Not specified'}
-          </div>
-          <div class='detail-item'>
-            <strong>Status:</strong><br>{status}
-          </div>
-        </div>
-        <p><strong>Book ID:</strong> {b['book_id']}</p>
-      </div>
-      <div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>
-    """ + end()
+    entry = catalog.books.lookup(conn, id)
+    if not entry:
+        return message("❌ Book not found", "/admin")
+    
+    return render_template("admin_book.html", details=book_details(entry))
 
 @app.route("/admin/view/txn/<int:id>")
 def admin_view_txn(id):
@@ -918,11 +657,7 @@ def admin_view_txn(id):
     conn = get_db()
     t = conn.execute("SELECT * FROM Transactions WHERE transaction_id=?", (id,)).fetchone()
     if not t: 
-        return style + "<h3>❌ Transaction not found</h3><div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>" + end()
-    
-    borrow = t["borrow_date"] or "-"
-    ret = t["return_date"] or "Not returned"
-    fine = t["fine"] if t["fine"] is not None else 0
+        return message("❌ Transaction not found", "/admin")
     
     # Get patron and book info
     patron = conn.execute("SELECT name FROM Patron WHERE patron_id=?", (t['patron_id'],)).fetchone()
@@ -932,35 +667,8 @@ def admin_view_txn(id):
     book_title = book['title'] if book else f"Book #{t['book_id']}"
     book_author = book['author'] if book else "Unknown"
     
-    return style + f"""
-      <h2>👁️ Transaction Details</h2>
-      <div class='card'>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Transaction ID:</strong><br>{t['transaction_id']}
-          </div>
-          <div class='detail-item'>
-            <strong>Patron:</strong><br>{patron_name}
-          </div>
-          <div class='detail-item'>
-            <strong>Book:</strong><br>{book_title}<br><small>{book_author}</small>
-          </div>
-          <div class='detail-item'>
-            <strong>Borrow Date:</strong><br>{borrow}
-          </div>
-          <div class='detail-item'>
-            <strong>Return Date:</strong><br>{ret}
-          </div>
-          <div class='detail-item'>
-            <strong>Item Type:</strong><br>{t['item_type'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Fine Amount:</strong><br>RM {fine:.2f}
-          </div>
-        </div>
-      </div>
-      <div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>
-    """ + end()
+    return render_template("admin_txn.html", t=t, patron_name=patron_name,
+                           book_title=book_title, book_author=book_author)
 
 # ----- Admin CRUD handlers -----
 @app.route("/admin/create/patron", methods=["POST"])
@@ -1031,18 +739,28 @@ def admin_create_txn():
         patron_id = request.form.get("patron_id")
         patron = conn.execute("SELECT * FROM Patron WHERE patron_id=?", (patron_id,)).fetchone()
         if not patron:
-            return style + "<h3>❌ Patron not found</h3><div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>" + end()
+            return message("❌ Patron not found", "/admin")
         
         # Check if book exists
         book_id = request.form.get("book_id")
         book = conn.execute("SELECT * FROM Books WHERE book_id=?", (book_id,)).fetchone()
         if not book:
-            return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/admin'>⬅️ Back</a></div>" + end()
+            return message("❌ Book not found", "/admin")
         
-        conn.execute("INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type) VALUES (?,?,?,?,?,?)",
-                    (patron_id, book_id, request.form.get("borrow_date"),
-                     request.form.get("return_date") or None, float(fine), request.form.get("item_type", "Physical")))
-        conn.commit()
+        return_date = request.form.get("return_date") or None
+        if return_date:
+            # Back-dated record of a finished loan, no copy changes hands
+            loans.record_returned_loan(conn, patron['patron_id'], book['book_id'], request.form.get("borrow_date"),
+                                       return_date, float(fine), request.form.get("item_type", "Physical"))
+        else:
+            # An open loan claims a copy like any other borrow
+            result = loans.borrow_book(conn, patron['patron_id'], book['book_id'], request.form.get("borrow_date"))
+            if result['status'] == loans.ALREADY_BORROWED:
+                return message("❌ Patron already has this book on loan", "/admin",
+                               detail=f"Borrowed on {result['borrow_date']}")
+            if result['status'] == loans.UNAVAILABLE:
+                return message("❌ No copy of this book is available", "/admin")
+            catalog.books.invalidate(book['book_id'])
     except Exception as e:
         print(f"Error creating transaction: {e}")
     return redirect("/admin")
@@ -1058,6 +776,16 @@ def admin_update_txn(id):
         item_type = request.form.get("item_type")
         
         conn = get_db()
+        txn = conn.execute("SELECT * FROM Transactions WHERE transaction_id = ?", (id,)).fetchone()
+        if not txn:
+            return message("❌ Transaction not found", "/admin")
+        is_open = txn['return_date'] is None
+        
+        # An open loan holds a copy of its book: return it, don't move it
+        if is_open and ((book_id and book_id.strip() and int(book_id) != txn['book_id'])
+                        or (item_type and item_type.strip() and item_type != txn['item_type'])):
+            return message("❌ Return this loan before changing its book or item type", "/admin")
+        
         updates = []
         params = []
         
@@ -1070,9 +798,9 @@ def admin_update_txn(id):
         if borrow_date and borrow_date.strip():
             updates.append("borrow_date = ?")
             params.append(borrow_date)
-        if return_date is not None:
+        if return_date and return_date.strip() and not is_open:
             updates.append("return_date = ?")
-            params.append(return_date if return_date.strip() else None)
+            params.append(return_date)
         if fine is not None and fine.strip():
             updates.append("fine = ?")
             params.append(float(fine))
@@ -1085,6 +813,11 @@ def admin_update_txn(id):
             query = f"UPDATE Transactions SET {', '.join(updates)} WHERE transaction_id = ?"
             conn.execute(query, params)
             conn.commit()
+        if is_open and return_date and return_date.strip():
+            # Closing the loan passes its copy on, as a return at the desk does
+            final_fine = float(fine) if fine and fine.strip() else txn['fine']
+            loans.return_loans(conn, [(id, return_date.strip(), final_fine)])
+            catalog.books.invalidate(txn['book_id'])
     except Exception as e:
         print(f"Error updating transaction {id}: {e}")
     
@@ -1094,204 +827,58 @@ def admin_update_txn(id):
 def admin_delete_txn(id):
     try:
         conn = get_db()
-        conn.execute("DELETE FROM Transactions WHERE transaction_id=?", (id,))
-        conn.commit()
+        txn = conn.execute("SELECT book_id FROM Transactions WHERE transaction_id = ?", (id,)).fetchone()
+        # An open loan's copy goes back to the shelf (or the next hold) first
+        if txn and loans.delete_loan(conn, id, datetime.now().strftime("%Y-%m-%d")):
+            catalog.books.invalidate(txn['book_id'])
     except Exception as e:
         print(f"Error deleting transaction {id}: {e}")
     return redirect("/admin")
 
 # ==================== LIBRARIAN ====================
 @app.route("/librarian")
+@conditional("Books", "Transactions")
 def librarian():
     if session.get("role") != "Librarian": 
         return redirect("/login_librarian")
     
     conn = get_db()
     
-    # Statistics for Librarian
-    total_books = conn.execute("SELECT COUNT(*) as count FROM Books").fetchone()["count"]
-    borrowed_books = conn.execute("SELECT COUNT(*) as count FROM Books WHERE available=0").fetchone()["count"]
-    available_books = conn.execute("SELECT COUNT(*) as count FROM Books WHERE available=1").fetchone()["count"]
-    
-    # Total fines in the system
-    total_fines_result = conn.execute("SELECT SUM(fine) as total FROM Transactions").fetchone()
-    total_fines = total_fines_result["total"] or 0
-    
-    books = conn.execute("SELECT * FROM Books").fetchall()
-    
-    html = style + "<h2>📚 Librarian panel</h2>"
-    html += "<p class='muted center'>Full CRUD Books + Return Process</p>"
-    
-    # Statistics Section
-    html += """
-    <div class='section'>
-      <h3>📊 Library Statistics</h3>
-      <div class='stats-grid'>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Total Books</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Available</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Borrowed</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>RM {:.2f}</div>
-          <div class='stat-label'>Total Fines</div>
-        </div>
-      </div>
-    </div>
-    """.format(total_books, available_books, borrowed_books, total_fines)
-    
-    html += "<div class='hr'></div>"
-    
-    # Add Book Form
-    html += """
-    <div class='section'>
-      <div class='card'>
-        <h3>➕ Add New Book</h3>
-        <form method='POST' action='/librarian/create'>
-          <div style='display: grid; grid-template-columns: 1fr 1fr; gap: 15px;'>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Title *</label>
-              <input name='title' placeholder='Book Title' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Author *</label>
-              <input name='author' placeholder='Author Name' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>ISBN *</label>
-              <input name='isbn' placeholder='ISBN Number' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Published Year *</label>
-              <input name='published_year' placeholder='e.g., 2023' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Genre *</label>
-              <input name='genre' placeholder='e.g., Fiction, Science' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Type *</label>
-              <select name='type' required style='width: 100%;'>
-                <option value=''>Select Type</option>
-                <option value='Physical'>Physical</option>
-                <option value='E-book'>E-book</option>
-                <option value='Audiobook'>Audiobook</option>
-                <option value='Reference'>Reference</option>
-              </select>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Call Number *</label>
-              <input name='call_number' placeholder='e.g., FIC-SCI-001' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Shelf Location</label>
-              <input name='shelf_location' placeholder='e.g., Shelf A-5' style='width: 100%;'>
-            </div>
-          </div>
-          <div style='text-align: center; margin-top: 20px;'>
-            <button class='btn' type='submit'>➕ Add Book</button>
-          </div>
-        </form>
-      </div>
-    </div>
-    <div class='hr'></div>
-    """
+    # Statistics for Librarian (maintained by triggers, see stats.py)
+    counters = stats.read_stats(conn)
     
-    # Books List with Full CRUD
-    html += "<h3>📚 All Books</h3>"
-    html += "<div class='section'><div class='grid'>"
-    for b in books:
-        status = "Available ✅" if b['available'] else "Borrowed ❌"
-        type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-        
-        html += f"""
-        <div class='card'>
-          <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
-          <p><strong>Author:</strong> {b['author'] or '-'}</p>
-          <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-          <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
-          <div class='actions'>
-            <a class='btn btn-small' href='/librarian/view/{b['book_id']}'>👁️ View</a>
-            <a class='btn btn-small' href='/librarian/edit/{b['book_id']}'>✏️ Edit</a>
-            {'' if b['available'] else f"""
-            <form class='inline' method='POST' action='/librarian/return_book/{b['book_id']}'>
-              <button class='btn btn-small btn-warning' type='submit' onclick='return confirm("Process return for this book?")'>📖 Return Book</button>
-            </form>
-            """}
-            <form class='inline' method='POST' action='/librarian/delete/{b['book_id']}'>
-              <button class='btn btn-small btn-danger' type='submit' onclick='return confirm("Delete this book?")'>🗑️ Delete</button>
-            </form>
-          </div>
-        </div>
-        """
-    html += "</div></div>"
-    
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>"
-    return html + end()
+    return stream_page("librarian.html", counters=counters, books=books_page(conn), book_types=BOOK_TYPES)
 
 @app.route("/librarian/view/<int:id>")
+@conditional("Books", "Copies", "Transactions", "Patron")
 def librarian_view(id):
     if session.get("role") != "Librarian": 
         return redirect("/login_librarian")
     
     conn = get_db()
-    b = conn.execute("SELECT * FROM Books WHERE book_id=?", (id,)).fetchone()
+    entry = catalog.books.lookup(conn, id)
+    
+    if not entry: 
+        return message("❌ Book not found", "/librarian")
+    b = entry['row']
     
-    if not b: 
-        return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/librarian'>⬅️ Back</a></div>" + end()
-    
-    status = "Available ✅" if b['available'] else "Borrowed ❌"
-    type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-    
-    return style + f"""
-      <h2>👁️ Book Details</h2>
-      <div class='card'>
-        <h3>{b['title'] or '-'}</h3>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Author:</strong><br>{b['author'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>ISBN:</strong><br>{b['isbn'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Published Year:</strong><br>{b['published_year'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Genre:</strong><br>{b['genre'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Type:</strong><br><span class='book-type {type_class}'>{b['type'] or '-'}</span>
-          </div>
-          <div class='detail-item'>
-            <strong>Call Number:</strong><br>{b['call_number'] or '-'}
-          </div>
-          <div class='detail-item'>
-            <strong>Shelf Location:</strong><br>{b['shelf_location'] or 'Not specified'}
-          </div>
-          <div class='detail-item'>
-            <strong>Status:</strong><br>{status}
-          </div>
-        </div>
-        <p><strong>Book ID:</strong> {b['book_id']}</p>
-      </div>
-      <div class='actions' style='justify-content: center; margin-top: 20px;'>
-        <a class='btn' href='/librarian/edit/{id}'>✏️ Edit Book</a>
-        {'' if b['available'] else f"""
-        <form class='inline' method='POST' action='/librarian/return_book/{id}'>
-          <button class='btn btn-warning' type='submit'>📖 Return Book</button>
-        </form>
-        """}
-        <a class='btn' href='/librarian'>⬅️ Back to Librarian</a>
-      </div>
-    """ + end()
+    copies = loans.copy_counts(conn, id) if b['type'] == 'Physical' else None
+    
+    return render_template("librarian_book.html", b=b, open_loans=loans.open_loans(conn, id),
+                           details=book_details(entry, copies=copies))
+
+@app.route("/librarian/copies/<int:id>", methods=["POST"])
+def librarian_add_copies(id):
+    if session.get("role") != "Librarian": 
+        return redirect("/login_librarian")
+    
+    try:
+        count = max(1, min(int(request.form.get("count", 1)), 50))
+        loans.add_copies(get_db(), id, count)
+        catalog.books.invalidate(id)
+    except Exception as e:
+        print(f"Error adding copies: {e}")
+    return redirect(f"/librarian/view/{id}")
 
 @app.route("/librarian/edit/<int:id>", methods=["GET", "POST"])
 def librarian_edit(id):
@@ -1302,8 +889,9 @@ def librarian_edit(id):
     b = conn.execute("SELECT * FROM Books WHERE book_id=?", (id,)).fetchone()
     
     if not b:
-        return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/librarian'>⬅️ Back</a></div>" + end()
+        return message("❌ Book not found", "/librarian")
     
+    error = None
     if request.method == "POST":
         # Update book
         title = request.form.get("title", b['title'])
@@ -1314,86 +902,30 @@ def librarian_edit(id):
         book_type = request.form.get("type", b['type'])
         call_number = request.form.get("call_number", b['call_number'])
         shelf_location = request.form.get("shelf_location", b['shelf_location'])
-        available = request.form.get("available", b['available'])
         
+        # Availability follows the copies (borrow, return, add copies), never edited here
         try:
             conn.execute("""
                 UPDATE Books 
                 SET title=?, author=?, isbn=?, published_year=?, genre=?, type=?, 
-                    call_number=?, shelf_location=?, available=?
+                    call_number=?, shelf_location=?
                 WHERE book_id=?
             """, (title, author, isbn, published_year, genre, book_type, 
-                 call_number, shelf_location, int(available), id))
+                 call_number, shelf_location, id))
             conn.commit()
+            catalog.books.invalidate(id)
             return redirect(f"/librarian/view/{id}")
         except Exception as e:
-            error_msg = f"<p style='color:#ff6b6b;'>Error updating book: {str(e)}</p>"
+            error = str(e)
     
     # GET request - show edit form
-    return style + f"""
-      <h2>✏️ Edit Book</h2>
-      <div class='card' style='max-width: 800px; margin: 30px auto;'>
-        <form method='POST'>
-          <div style='display: grid; grid-template-columns: 1fr 1fr; gap: 20px;'>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Title *</label>
-              <input name='title' value='{b['title'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Author *</label>
-              <input name='author' value='{b['author'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>ISBN *</label>
-              <input name='isbn' value='{b['isbn'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Published Year *</label>
-              <input name='published_year' value='{b['published_year'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Genre *</label>
-              <input name='genre' value='{b['genre'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Type *</label>
-              <select name='type' required style='width: 100%;'>
-                <option value='Physical' {'selected' if b['type'] == 'Physical' else ''}>Physical</option>
-                <option value='E-book' {'selected' if b['type'] == 'E-book' else ''}>E-book</option>
-                <option value='Audiobook' {'selected' if b['type'] == 'Audiobook' else ''}>Audiobook</option>
-                <option value='Reference' {'selected' if b['type'] == 'Reference' else ''}>Reference</option>
-              </select>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Call Number *</label>
-              <input name='call_number' value='{b['call_number'] or ''}' required style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Shelf Location</label>
-              <input name='shelf_location' value='{b['shelf_location'] or ''}' style='width: 100%;'>
-            </div>
-            <div>
-              <label style='display: block; margin-bottom: 8px;'>Availability *</label>
-              <select name='available' required style='width: 100%;'>
-                <option value='1' {'selected' if b['available'] == 1 else ''}>Available</option>
-                <option value='0' {'selected' if b['available'] == 0 else ''}>Borrowed</option>
-              </select>
-            </div>
-          </div>
-          
-          <div style='margin-top: 30px; text-align: center;'>
-            <button class='btn' type='submit'>💾 Save Changes</button>
-            <a class='btn' href='/librarian/view/{id}'>❌ Cancel</a>
-          </div>
-        </form>
-      </div>
-    """ + end()
+    return render_template("librarian_edit.html", b=b, book_types=BOOK_TYPES, error=error)
 
 @app.route("/librarian/create", methods=["POST"])
 def librarian_create():
     try:
         conn = get_db()
-        conn.execute("""
+        book_id = conn.execute("""
             INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location, available) 
             VALUES (?,?,?,?,?,?,?,?,1)
         """, (
@@ -1405,8 +937,9 @@ def librarian_create():
             request.form["type"],
             request.form["call_number"], 
             request.form.get("shelf_location", "")
-        ))
+        )).lastrowid
         conn.commit()
+        catalog.books.invalidate(book_id)
     except Exception as e:
         print(f"Error creating book: {e}")
     return redirect("/librarian")
@@ -1418,36 +951,29 @@ def librarian_return_book(book_id):
     
     conn = get_db()
     today = datetime.now().strftime("%Y-%m-%d")
+    back = f"/librarian/view/{book_id}"
+    
+    # The copy handed back (scanned barcode) or the loan picked from the list
+    transaction_id = request.form.get("transaction_id", "").strip()
+    barcode = request.form.get("barcode", "").strip()
+    if not transaction_id.isdigit() and not barcode:
+        return message("❌ Scan the copy's barcode or pick the loan to return", back)
     
     try:
-        # Get the active transaction first to calculate fine
-        transaction = conn.execute("""
-            SELECT * FROM Transactions 
-            WHERE book_id = ? AND return_date IS NULL
-            ORDER BY transaction_id DESC LIMIT 1
-        """, (book_id,)).fetchone()
+        transaction = loans.find_open_loan(conn, int(transaction_id) if transaction_id.isdigit() else None,
+                                           barcode or None)
+        if not transaction or transaction['book_id'] != book_id:
+            return message("❌ No open loan of this book for that copy", back)
         
-        if transaction:
-            # Calculate final fine
-            final_fine = calculate_fine(transaction['borrow_date'], today)
-            
-            # Update transaction with return date and final fine
-            conn.execute("""
-                UPDATE Transactions 
-                SET return_date = ?, fine = ?
-                WHERE transaction_id = ?
-            """, (today, final_fine, transaction['transaction_id']))
-            
-            # Update book availability (hanya untuk physical books)
-            book = conn.execute("SELECT type FROM Books WHERE book_id=?", (book_id,)).fetchone()
-            if book and book['type'] == 'Physical':
-                conn.execute("UPDATE Books SET available=1 WHERE book_id=?", (book_id,))
-            
-            conn.commit()
+        # Final fine for this borrower, then close the loan and pass the copy on
+        final_fine = fines.calculate_fine(transaction['borrow_date'], today,
+                                          transaction['item_type'], transaction['role'], conn)
+        loans.return_loans(conn, [(transaction['transaction_id'], today, final_fine)])
+        catalog.books.invalidate(book_id)
     except Exception as e:
         print(f"Error returning book: {e}")
     
-    return redirect("/librarian")
+    return redirect(back)
 
 @app.route("/librarian/delete/<int:id>", methods=["POST"])
 def librarian_delete(id):
@@ -1455,6 +981,7 @@ def librarian_delete(id):
         conn = get_db()
         conn.execute("DELETE FROM Books WHERE book_id=?", (id,))
         conn.commit()
+        catalog.books.invalidate(id)
     except Exception as e:
         print(f"Error deleting book {id}: {e}")
     return redirect("/librarian")
@@ -1492,7 +1019,8 @@ def student():
     total_fine = get_patron_total_fine(patron_id)
     
     # Get books that are actually available (not borrowed by this student)
-    borrowed_book_ids = [t['book_id'] for t in txns]
+    borrowed = {t['book_id']: t for t in txns}
+    borrowed_book_ids = list(borrowed)
     available_books = []
     
     if borrowed_book_ids:
@@ -1505,156 +1033,15 @@ def student():
     else:
         available_books = conn.execute("SELECT * FROM Books WHERE available=1 ORDER BY title").fetchall()
 
-    html = style + f"<h2>🎓 Student panel — {name}</h2>"
-    
-    # Student Statistics
-    current_loans = len(txns)
-    returned_loans = len(returned_txns)
-    
-    html += f"""
-    <div class='section'>
-      <div class='stats-grid'>
-        <div class='stat-box'>
-          <div class='stat-value'>{current_loans}</div>
-          <div class='stat-label'>Current Loans</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{returned_loans}</div>
-          <div class='stat-label'>Returned Books</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>RM {total_fine:.2f}</div>
-          <div class='stat-label'>Total Fine Due</div>
-        </div>
-      </div>
-    </div>
-    """
-    
-    html += "<div class='hr'></div>"
-
-    # Current Loans with Return Button
-    html += "<div class='section'><h3>📚 Current Loans</h3>"
-    if txns:
-        html += "<div class='grid'>"
-        for t in txns:
-            borrow = t["borrow_date"] or "-"
-            fine = t["fine"] if t["fine"] is not None else 0
-            
-            # Calculate days since borrowed
-            days_borrowed = 0
-            try:
-                borrow_dt = datetime.strptime(borrow, "%Y-%m-%d")
-                days_borrowed = (datetime.now() - borrow_dt).days
-            except:
-                pass
-            
-            # Calculate overdue days
-            overdue_days = max(0, days_borrowed - 14)
-            
-            overdue_html = ""
-            if overdue_days > 0:
-                overdue_html = f"<div class='fine-due'><strong>⚠️ Overdue:</strong> {overdue_days} days</div>"
-            
-            html += f"""
-            <div class='card'>
-              <h3>{t['title'] or '-'}</h3>
-              <p><strong>Author:</strong> {t['author'] or '-'}</p>
-              <p><strong>Type:</strong> {t['type'] or '-'}</p>
-              <p><strong>Borrowed:</strong> {borrow} ({days_borrowed} days ago)</p>
-              <p><strong>Fine:</strong> RM {float(fine):.2f}</p>
-              {overdue_html}
-              <div class='actions'>
-                <form class='inline' method='POST' action='/student/return/{t['transaction_id']}'>
-                  <input type='hidden' name='book_id' value='{t['book_id']}'>
-                  <button class='btn btn-warning' type='submit' onclick='return confirm("Return this book?")'>📖 Return Book</button>
-                </form>
-              </div>
-            </div>
-            """
-        html += "</div>"
-    else:
-        html += "<p class='muted center'>You have no current loans.</p>"
-    html += "</div>"
-    
-    # TAMBAH: View My Borrow Books Button
-    html += """
-    <div class='section center'>
-      <a class='btn' href='/student/my_borrow_books'>📚 View My Borrow Books</a>
-    </div>
-    <div class='hr'></div>
-    """
-
-    # Returned Loans History
-    if returned_txns:
-        html += "<div class='section'><h3>📋 Returned Loans History</h3>"
-        html += "<div class='grid'>"
-        for t in returned_txns:
-            borrow = t["borrow_date"] or "-"
-            ret = t["return_date"] or "-"
-            fine = t["fine"] if t["fine"] is not None else 0
-            html += f"""
-            <div class='card'>
-              <h3>{t['title'] or '-'}</h3>
-              <p><strong>Author:</strong> {t['author'] or '-'}</p>
-              <p><strong>Borrowed:</strong> {borrow}</p>
-              <p><strong>Returned:</strong> {ret}</p>
-              <p><strong>Fine Paid:</strong> RM {float(fine):.2f}</p>
-            </div>
-            """
-        html += "</div></div>"
-        html += "<div class='hr'></div>"
-
-    # Available books for borrowing (excluding already borrowed)
-    html += "<div class='section'><h3>📚 Available Books to Borrow</h3>"
-    if available_books:
-        html += "<div class='grid'>"
-        for b in available_books:
-            type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-            
-            # Check if this book is already borrowed by this student
-            already_borrowed = b['book_id'] in borrowed_book_ids
-            
-            if already_borrowed:
-                # Find the transaction for this book
-                current_txn = next((t for t in txns if t['book_id'] == b['book_id']), None)
-                if current_txn:
-                    html += f"""
-                    <div class='card'>
-                      <h3>{b['title'] or '-'} <span class='pill'>Already Borrowed</span></h3>
-                      <p><strong>Author:</strong> {b['author'] or '-'}</p>
-                      <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-                      <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
-                      <p><strong>Borrowed on:</strong> {current_txn['borrow_date']}</p>
-                      <div class='actions'>
-                        <form class='inline' method='POST' action='/student/return/{current_txn['transaction_id']}'>
-                          <button class='btn btn-warning' type='submit' onclick='return confirm("Return this book?")'>📖 Return First</button>
-                        </form>
-                      </div>
-                    </div>
-                    """
-            else:
-                # Book is available for borrowing
-                html += f"""
-                <div class='card'>
-                  <h3>{b['title'] or '-'}</h3>
-                  <p><strong>Author:</strong> {b['author'] or '-'}</p>
-                  <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-                  <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
-                  <form method='POST' action='/student/borrow' class='actions'>
-                    <input type='hidden' name='book_id' value='{b['book_id']}'>
-                    <label style='display:block; margin-bottom:5px;'>Borrow Date:</label>
-                    <input type='date' name='borrow_date' value='""" + datetime.now().strftime("%Y-%m-%d") + """' required>
-                    <button class='btn' type='submit'>📖 Borrow This Book</button>
-                  </form>
-                </div>
-                """
-        html += "</div>"
-    else:
-        html += "<p class='muted center'>No available books at the moment.</p>"
-    html += "</div>"
+    loan_days = fines.calculate_fines([t["borrow_date"] for t in txns],
+                                      item_types=[t["item_type"] for t in txns],
+                                      roles=["Student"] * len(txns), conn=conn)
     
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>"
-    return html + end()
+    return render_template("student.html", name=name, today=today(),
+                           txns=txns, returned_txns=returned_txns, total_fine=total_fine,
+                           my_holds=holds.patron_holds(conn, patron_id),
+                           current=zip(txns, loan_days.days, loan_days.overdue_days),
+                           available_books=available_books, borrowed=borrowed)
 
 # TAMBAH: View My Borrow Books Page
 @app.route("/student/my_borrow_books")
@@ -1678,98 +1065,18 @@ def student_my_borrow_books():
     # Statistics
     total_loans = len(all_loans)
     current_loans = len([t for t in all_loans if t['return_date'] is None])
-    returned_loans = total_loans - current_loans
     total_fine_paid = sum(float(t['fine'] or 0) for t in all_loans if t['return_date'] is not None)
     current_fine = sum(float(t['fine'] or 0) for t in all_loans if t['return_date'] is None)
     
-    html = style + f"""
-      <h2>📚 My Borrow Books — {name}</h2>
-      <p class='muted center'>Complete borrowing history</p>
-      
-      <div class='section'>
-        <div class='stats-grid'>
-          <div class='stat-box'>
-            <div class='stat-value'>{total_loans}</div>
-            <div class='stat-label'>Total Books Borrowed</div>
-          </div>
-          <div class='stat-box'>
-            <div class='stat-value'>{current_loans}</div>
-            <div class='stat-label'>Currently Borrowed</div>
-          </div>
-          <div class='stat-box'>
-            <div class='stat-value'>{returned_loans}</div>
-            <div class='stat-label'>Returned Books</div>
-          </div>
-          <div class='stat-box'>
-            <div class='stat-value'>RM {current_fine:.2f}</div>
-            <div class='stat-label'>Current Fine Due</div>
-          </div>
-          <div class='stat-box'>
-            <div class='stat-value'>RM {total_fine_paid:.2f}</div>
-            <div class='stat-label'>Total Fine Paid</div>
-          </div>
-        </div>
-      </div>
-    """
-    
-    if all_loans:
-        html += "<div class='section'><h3>📋 All My Borrowed Books</h3><div class='grid'>"
-        for t in all_loans:
-            borrow = t["borrow_date"] or "-"
-            ret = t["return_date"] or "Not returned"
-            fine = t["fine"] if t["fine"] is not None else 0
-            status = "Returned ✅" if t['return_date'] else "Borrowed 📖"
-            type_class = f"type-{t['type'].lower().replace('-', '').replace(' ', '')}"
-            
-            # Calculate days borrowed
-            days_info = ""
-            try:
-                borrow_dt = datetime.strptime(borrow, "%Y-%m-%d")
-                if t['return_date']:
-                    return_dt = datetime.strptime(t['return_date'], "%Y-%m-%d")
-                    days_borrowed = (return_dt - borrow_dt).days
-                    days_info = f"<p><strong>Duration:</strong> {days_borrowed} days</p>"
-                else:
-                    days_borrowed = (datetime.now() - borrow_dt).days
-                    days_info = f"<p><strong>Days since borrowed:</strong> {days_borrowed} days</p>"
-                    
-                    # Overdue warning
-                    if days_borrowed > 14:
-                        overdue_days = days_borrowed - 14
-                        days_info += f"<div class='fine-due'><strong>⚠️ Overdue:</strong> {overdue_days} days</div>"
-            except:
-                pass
-            
-            html += f"""
-            <div class='card'>
-              <h3>{t['title'] or '-'} <span class='pill'>{status}</span></h3>
-              <p><strong>Author:</strong> {t['author'] or '-'}</p>
-              <p><strong>Genre:</strong> {t['genre'] or '-'} <span class='book-type {type_class}'>{t['type'] or '-'}</span></p>
-              <p><strong>Call #:</strong> {t['call_number'] or '-'}</p>
-              <p><strong>Borrow Date:</strong> {borrow}</p>
-              <p><strong>Return Date:</strong> {ret}</p>
-              <p><strong>Fine:</strong> RM {float(fine):.2f}</p>
-              {days_info}
-              {'' if t['return_date'] else f"""
-              <div class='actions'>
-                <form class='inline' method='POST' action='/student/return/{t['transaction_id']}'>
-                  <button class='btn btn-warning' type='submit' onclick='return confirm("Return this book?")'>📖 Return Now</button>
-                </form>
-              </div>
-              """}
-            </div>
-            """
-        html += "</div></div>"
-    else:
-        html += "<p class='muted center'>You haven't borrowed any books yet.</p>"
-    
-    html += """
-    <div class='center'>
-      <a class='btn' href='/student'>⬅️ Back to Student Panel</a>
-    </div>
-    """
+    loan_days = fines.calculate_fines([t["borrow_date"] for t in all_loans],
+                                      [t["return_date"] for t in all_loans],
+                                      item_types=[t["item_type"] for t in all_loans],
+                                      roles=["Student"] * len(all_loans), conn=conn)
     
-    return html + end()
+    return render_template("student_books.html", name=name,
+                           total_loans=total_loans, current_loans=current_loans,
+                           total_fine_paid=total_fine_paid, current_fine=current_fine,
+                           loans=list(zip(all_loans, loan_days.days, loan_days.overdue_days)))
 
 @app.route("/student/borrow", methods=["POST"])
 def student_borrow():
@@ -1782,49 +1089,53 @@ def student_borrow():
     
     conn = get_db()
     
-    # Check if student already borrowed this book
-    existing_loan = conn.execute("""
-        SELECT * FROM Transactions 
-        WHERE patron_id=? AND book_id=? AND return_date IS NULL
-    """, (patron_id, book_id)).fetchone()
-    
-    if existing_loan:
-        return style + f"""
-            <h3>❌ You already borrowed this book!</h3>
-            <p>You borrowed this book on {existing_loan['borrow_date']}</p>
-            <div class='center'>
-                <a class='btn' href='/student'>⬅️ Back to Student Panel</a>
-            </div>
-        """ + end()
-    
-    # Check if book is available (for physical books)
-    book = conn.execute("SELECT available, type FROM Books WHERE book_id=?", (book_id,)).fetchone()
-    if not book:
-        return style + "<h3>❌ Book not found</h3><div class='center'><a class='btn' href='/student'>⬅️ Back</a></div>" + end()
-    
     try:
-        item_type = book['type'] if book else 'Physical'
-        
-        conn.execute("""
-            INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type) 
-            VALUES (?,?,?,?,?,?)
-        """, (patron_id, book_id, borrow_date, None, 0, item_type))
-        
-        # Only update availability for physical books
-        if item_type == 'Physical':
-            conn.execute("UPDATE Books SET available=0 WHERE book_id=?", (book_id,))
-        
-        conn.commit()
+        result = loans.borrow_book(conn, patron_id, book_id, borrow_date)
     except Exception as e:
         print(f"Error borrowing book: {e}")
-        return style + f"""
-            <h3>❌ Error borrowing book</h3>
-            <p>{str(e)}</p>
-            <div class='center'>
-                <a class='btn' href='/student'>⬅️ Back to Student Panel</a>
-            </div>
-        """ + end()
+        return message("❌ Error borrowing book", "/student", "⬅️ Back to Student Panel", detail=str(e))
+    
+    if result['status'] == loans.ALREADY_BORROWED:
+        return message("❌ You already borrowed this book!", "/student", "⬅️ Back to Student Panel",
+                       detail=f"You borrowed this book on {result['borrow_date']}")
+    if result['status'] == loans.NOT_FOUND:
+        return message("❌ Book not found", "/student")
+    if result['status'] == loans.UNAVAILABLE:
+        return message("❌ This book is already borrowed", "/student")
+    
+    catalog.books.invalidate(int(book_id))
+    return redirect("/student")
+
+@app.route("/student/hold/<int:book_id>", methods=["POST"])
+def student_hold(book_id):
+    if session.get("role") != "Student": 
+        return redirect("/login_student")
     
+    try:
+        result = holds.place_hold(get_db(), session.get("patron_id"), book_id)
+    except Exception as e:
+        print(f"Error placing hold: {e}")
+        result = {'status': None}
+    
+    messages = {
+        holds.PLACED: "✅ Hold placed — you will see it under My Holds",
+        holds.ALREADY_HELD: "⚠️ You already have a hold on this book",
+        holds.AVAILABLE: "⚠️ A copy is available — borrow it instead",
+        holds.ALREADY_BORROWED: "⚠️ You already borrowed this book",
+        holds.NOT_HOLDABLE: "⚠️ Only physical books can be held",
+        holds.NOT_FOUND: "❌ Book not found",
+    }
+    return message(messages.get(result['status'], "❌ Error placing hold"), "/student", "⬅️ Back to Student Panel")
+
+@app.route("/student/hold/<int:hold_id>/cancel", methods=["POST"])
+def student_cancel_hold(hold_id):
+    if session.get("role") != "Student": 
+        return redirect("/login_student")
+    
+    try:
+        holds.cancel_hold(get_db(), hold_id, session.get("patron_id"))
+    except Exception as e:
+        print(f"Error cancelling hold: {e}")
     return redirect("/student")
 
 @app.route("/student/return/<int:transaction_id>", methods=["POST"])
@@ -1844,24 +1155,12 @@ def student_return(transaction_id):
         """, (transaction_id, patron_id)).fetchone()
         
         if txn:
-            book_id = txn['book_id']
-            item_type = txn['item_type']
-            
             # Calculate final fine
-            final_fine = calculate_fine(txn['borrow_date'], today)
+            final_fine = fines.calculate_fine(txn['borrow_date'], today, txn['item_type'], "Student", conn)
             
-            # Update transaction with return date and final fine
-            conn.execute("""
-                UPDATE Transactions 
-                SET return_date = ?, fine = ?
-                WHERE transaction_id = ? AND patron_id = ?
-            """, (today, final_fine, transaction_id, patron_id))
-            
-            # Update book availability (hanya untuk physical books)
-            if item_type == 'Physical':
-                conn.execute("UPDATE Books SET available=1 WHERE book_id=?", (book_id,))
-            
-            conn.commit()
+            # Close the loan and put its copy back on the shelf
+            loans.return_loan(conn, transaction_id, today, final_fine)
+            catalog.books.invalidate(txn['book_id'])
     except Exception as e:
         print(f"Error returning book: {e}")
     
@@ -1869,198 +1168,37 @@ def student_return(transaction_id):
 
 # ==================== BANK ====================
 @app.route("/bank")
+@conditional("Payments", "Patron", "Transactions")
 def bank():
     if session.get("role") != "Bank": 
         return redirect("/login_bank")
     
     conn = get_db()
     
-    # Get all payments
-    payments = conn.execute("SELECT * FROM Payments ORDER BY payment_date DESC").fetchall()
-    
-    # Bank Statistics
-    total_payments = conn.execute("SELECT COUNT(*) as count FROM Payments").fetchone()["count"]
-    total_received = conn.execute("SELECT SUM(amount) as total FROM Payments").fetchone()["total"] or 0
-    avg_payment = conn.execute("SELECT AVG(amount) as avg FROM Payments").fetchone()["avg"] or 0
-    
-    # Get patrons with outstanding fines
-    patrons_with_fines = conn.execute("""
-        SELECT p.patron_id, p.name, p.role, SUM(t.fine) as total_fine
-        FROM Patron p
-        JOIN Transactions t ON p.patron_id = t.patron_id
-        WHERE t.return_date IS NULL AND t.fine > 0
-        GROUP BY p.patron_id
-        ORDER BY total_fine DESC
-    """).fetchall()
-
-    html = style + "<h2>🏦 Bank panel</h2>"
-    html += "<p class='muted center'>Manage payments and view outstanding fines</p>"
-    
-    # Statistics Section
-    html += """
-    <div class='section'>
-      <h3>💰 Bank Statistics</h3>
-      <div class='stats-grid'>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Total Payments</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>RM {:.2f}</div>
-          <div class='stat-label'>Total Received</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>RM {:.2f}</div>
-          <div class='stat-label'>Average Payment</div>
-        </div>
-        <div class='stat-box'>
-          <div class='stat-value'>{}</div>
-          <div class='stat-label'>Patrons with Fines</div>
-        </div>
-      </div>
-    </div>
-    """.format(total_payments, total_received, avg_payment, len(patrons_with_fines))
-    
-    html += "<div class='hr'></div>"
-    
-    # Patrons with Outstanding Fines
-    if patrons_with_fines:
-        html += "<div class='section'><h3>📋 Patrons with Outstanding Fines</h3><div class='grid'>"
-        for p in patrons_with_fines:
-            html += f"""
-            <div class='card'>
-              <h3>{p['name']} <span class='pill'>{p['role']}</span></h3>
-              <p><strong>Patron ID:</strong> {p['patron_id']}</p>
-              <div class='fine-due'>
-                <strong>Outstanding Fine:</strong> RM {float(p['total_fine']):.2f}
-              </div>
-            </div>
-            """
-        html += "</div></div><div class='hr'></div>"
-    
-    # Payment Records
-    html += "<div class='section'><h3>💳 Payment Records</h3><div class='grid'>"
-    for p in payments:
-        amount = p["amount"] or 0
-        date = p["payment_date"] or "-"
-        purpose = p["purpose"] or "-"
-        
-        # Get patron name
-        patron = conn.execute("SELECT name FROM Patron WHERE patron_id=?", (p['patron_id'],)).fetchone()
-        patron_name = patron['name'] if patron else f"Patron #{p['patron_id']}"
-        
-        html += f"""
-        <div class='card'>
-          <h3>Payment #{p['payment_id']}</h3>
-          <p><strong>Patron:</strong> {patron_name} (ID: {p['patron_id']})</p>
-          <p><strong>Amount:</strong> RM {float(amount):.2f}</p>
-          <p><strong>Date:</strong> {date}</p>
-          <p><strong>Purpose:</strong> {purpose}</p>
-          <div class='actions'>
-            <a class='btn btn-small' href='/bank/view/{p['payment_id']}'>👁️ View</a>
-            <form class='inline' method='POST' action='/bank/update/{p['payment_id']}'>
-              <input name='patron_id' placeholder='New patron ID'>
-              <input name='amount' placeholder='New amount'>
-              <input name='payment_date' placeholder='New date'>
-              <input name='purpose' placeholder='New purpose'>
-              <button class='btn btn-small'>✏️ Update</button>
-            </form>
-            <form class='inline' method='POST' action='/bank/delete/{p['payment_id']}'>
-              <button class='btn btn-small btn-danger'>🗑️ Delete</button>
-            </form>
-          </div>
-        </div>
-        """
-    html += "</div></div><div class='hr'></div>"
-    
-    # Quick Payment Form with AUTO-FINE CALCULATION
-    html += """
-    <div class='section'>
-      <div class='card'>
-        <h3>💳 Quick Payment Entry (Auto Fine Calculation)</h3>
-        <form method='POST' action='/bank/create'>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Patron ID *</label>
-            <input type='number' name='patron_id' id='patron_id' placeholder='Enter Patron ID' required 
-                   onchange='checkPatronFine(this.value)'>
-            <div id='patron_fine_info' style='margin-top:10px; display:none;'></div>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Amount (RM) *</label>
-            <input type='number' name='amount' id='amount' placeholder='Auto-filled from fine' step='0.01' required 
-                   style='background:rgba(255,255,255,0.05);'>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Payment Date *</label>
-            <input type='date' name='payment_date' value='""" + datetime.now().strftime("%Y-%m-%d") + """' required>
-          </div>
-          <div style='margin-bottom:15px;'>
-            <label style='display:block; margin-bottom:5px;'>Purpose *</label>
-            <input name='purpose' id='purpose' value='Fine Payment' required>
-          </div>
-          <button class='btn' type='submit'>💾 Record Payment</button>
-        </form>
-      </div>
-    </div>
-    
-    <script>
-    function checkPatronFine(patronId) {
-        if (!patronId) return;
-        
-        fetch('/check_patron_fine/' + patronId)
-            .then(response => response.json())
-            .then(data => {
-                const infoDiv = document.getElementById('patron_fine_info');
-                const amountInput = document.getElementById('amount');
-                const purposeInput = document.getElementById('purpose');
-                
-                if (data.patron_exists) {
-                    if (data.total_fine > 0) {
-                        infoDiv.innerHTML = `<div class='fine-due'>
-                            <strong>⚠️ This patron has outstanding fines!</strong><br>
-                            Total Fine Due: RM ${data.total_fine.toFixed(2)}<br>
-                            Currently Borrowed: ${data.total_borrowed} books
-                        </div>`;
-                        amountInput.value = data.total_fine.toFixed(2);
-                        purposeInput.value = 'Fine Payment';
-                    } else {
-                        infoDiv.innerHTML = `<div style='background:rgba(0,255,0,0.1); padding:10px; border-radius:8px;'>
-                            ✅ This patron has no outstanding fines<br>
-                            Enter payment amount manually
-                        </div>`;
-                        amountInput.value = '';
-                        purposeInput.value = 'Other Payment';
-                    }
-                    infoDiv.style.display = 'block';
-                } else {
-                    infoDiv.innerHTML = `<div style='background:rgba(255,255,0,0.1); padding:10px; border-radius:8px;'>
-                        ⚠️ Patron ID not found in system<br>
-                        Enter payment manually
-                    </div>`;
-                    infoDiv.style.display = 'block';
-                    amountInput.value = '';
-                    purposeInput.value = 'Payment';
-                }
-            });
-    }
-    </script>
-    """
-    
-    # Search Payment by Patron ID
-    html += """
-    <div class='section'>
-      <div class='card'>
-        <h3>🔍 Search Payments by Patron</h3>
-        <form method='POST' action='/bank/search_payments' style='text-align: center;'>
-          <input name='patron_id' placeholder='Enter Patron ID' required>
-          <button class='btn' type='submit'>🔍 Search</button>
-        </form>
-      </div>
-    </div>
-    """
-    
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>"
-    return html + end()
+    # All payments, read while the page is streamed
+    payments = db.iter_rows(conn, "SELECT p.*, pt.name AS patron_name FROM Payments p LEFT JOIN Patron pt ON pt.patron_id = p.patron_id ORDER BY p.payment_date DESC")
+    
+    # Bank Statistics (maintained by triggers, see stats.py)
+    counters = stats.read_stats(conn)
+    total_payments = counters['payments']
+    total_received = counters['payments.total']
+    avg_payment = total_received / total_payments if total_payments else 0
+    
+    # Patrons with outstanding fines: counted for the statistics, listed while streaming
+    fined_patrons = conn.execute("""
+        SELECT COUNT(DISTINCT patron_id) FROM Transactions WHERE return_date IS NULL AND fine > 0
+    """).fetchone()[0]
+    patrons_with_fines = db.iter_rows(conn, """
+        SELECT p.patron_id, p.name, p.role, f.total_fine
+        FROM (SELECT patron_id, SUM(fine) AS total_fine FROM Transactions
+              WHERE return_date IS NULL AND fine > 0 GROUP BY patron_id) f
+        JOIN Patron p ON p.patron_id = f.patron_id
+        ORDER BY f.total_fine DESC
+    """)
+
+    return stream_page("bank.html", payments=payments, patrons_with_fines=patrons_with_fines,
+                       fined_patrons=fined_patrons, total_payments=total_payments,
+                       total_received=total_received, avg_payment=avg_payment, today=today())
 
 @app.route("/bank/search_payments", methods=["POST"])
 def bank_search_payments():
@@ -2074,12 +1212,7 @@ def bank_search_payments():
     patron = conn.execute("SELECT * FROM Patron WHERE patron_id=?", (patron_id,)).fetchone()
     
     if not patron:
-        return style + """
-            <h3>❌ Patron not found</h3>
-            <div class='center'>
-                <a class='btn' href='/bank'>⬅️ Back to Bank</a>
-            </div>
-        """ + end()
+        return message("❌ Patron not found", "/bank", "⬅️ Back to Bank")
     
     # Get payments for this patron
     payments = conn.execute("SELECT * FROM Payments WHERE patron_id=? ORDER BY payment_date DESC", (patron_id,)).fetchall()
@@ -2091,54 +1224,8 @@ def bank_search_payments():
     # Calculate outstanding fines
     outstanding_fines = get_patron_total_fine(patron_id)
     
-    html = style + f"""
-        <h2>💰 Payment History for {patron['name']}</h2>
-        <div class='card' style='max-width: 800px; margin: 20px auto;'>
-            <div class='book-details'>
-                <div class='detail-item'>
-                    <strong>Patron ID:</strong><br>{patron['patron_id']}
-                </div>
-                <div class='detail-item'>
-                    <strong>Name:</strong><br>{patron['name']}
-                </div>
-                <div class='detail-item'>
-                    <strong>Role:</strong><br>{patron['role']}
-                </div>
-                <div class='detail-item'>
-                    <strong>Email:</strong><br>{patron['email']}
-                </div>
-                <div class='detail-item fine-due'>
-                    <strong>Outstanding Fines:</strong><br>RM {outstanding_fines:.2f}
-                </div>
-                <div class='detail-item' style='background: rgba(0,255,0,0.1);'>
-                    <strong>Total Paid:</strong><br>RM {total_paid:.2f}
-                </div>
-            </div>
-        </div>
-    """
-    
-    if payments:
-        html += "<div class='section'><h3>📋 Payment Records</h3><div class='grid'>"
-        for p in payments:
-            html += f"""
-            <div class='card'>
-                <h3>Payment #{p['payment_id']}</h3>
-                <p><strong>Amount:</strong> RM {float(p['amount']):.2f}</p>
-                <p><strong>Date:</strong> {p['payment_date']}</p>
-                <p><strong>Purpose:</strong> {p['purpose']}</p>
-            </div>
-            """
-        html += "</div></div>"
-    else:
-        html += "<p class='muted center'>No payment records found for this patron.</p>"
-    
-    html += """
-    <div class='center'>
-        <a class='btn' href='/bank'>⬅️ Back to Bank</a>
-    </div>
-    """
-    
-    return html + end()
+    return render_template("bank_search.html", patron=patron, payments=payments,
+                           total_paid=total_paid, outstanding_fines=outstanding_fines)
 
 @app.route("/bank/create", methods=["POST"])
 def bank_create():
@@ -2204,89 +1291,35 @@ def bank_view(id):
     conn = get_db()
     p = conn.execute("SELECT * FROM Payments WHERE payment_id=?", (id,)).fetchone()
     if not p: 
-        return style + "<h3>❌ Not found</h3><div class='center'><a class='btn' href='/bank'>⬅️ Back</a></div>" + end()
-    
-    amount = p["amount"] if p["amount"] is not None else 0
+        return message("❌ Not found", "/bank")
     
     # Get patron info
     patron = conn.execute("SELECT name, email FROM Patron WHERE patron_id=?", (p['patron_id'],)).fetchone()
     patron_name = patron['name'] if patron else f"Patron #{p['patron_id']}"
-    patron_email = patron['email'] if patron else "No email"
-    
-    return style + f"""
-      <h2>👁️ Payment Details</h2>
-      <div class='card'>
-        <div class='book-details'>
-          <div class='detail-item'>
-            <strong>Payment ID:</strong><br>{p['payment_id']}
-          </div>
-          <div class='detail-item'>
-            <strong>Patron:</strong><br>{patron_name}
-          </div>
-          <div class='detail-item'>
-            <strong>Patron ID:</strong><br>{p['patron_id']}
-          </div>
-          <div class='detail-item'>
-            <strong>Amount:</strong><br>RM {float(amount):.2f}
-          </div>
-          <div class='detail-item'>
-            <strong>Date:</strong><br>{p['payment_date']}
-          </div>
-          <div class='detail-item'>
-            <strong>Purpose:</strong><br>{p['purpose']}
-          </div>
-        </div>
-      </div>
-      <div class='center'><a class='btn' href='/bank'>⬅️ Back</a></div>
-    """ + end()
+    
+    return render_template("bank_payment.html", p=p, patron_name=patron_name)
 
 # ==================== SEARCH BOOKS ====================
 @app.route("/search_books", methods=["GET","POST"])
+@conditional("Books")
 def search_books():
     conn = get_db()
-    html = style + "<h2>🔍 Search books</h2>"
+    keyword = None
     results = []
     if request.method == "POST":
         keyword = request.form["keyword"].strip()
-        results = conn.execute("SELECT * FROM Books WHERE title LIKE ? OR author LIKE ? OR genre LIKE ? OR isbn LIKE ?", 
-                              (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%", f"%{keyword}%")).fetchall()
-        html += f"<p class='muted center'>Keyword: {keyword}</p>"
-    html += """
-      <form method='POST' class='center'>
-        <input name='keyword' placeholder='Search by title, author, genre or ISBN'>
-        <button class='btn'>🔍 Search</button>
-      </form>
-    """
-    if results:
-        html += "<div class='section'><div class='grid'>"
-        for b in results:
-            status = "Available ✅" if b['available'] else "Borrowed ❌"
-            type_class = f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
-            html += f"""
-            <div class='card'>
-              <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
-              <p><strong>Author:</strong> {b['author'] or '-'}</p>
-              <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
-              <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
-              <div class='actions'><a class='btn' href='/guest_view_book/{b['book_id']}'>👁️ View Details</a></div>
-            </div>
-            """
-        html += "</div></div>"
-    elif request.method == "POST":
-        html += "<p class='muted center'>❌ No books found</p>"
-    html += "<div class='center'><a class='btn' href='/'>⬅️ Kembali</a></div>"
-    return html + end()
+    elif "keyword" in request.args:
+        # GET ?keyword= is what the form sends, so results can be revalidated
+        keyword = request.args["keyword"].strip()
+    if keyword is not None:
+        results = search.search_books(conn, keyword, highlight=HIGHLIGHT)
+    return render_template("search.html", keyword=keyword, results=results)
 
 # ==================== LOGOUT ====================
 @app.route("/logout")
 def logout():
     session.clear()
-    return style + """
-      <h2>👋 Logged Out</h2>
-      <div class='center'>
-        <a class='btn' href='/'>🏠 Return to Home</a>
-      </div>
-    """ + end()
+    return message("👋 Logged Out", "/", "🏠 Return to Home", heading="h2")
 
 # ==================== MAIN ====================
 if __name__ == "__main__":
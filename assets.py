@@ -0,0 +1,49 @@
+# assets.py
+# Fingerprinted static files.
+#
+# asset_name('css/library.css') gives 'css/library.1a2b3c4d5e.css', with a
+# hash of the file's content in the name. The app serves those names with a
+# one year "immutable" Cache-Control, so browsers fetch each version once and
+# never revalidate it; a changed file gets a new name and a new URL.
+import hashlib
+import os
+
+from werkzeug.security import safe_join
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+HASH_LENGTH = 10
+MAX_AGE = 365 * 24 * 3600
+
+# filename -> (mtime_ns, size, hash)
+_hashes = {}
+
+
+def content_hash(filename):
+    """Short SHA-256 of a static file, recomputed only when the file changes"""
+    path = safe_join(STATIC_DIR, filename)
+    if path is None:
+        raise FileNotFoundError(filename)
+    st = os.stat(path)
+    cached = _hashes.get(filename)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH]
+    _hashes[filename] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def asset_name(filename):
+    """'css/library.css' -> 'css/library.<hash>.css'"""
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{content_hash(filename)}{ext}"
+
+
+def split_name(name):
+    """'css/library.<hash>.css' -> ('css/library.css', '<hash>'), hash None if absent"""
+    root, ext = os.path.splitext(name)
+    stem, dot, digest = root.rpartition(".")
+    if dot and len(digest) == HASH_LENGTH and all(c in "0123456789abcdef" for c in digest):
+        return stem + ext, digest
+    return name, None
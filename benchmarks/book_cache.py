@@ -0,0 +1,88 @@
+# benchmarks/book_cache.py
+# Book detail pages with a popular-title skew, with the catalog cache on
+# (catalog.BookCache) and off (size 0): requests per second and hit ratio,
+# plus a borrow/return every --write-every requests so entries keep being
+# invalidated the way they are in production.
+#
+#   python benchmarks/book_cache.py --requests 20000 --books 2000
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run(library, book_ids, requests, write_every, seed):
+    """Replay the same request mix, returns (seconds, cache stats)"""
+    import catalog
+    import loans
+
+    rng = random.Random(seed)
+    client = library.app.test_client()
+    # Zipf-like: a handful of titles get most of the views
+    weights = [1 / (rank + 1) for rank in range(len(book_ids))]
+    picks = rng.choices(book_ids, weights, k=requests)
+    conn = library.db.connect()
+    patron_id = conn.execute("SELECT patron_id FROM Patron ORDER BY patron_id LIMIT 1").fetchone()[0]
+    pages = ("/guest_view_book/{}", "/admin/view/book/{}")
+    client.post("/login_admin", data={'email': 'admin@lib.com', 'password': 'admin123'})
+
+    t0 = time.perf_counter()
+    for i, book_id in enumerate(picks):
+        client.get(pages[i % 2].format(book_id)).close()
+        if write_every and i % write_every == 0:
+            result = loans.borrow_book(conn, patron_id, book_id, "2025-01-01")
+            if result['status'] == loans.BORROWED:
+                loans.return_loan(conn, result['transaction_id'], "2025-01-02", 0)
+            catalog.books.invalidate(book_id)
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed, catalog.books.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--write-every", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "library.db")
+        shutil.copy(args.db, path)
+        os.environ["LIBRARY_DB"] = path
+        os.environ["LIBRARY_DB_CHECKPOINT_INTERVAL"] = "0"
+        import app as library
+        import catalog
+
+        conn = library.db.connect()
+        conn.executemany("""
+            INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location)
+            VALUES (?, ?, ?, 2020, 'Bench', ?, ?, 'A-1')
+        """, [(f"Cached title {i}", f"Author {i % 97}", f"CACHE-{i:07d}",
+               'Physical' if i % 2 else 'E-book', f"CB {i}") for i in range(args.books)])
+        conn.commit()
+        book_ids = [r[0] for r in conn.execute("SELECT book_id FROM Books WHERE isbn LIKE 'CACHE-%'")]
+        conn.close()
+
+        print(f"{args.requests:,} detail page views over {len(book_ids):,} books, "
+              f"a borrow and return every {args.write_every}")
+        for label, size in (("no cache", 0), ("cache", catalog.CACHE_SIZE)):
+            catalog.books = catalog.BookCache(size)
+            elapsed, stats = run(library, book_ids, args.requests, args.write_every, args.seed)
+            print(f"{label:<9} {args.requests / elapsed:>8.0f} req/s   hit ratio {stats['hit_ratio']:.1%}   "
+                  f"evictions {stats['evictions']:,}   invalidations {stats['invalidations']:,}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/borrow_race.py
+# Concurrency stress test for loans.borrow_book(): many threads, each with
+# its own connection and its own student, try to borrow the same physical
+# book at the same instant. Exactly one of them may win each round per copy.
+#
+#   python benchmarks/borrow_race.py --threads 32 --rounds 20 --copies 3
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import loans
+import migrations
+
+
+def setup(path, threads, copies):
+    """Add one test book with `copies` copies and `threads` students, returns (book_id, patron_ids)"""
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    book_id = conn.execute("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location, available)
+        VALUES ('Race Test', 'Bench', 'RACE-TEST-0001', 2025, 'Test', 'Physical', 'RT 1', 'X', 1)
+    """).lastrowid
+    loans.add_copies(conn, book_id, copies - 1)
+    patron_ids = []
+    for i in range(threads):
+        patron_ids.append(conn.execute("""
+            INSERT INTO Patron (name, role, email, password) VALUES (?, 'Student', ?, 'x')
+        """, (f"Racer {i}", f"racer{i}@bench.test")).lastrowid)
+    conn.commit()
+    conn.close()
+    return book_id, patron_ids
+
+
+def race(path, book_id, patron_ids):
+    """One round: every thread borrows at once, returns {status: count}"""
+    barrier = threading.Barrier(len(patron_ids))
+    results = []
+    lock = threading.Lock()
+
+    def worker(patron_id):
+        conn = db.connect(path)
+        try:
+            barrier.wait()
+            try:
+                status = loans.borrow_book(conn, patron_id, book_id, "2025-01-01")['status']
+            except Exception as e:
+                status = f"error: {e}"
+            with lock:
+                results.append(status)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in patron_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counts = {}
+    for status in results:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def reset(path, book_id):
+    conn = db.connect(path)
+    open_loans = conn.execute(
+        "SELECT transaction_id FROM Transactions WHERE book_id = ? AND return_date IS NULL", (book_id,)).fetchall()
+    for (txn_id,) in open_loans:
+        loans.return_loan(conn, txn_id, "2025-01-02", 0)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=db.DB_PATH)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--copies", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "race.db")
+    shutil.copy(args.db, path)
+    failures = 0
+    try:
+        book_id, patron_ids = setup(path, args.threads, args.copies)
+        start = time.perf_counter()
+        for round_no in range(1, args.rounds + 1):
+            counts = race(path, book_id, patron_ids)
+            conn = db.connect(path)
+            open_loans = conn.execute(
+                "SELECT COUNT(*) FROM Transactions WHERE book_id = ? AND return_date IS NULL", (book_id,)).fetchone()[0]
+            available, available_count = conn.execute(
+                "SELECT available, available_count FROM Books WHERE book_id = ?", (book_id,)).fetchone()
+            conn.close()
+            ok = (counts.get(loans.BORROWED) == args.copies and open_loans == args.copies
+                  and available == 0 and available_count == 0
+                  and counts.get(loans.UNAVAILABLE, 0) == len(patron_ids) - args.copies)
+            failures += not ok
+            print(f"round {round_no:>3}: {counts}  open loans={open_loans}  {'ok' if ok else 'FAIL'}")
+            reset(path, book_id)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"\n{args.rounds} rounds x {args.threads} threads in {elapsed:.2f}s, {failures} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/compression.py
+# Bytes on the wire and time per request for the main pages with and without
+# Accept-Encoding, through the CompressionMiddleware in front of the app.
+# --rows adds books, feedback and payments so the list pages get long.
+#
+#   python benchmarks/compression.py --rows 2000 --repeat 20
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = [
+    ('/guest?size=500', None),
+    ('/search_books?keyword=title', None),
+    ('/admin?size=500', ('/login_admin', {'email': 'admin@lib.com', 'password': 'admin123'})),
+    ('/librarian?size=500', ('/login_librarian', {'email': 'librarian@lib.com', 'password': 'lib123'})),
+    ('/bank', ('/login_bank', {'email': 'bank@lib.com', 'password': 'bank123'})),
+]
+
+
+def fill(conn, rows):
+    conn.executemany("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location)
+        VALUES (?, ?, ?, 2020, 'Bench', 'E-book', ?, 'Online')
+    """, [(f"Compressed title {i}", f"Author {i % 97}", f"GZ-{i:07d}", f"GZ {i}") for i in range(rows)])
+    conn.executemany("INSERT INTO Feedback (feedback_date, comment, rating) VALUES ('2025-01-01', ?, ?)",
+                     [(f"Feedback number {i} about the reading room and the opening hours", i % 5 + 1)
+                      for i in range(rows)])
+    patron_id = conn.execute("SELECT MIN(patron_id) FROM Patron").fetchone()[0]
+    conn.executemany("INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (?, ?, '2025-01-01', 'Fine')",
+                     [(patron_id, i % 20 + 0.5) for i in range(rows)])
+    conn.commit()
+
+
+def timed(client, path, headers, repeat):
+    """Mean seconds per request, bytes sent"""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        size = sum(len(chunk) for chunk in client.get(path, headers=headers, buffered=False).response)
+    return (time.perf_counter() - t0) / repeat, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        shutil.copy(args.db, os.path.join(workdir, "library.db"))
+        os.environ["LIBRARY_DB"] = os.path.join(workdir, "library.db")
+        os.environ["LIBRARY_DB_CHECKPOINT_INTERVAL"] = "0"
+        import app as library
+
+        conn = library.db.connect()
+        fill(conn, args.rows)
+        conn.close()
+
+        encoding = "br" if library.compression.brotli is not None else "gzip"
+        print(f"{args.rows:,} extra rows per table, {encoding}, mean of {args.repeat}")
+        print(f"{'page':<30} {'identity':>10} {encoding:>10} {'ratio':>7} {'time':>9} {'time ' + encoding:>10}")
+        for path, login in PAGES:
+            client = library.app.test_client()
+            if login:
+                client.post(login[0], data=login[1])
+            plain_time, plain = timed(client, path, {}, args.repeat)
+            packed_time, packed = timed(client, path, {'Accept-Encoding': f"{encoding}, gzip"}, args.repeat)
+            print(f"{path:<30} {plain / 1024:>8.0f}KB {packed / 1024:>8.0f}KB {plain / packed:>6.1f}x "
+                  f"{plain_time * 1000:>7.1f}ms {packed_time * 1000:>8.1f}ms")
+        print(library.app.wsgi_app.stats())
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/conditional_get.py
+# Cost of a full page against a 304 for a browser revalidating its copy
+# (If-None-Match with the page's ETag), on the pages with @conditional.
+#
+#   python benchmarks/conditional_get.py --repeat 200
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = [
+    ('/guest', None),
+    ('/search_books?keyword=the', None),
+    ('/guest_view_book/1', None),
+    ('/admin', ('/login_admin', {'email': 'admin@lib.com', 'password': 'admin123'})),
+    ('/librarian', ('/login_librarian', {'email': 'librarian@lib.com', 'password': 'lib123'})),
+    ('/bank', ('/login_bank', {'email': 'bank@lib.com', 'password': 'bank123'})),
+]
+
+
+def timed(client, path, headers, repeat):
+    """Mean seconds per request and the last response's status and body size"""
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+    return (time.perf_counter() - t0) / repeat, response.status_code, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        shutil.copy(args.db, os.path.join(workdir, "library.db"))
+        os.environ["LIBRARY_DB"] = os.path.join(workdir, "library.db")
+        os.environ["LIBRARY_DB_CHECKPOINT_INTERVAL"] = "0"
+        import app as library
+
+        print(f"{'page':<28} {'200':>10} {'304':>10} {'speedup':>8}   bytes")
+        for path, login in PAGES:
+            client = library.app.test_client()
+            if login:
+                client.post(login[0], data=login[1])
+            tag = client.get(path).headers['ETag']
+            full, status, size = timed(client, path, {}, args.repeat)
+            cached, status_304, _ = timed(client, path, {'If-None-Match': tag}, args.repeat)
+            assert status == 200 and status_304 == 304, (path, status, status_304)
+            print(f"{path:<28} {full * 1000:>8.2f}ms {cached * 1000:>8.2f}ms {full / cached:>7.1f}x   {size:,} -> 0")
+        print(library.etags.counters.stats())
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/holds_queue.py
+# A hot title with thousands of holds: how long does handing a returned copy
+# to the next holder take as the queue grows, and is the order right?
+#
+#   python benchmarks/holds_queue.py --holds 5000 --cycles 500
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import holds
+import loans
+import migrations
+
+
+def setup(conn, patrons):
+    """One single-copy book and `patrons` students, returns (book_id, patron_ids)"""
+    book_id = conn.execute("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location, available)
+        VALUES ('Hot Title', 'Bench', 'HOLD-BENCH-0001', 2025, 'Test', 'Physical', 'HB 1', 'X', 1)
+    """).lastrowid
+    conn.executemany("INSERT INTO Patron (name, role, email, password) VALUES (?, 'Student', ?, 'x')",
+                     [(f"Holder {i}", f"holder{i}@bench.test") for i in range(patrons)])
+    patron_ids = [r[0] for r in conn.execute(
+        "SELECT patron_id FROM Patron WHERE email LIKE 'holder%@bench.test' ORDER BY patron_id")]
+    conn.commit()
+    return book_id, patron_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=db.DB_PATH)
+    parser.add_argument("--holds", type=int, default=5000)
+    parser.add_argument("--cycles", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "holds.db")
+    shutil.copy(args.db, path)
+    errors = 0
+    try:
+        conn = db.connect(path)
+        migrations.migrate(conn)
+        book_id, patron_ids = setup(conn, args.holds + 1)
+        first, queue = patron_ids[0], patron_ids[1:]
+
+        # The first patron holds the only copy, everyone else queues
+        loan = loans.borrow_book(conn, first, book_id, "2025-01-01")
+        t0 = time.perf_counter()
+        for patron_id in queue:
+            if holds.place_hold(conn, patron_id, book_id, "2025-01-01")['status'] != holds.PLACED:
+                errors += 1
+        placing = time.perf_counter() - t0
+
+        plan = conn.execute("""EXPLAIN QUERY PLAN
+            SELECT hold_id, patron_id FROM Holds
+            WHERE book_id = ? AND status = 'waiting'
+            ORDER BY priority DESC, hold_id LIMIT 1""", (book_id,)).fetchall()
+        print("next_hold plan:", "; ".join(row[3] for row in plan))
+
+        # Return -> dispatched to next holder -> collected -> returned again ...
+        txn_id = loan['transaction_id']
+        returns = collects = 0.0
+        for i in range(min(args.cycles, len(queue))):
+            t0 = time.perf_counter()
+            loans.return_loan(conn, txn_id, "2025-01-02", 0)
+            returns += time.perf_counter() - t0
+
+            ready = conn.execute("SELECT patron_id FROM Holds WHERE book_id = ? AND status = 'ready'",
+                                 (book_id,)).fetchall()
+            if [r[0] for r in ready] != [queue[i]]:
+                errors += 1  # must be exactly the next patron in FIFO order
+
+            t0 = time.perf_counter()
+            result = loans.borrow_book(conn, queue[i], book_id, "2025-01-02")
+            collects += time.perf_counter() - t0
+            if result['status'] != loans.BORROWED:
+                errors += 1
+            txn_id = result['transaction_id']
+        cycles = min(args.cycles, len(queue))
+
+        # Expiry: make the current loan come back, let the hold lapse, check it moves on
+        loans.return_loan(conn, txn_id, "2025-02-01", 0)
+        t0 = time.perf_counter()
+        expired = holds.expire_holds(conn, "2025-03-01")
+        expiring = time.perf_counter() - t0
+        nxt = conn.execute("SELECT patron_id FROM Holds WHERE book_id = ? AND status = 'ready'", (book_id,)).fetchone()
+        if expired != 1 or not nxt or nxt[0] != queue[cycles + 1]:
+            errors += 1
+        conn.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{len(queue):,} holds placed in {placing:.2f}s ({placing / len(queue) * 1e6:.0f} µs each)")
+    print(f"{cycles} return+dispatch: {returns / cycles * 1e6:.0f} µs avg")
+    print(f"{cycles} collect: {collects / cycles * 1e6:.0f} µs avg")
+    print(f"expire + re-dispatch: {expiring * 1e6:.0f} µs")
+    print(f"errors: {errors}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
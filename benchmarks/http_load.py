@@ -0,0 +1,474 @@
+# benchmarks/http_load.py
+# Load test over HTTP: every worker logs in as each role (login_role_submit
+# for admin/librarian/bank, student_login for a student) and replays a
+# weighted mix of browsing, search, borrow, return and payment traffic.
+# Latency percentiles and requests/s are reported per route, can be saved
+# as a JSON baseline and compared against one on later runs.
+#
+# --server gunicorn starts `gunicorn app:app` on a copy of --db (as in the
+# procfile), --server client replays the mix in-process through the
+# Werkzeug test client (a micro-benchmark without sockets), --url targets
+# a server that is already running (--db must then be its database, used
+# read-only for logins and ids). For a realistic data size generate one
+# first: python database_setup.py --patrons 1e4 --books 1e5 --txns 1e6 --db load.db
+#
+#   python benchmarks/http_load.py --server gunicorn --workers 4 --concurrency 8 --requests 2000 --save base.json
+#   python benchmarks/http_load.py --server gunicorn --workers 4 --concurrency 8 --requests 2000 --compare base.json
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Routes with fewer samples than this (the logins) are not compared
+MIN_COUNT = 20
+
+SEARCH_TERMS = ['the', 'river', 'code', 'history', 'night', 'python', 'garden', 'data', 'fantasy', 'tolkien']
+
+
+# ==================== CLIENTS ====================
+class Recorder:
+    """Latencies and status codes per route label"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, label, seconds, status):
+        with self._lock:
+            route = self.routes.setdefault(label, {'latencies': [], 'statuses': {}})
+            route['latencies'].append(seconds)
+            route['statuses'][status] = route['statuses'].get(status, 0) + 1
+
+
+class HttpUser:
+    """One browser: a keep-alive connection and its session cookie"""
+
+    def __init__(self, base_url, recorder, encoding):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.recorder = recorder
+        self.encoding = encoding
+        self.cookies = {}
+        self.conn = None
+
+    def request(self, label, method, path, data=None, expect=None):
+        """Send one request and time it until the whole body is read, returns (status, text).
+
+        With `expect`, any other status is recorded as an error.
+        """
+        headers = {'Accept-Encoding': self.encoding}
+        if self.cookies:
+            headers['Cookie'] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            self.recorder.record(label, time.perf_counter() - started, 'error')
+            return None, ''
+        self.recorder.record(label, time.perf_counter() - started,
+                             'error' if expect is not None and status != expect else status)
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        if response.getheader('Content-Encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        return status, payload.decode('utf-8', 'replace')
+
+
+class ClientUser:
+    """Same interface as HttpUser over the Werkzeug test client"""
+
+    def __init__(self, app, recorder, encoding):
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.encoding = encoding
+
+    def request(self, label, method, path, data=None, expect=None):
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, data=data,
+                                    headers={'Accept-Encoding': self.encoding})
+        payload = response.get_data()
+        response.close()
+        status = response.status_code
+        self.recorder.record(label, time.perf_counter() - started,
+                             'error' if expect is not None and status != expect else status)
+        if response.headers.get('Content-Encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        return response.status_code, payload.decode('utf-8', 'replace')
+
+
+# ==================== TRAFFIC MIX ====================
+# Each scenario is one user action; most are a single request, returns
+# read the student's (or the book's) page first to find a loan to return.
+def guest_catalog(users, ctx):
+    users['guest'].request("GET /guest", "GET", "/guest")
+
+
+def guest_book(users, ctx):
+    users['guest'].request("GET /guest_view_book/<id>", "GET", f"/guest_view_book/{ctx.popular_book()}")
+
+
+def guest_search(users, ctx):
+    users['guest'].request("GET /search_books", "GET", f"/search_books?keyword={ctx.rng.choice(ctx.terms)}")
+
+
+def home(users, ctx):
+    users['guest'].request("GET /", "GET", "/")
+
+
+def guest_feedback(users, ctx):
+    users['guest'].request("POST /guest_create_feedback", "POST", "/guest_create_feedback",
+                           {'name': '', 'feedback_date': ctx.today, 'comment': 'Load test feedback',
+                            'rating': ctx.rng.randint(1, 5)})
+
+
+def student_home(users, ctx):
+    users['student'].request("GET /student", "GET", "/student")
+
+
+def student_history(users, ctx):
+    users['student'].request("GET /student/my_borrow_books", "GET", "/student/my_borrow_books")
+
+
+def student_borrow(users, ctx):
+    users['student'].request("POST /student/borrow", "POST", "/student/borrow",
+                             {'book_id': ctx.popular_book(), 'borrow_date': ctx.today})
+
+
+def student_return(users, ctx):
+    status, page = users['student'].request("GET /student", "GET", "/student")
+    loans = re.findall(r'/student/return/(\d+)', page)
+    if loans:
+        users['student'].request("POST /student/return/<id>", "POST", f"/student/return/{ctx.rng.choice(loans)}")
+
+
+def admin_home(users, ctx):
+    users['admin'].request("GET /admin", "GET", "/admin")
+
+
+def admin_book(users, ctx):
+    users['admin'].request("GET /admin/view/book/<id>", "GET", f"/admin/view/book/{ctx.popular_book()}")
+
+
+def admin_patron(users, ctx):
+    users['admin'].request("GET /admin/view/patron/<id>", "GET", f"/admin/view/patron/{ctx.rng.choice(ctx.patron_ids)}")
+
+
+def admin_fine(users, ctx):
+    users['admin'].request("GET /check_patron_fine/<id>", "GET", f"/check_patron_fine/{ctx.rng.choice(ctx.patron_ids)}")
+
+
+def librarian_home(users, ctx):
+    users['librarian'].request("GET /librarian", "GET", "/librarian")
+
+
+def librarian_book(users, ctx):
+    users['librarian'].request("GET /librarian/view/<id>", "GET", f"/librarian/view/{ctx.popular_book()}")
+
+
+def librarian_return(users, ctx):
+    book_id = ctx.popular_book()
+    status, page = users['librarian'].request("GET /librarian/view/<id>", "GET", f"/librarian/view/{book_id}")
+    loans = re.findall(r"name='transaction_id' value='(\d+)'", page)
+    if loans:
+        # A return redirects back to the book; the message page (200) means nothing was returned
+        users['librarian'].request("POST /librarian/return_book/<id>", "POST", f"/librarian/return_book/{book_id}",
+                                   {'transaction_id': ctx.rng.choice(loans)}, expect=302)
+
+
+def bank_home(users, ctx):
+    users['bank'].request("GET /bank", "GET", "/bank")
+
+
+def bank_search(users, ctx):
+    users['bank'].request("POST /bank/search_payments", "POST", "/bank/search_payments",
+                          {'patron_id': ctx.rng.choice(ctx.patron_ids)})
+
+
+def bank_payment(users, ctx):
+    users['bank'].request("POST /bank/create", "POST", "/bank/create",
+                          {'patron_id': ctx.rng.choice(ctx.patron_ids), 'amount': f"{ctx.rng.uniform(1, 30):.2f}",
+                           'payment_date': ctx.today, 'purpose': 'Fine Payment'})
+
+
+# (weight, scenario): browsing dominates, writes are a steady minority
+MIX = [
+    (18, guest_book), (10, guest_catalog), (10, guest_search), (3, home), (1, guest_feedback),
+    (10, student_home), (3, student_history), (6, student_borrow), (5, student_return),
+    (3, admin_home), (4, admin_book), (3, admin_patron), (3, admin_fine),
+    (3, librarian_home), (4, librarian_book), (2, librarian_return),
+    (1, bank_home), (3, bank_search), (4, bank_payment),
+]
+
+
+class Context:
+    """Per-worker random state and the ids the mix draws from"""
+
+    def __init__(self, seed, data):
+        self.rng = random.Random(seed)
+        self.book_ids = data['book_ids']
+        self.book_weights = data['book_weights']
+        self.patron_ids = data['patron_ids']
+        self.terms = data['terms']
+        self.today = datetime.now().strftime("%Y-%m-%d")
+
+    def popular_book(self):
+        return self.rng.choices(self.book_ids, cum_weights=self.book_weights)[0]
+
+
+def load_data(path, seed):
+    """Logins and ids from the database the server runs on"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        accounts = {}
+        for role in ('Admin', 'Librarian', 'Bank'):
+            row = conn.execute("SELECT email, password FROM Patron WHERE role = ? AND is_active = 1 "
+                               "ORDER BY patron_id LIMIT 1", (role,)).fetchone()
+            if not row:
+                sys.exit(f"No {role} account in {path}")
+            accounts[role.lower()] = {'email': row[0], 'password': row[1]}
+        students = [r[0] for r in conn.execute("SELECT name FROM Patron WHERE role = 'Student' LIMIT 1000")]
+        book_ids = [r[0] for r in conn.execute("SELECT book_id FROM Books")]
+        patron_ids = [r[0] for r in conn.execute("SELECT patron_id FROM Patron")]
+    finally:
+        conn.close()
+    if not (students and book_ids):
+        sys.exit(f"{path} needs at least one student and one book")
+    # Zipf-like popularity over a shuffled catalog, as in book_cache.py
+    random.Random(seed).shuffle(book_ids)
+    weights, total = [], 0.0
+    for rank in range(len(book_ids)):
+        total += 1 / (rank + 1)
+        weights.append(total)
+    return {'accounts': accounts, 'students': students, 'book_ids': book_ids, 'book_weights': weights,
+            'patron_ids': patron_ids, 'terms': SEARCH_TERMS}
+
+
+def log_in(make_user, data, rng):
+    """One user per role, logged in through the app's login routes"""
+    users = {role: make_user() for role in ('guest', 'student', 'admin', 'librarian', 'bank')}
+    for role in ('admin', 'librarian', 'bank'):
+        users[role].request(f"POST /login_{role}", "POST", f"/login_{role}", data['accounts'][role])
+    users['student'].request("POST /student_login", "POST", "/student_login",
+                             {'name': rng.choice(data['students'])})
+    return users
+
+
+def run(make_user, data, concurrency, requests, seed):
+    """Replay `requests` scenarios split over `concurrency` workers, returns wall seconds"""
+    weights = [w for w, _ in MIX]
+    scenarios = [s for _, s in MIX]
+    contexts = [Context(seed + i, data) for i in range(concurrency)]
+    users = [log_in(make_user, data, ctx.rng) for ctx in contexts]
+
+    def worker(i):
+        ctx = contexts[i]
+        for scenario in ctx.rng.choices(scenarios, weights, k=requests // concurrency):
+            scenario(users[i], ctx)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started
+
+
+# ==================== REPORT ====================
+def percentile(ordered, p):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'rps': round(len(ordered) / elapsed, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+        'errors': sum(n for status, n in statuses.items() if status == 'error' or status >= 500),
+        'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+    }
+
+
+def build_report(recorder, elapsed, meta):
+    routes = {label: summarize(r['latencies'], r['statuses'], elapsed)
+              for label, r in sorted(recorder.routes.items())}
+    every = [x for r in recorder.routes.values() for x in r['latencies']]
+    statuses = {}
+    for r in recorder.routes.values():
+        for status, n in r['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + n
+    return {'meta': meta, 'total': summarize(every, statuses, elapsed), 'routes': routes}
+
+
+def print_report(report, baseline=None, tolerance=0.2):
+    """Table per route; with a baseline, the change in p95 and req/s. Returns the regressed routes."""
+    regressed = []
+    print(f"{'route':<34} {'count':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>4}"
+          + (f" {'p95 Δ':>8} {'req/s Δ':>8}" if baseline else ""))
+    rows = list(report['routes'].items()) + [('TOTAL', report['total'])]
+    for label, r in rows:
+        line = (f"{label:<34} {r['count']:>6} {r['rps']:>8.1f} {r['p50_ms']:>6.1f}ms {r['p95_ms']:>6.1f}ms "
+                f"{r['p99_ms']:>6.1f}ms {r['errors']:>4}")
+        old = baseline and (baseline['total'] if label == 'TOTAL' else baseline['routes'].get(label))
+        if old and min(r['count'], old['count']) < MIN_COUNT:
+            line += f" {'few':>8}"
+        elif old:
+            p95 = r['p95_ms'] / old['p95_ms'] - 1 if old['p95_ms'] else 0.0
+            rps = r['rps'] / old['rps'] - 1 if old['rps'] else 0.0
+            slower = p95 > tolerance or rps < -tolerance
+            line += f" {p95:>+7.0%} {rps:>+8.0%}" + ("  ⚠️ slower" if slower else "")
+            if slower:
+                regressed.append(label)
+        elif baseline:
+            line += f" {'new':>8}"
+        print(line)
+    return regressed
+
+
+# ==================== SERVERS ====================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(db_path, workers, threads):
+    """gunicorn app:app on a free port, returns (process, base url)"""
+    port = free_port()
+    env = dict(os.environ, LIBRARY_DB=db_path)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+                                "--workers", str(workers), "--threads", str(threads), "--log-level", "warning"],
+                               cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("gunicorn exited during startup (pip install gunicorn?)")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not start listening within 30s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--server", choices=["gunicorn", "client"], default="gunicorn")
+    parser.add_argument("--url", help="Load an already running server instead (its --db is only read)")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous users (test client: 1)")
+    parser.add_argument("--requests", type=int, default=2000, help="User actions in total")
+    parser.add_argument("--warmup", type=int, default=200, help="Actions replayed first and not reported")
+    parser.add_argument("--encoding", default="gzip", help="Accept-Encoding sent (identity for none)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Flag routes whose p95 grew or req/s fell by more than this fraction")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp()
+    process = None
+    try:
+        if args.url:
+            db_path, target = args.db, args.url
+        else:
+            db_path = os.path.join(workdir, "library.db")
+            shutil.copy(args.db, db_path)
+            target = args.server
+        data = load_data(db_path, args.seed)
+
+        if args.server == "client" and not args.url:
+            os.environ["LIBRARY_DB"] = db_path
+            os.environ["LIBRARY_DB_CHECKPOINT_INTERVAL"] = "0"
+            import app as library
+            args.concurrency = 1
+
+            def make_user():
+                return ClientUser(library.app, recorder, args.encoding)
+        else:
+            if not args.url:
+                process, base_url = start_gunicorn(db_path, args.workers, args.threads)
+            else:
+                base_url = args.url
+
+            def make_user():
+                return HttpUser(base_url, recorder, args.encoding)
+
+        if args.warmup:
+            recorder = Recorder()
+            run(make_user, data, args.concurrency, max(args.warmup, args.concurrency), args.seed + 1000)
+        recorder = Recorder()
+        elapsed = run(make_user, data, args.concurrency, args.requests, args.seed)
+
+        meta = {'target': target, 'concurrency': args.concurrency, 'requests': args.requests,
+                'workers': args.workers if target == "gunicorn" else None, 'encoding': args.encoding,
+                'seed': args.seed, 'books': len(data['book_ids']), 'patrons': len(data['patron_ids']),
+                'elapsed_s': round(elapsed, 2), 'date': datetime.now().isoformat(timespec='seconds')}
+        report = build_report(recorder, elapsed, meta)
+        print(f"{target}, {args.concurrency} concurrent users, {args.requests:,} actions over "
+              f"{meta['books']:,} books in {elapsed:.1f}s")
+        if baseline:
+            changed = [key for key in ('target', 'concurrency', 'workers', 'encoding', 'books', 'patrons')
+                       if baseline['meta'].get(key) != meta[key]]
+            if changed:
+                print(f"⚠️ Not like for like with {args.compare}: " + ", ".join(
+                    f"{key} {baseline['meta'].get(key)} -> {meta[key]}" for key in changed))
+        regressed = print_report(report, baseline, args.tolerance)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Saved to {args.save}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir)
+    if regressed:
+        print(f"⚠️ {len(regressed)} route(s) slower than {args.compare} by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
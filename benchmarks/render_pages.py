@@ -0,0 +1,264 @@
+# benchmarks/render_pages.py
+# Render time of /guest and /admin with 10k rows per list: the old f-string
+# concatenation (kept here as legacy_*) against the Jinja2 templates, plus
+# how long a fresh worker spends compiling templates with and without the
+# bytecode cache. Only rendering is timed, the rows are built up front.
+#
+#   python benchmarks/render_pages.py --rows 10000
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_rows(n):
+    """n books, feedbacks, patrons and transactions as sqlite3.Row, like the app gets"""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    books = conn.execute(f"""
+        WITH RECURSIVE i(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM i WHERE n < {n})
+        SELECT n AS book_id, 'Book title number ' || n AS title, 'Author ' || (n % 997) AS author,
+               'Genre ' || (n % 13) AS genre, CASE n % 4 WHEN 0 THEN 'Physical' WHEN 1 THEN 'E-book'
+               WHEN 2 THEN 'Audiobook' ELSE 'Reference' END AS type, 'CN-' || n AS call_number, n % 3 > 0 AS available
+        FROM i""").fetchall()
+    feedbacks = conn.execute(f"""
+        WITH RECURSIVE i(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM i WHERE n < {n})
+        SELECT n AS feedback_id, 'Reader ' || n AS patron_name, '2025-01-01' AS feedback_date, n % 5 + 1 AS rating,
+               'A fairly long comment about the library that goes on for quite a while, number ' || n || ', and then some more words to pass one hundred characters' AS comment
+        FROM i""").fetchall()
+    patrons = conn.execute(f"""
+        WITH RECURSIVE i(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM i WHERE n < {n})
+        SELECT n AS patron_id, 'Patron ' || n AS name, 'Student' AS role, 'p' || n || '@lib.com' AS email, 1 AS is_active
+        FROM i""").fetchall()
+    txns = conn.execute(f"""
+        WITH RECURSIVE i(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM i WHERE n < {n})
+        SELECT n AS transaction_id, n % 500 AS patron_id, n AS book_id, '2025-01-01' AS borrow_date,
+               CASE WHEN n % 2 THEN '2025-01-20' END AS return_date, (n % 7) * 1.0 AS fine, 'Physical' AS item_type
+        FROM i""").fetchall()
+    fines_due = {p['patron_id']: (p['patron_id'] % 5) * 1.0 for p in patrons}
+    return books, feedbacks, patrons, txns, fines_due
+
+
+# ---- the renderer the app used before templates (HTML bits trimmed to the per-row loops) ----
+def legacy_type_class(b):
+    return f"type-{b['type'].lower().replace('-', '').replace(' ', '')}"
+
+
+def legacy_guest(style, books, feedbacks):
+    html = style + "<h1>👥 Guest Access</h1>"
+    html += "<h2>📚 Book Collection</h2>"
+    html += "<div class='section'><div class='grid'>"
+    for b in books:
+        status = "Available ✅" if b['available'] else "Borrowed ❌"
+        type_class = legacy_type_class(b)
+        html += f"""
+        <div class='card'>
+          <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
+          <p><strong>Author:</strong> {b['author'] or '-'}</p>
+          <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
+          <p><strong>Call Number:</strong> {b['call_number'] or '-'}</p>
+          <div class='actions'>
+            <a class='btn btn-small' href='/guest_view_book/{b['book_id']}'>👁️ View Details</a>
+            {""}
+          </div>
+        </div>
+        """
+    html += "</div></div>"
+    html += "<div class='hr'></div><h2>💬 All Feedback</h2><div class='section'><div class='grid'>"
+    for f in feedbacks:
+        rating_stars = "⭐" * int(f['rating']) if f['rating'] else "No rating"
+        patron_name = f['patron_name'] or "Anonymous"
+        html += f"""
+            <div class='card'>
+              <h3>Feedback #{f['feedback_id']}</h3>
+              <p><strong>From:</strong> {patron_name}</p>
+              <p><strong>Date:</strong> {f['feedback_date'] or '-'}</p>
+              <div class='star-rating'>{rating_stars}</div>
+              <p><strong>Comment:</strong> {f['comment'][:100]}{'...' if len(f['comment']) > 100 else ''}</p>
+              <div class='actions'>
+                <a class='btn btn-small' href='/guest_view_feedback/{f['feedback_id']}'>👁️ View</a>
+                <a class='btn btn-small btn-warning' href='/guest_edit_feedback/{f['feedback_id']}'>✏️ Edit</a>
+                <form class='inline' method='POST' action='/guest_delete_feedback/{f['feedback_id']}'>
+                  <button class='btn btn-small btn-danger' type='submit' onclick='return confirm("Delete this feedback?")'>🗑️ Delete</button>
+                </form>
+              </div>
+            </div>
+            """
+    html += "</div></div>"
+    return html + "</div>"
+
+
+def legacy_admin(style, patrons, books, txns, patron_fines):
+    html = style + "<h2>🛡️ Admin panel</h2>"
+    html += "<div class='section'><h3>👥 Patrons</h3><div class='grid'>"
+    for p in patrons:
+        patron_fine = patron_fines.get(p['patron_id'], 0)
+        html += f"""
+        <div class='card'>
+          <h3>{p['name'] or '-'} <span class='pill'>{p['role'] or '-'}</span></h3>
+          <p>Email: {p['email'] or '-'}</p>
+          <p>Active: {'✅' if p['is_active'] else '❌'}</p>
+          {f"<div class='fine-due'><strong>Total Fine Due:</strong> RM {patron_fine:.2f}</div>" if patron_fine > 0 else ""}
+          <div class='actions'>
+            <a class='btn btn-small' href='/admin/view/patron/{p['patron_id']}'>👁️ View</a>
+            <form class='inline' method='POST' action='/admin/update/patron/{p['patron_id']}'>
+              <input name='name' placeholder='New name'>
+              <input name='email' placeholder='New email'>
+              <input name='role' placeholder='New role'>
+              <select name='is_active'>
+                <option value=''>Select Status</option>
+                <option value='1'>Active</option>
+                <option value='0'>Inactive</option>
+              </select>
+              <button class='btn btn-small'>✏️ Update</button>
+            </form>
+            <form class='inline' method='POST' action='/admin/delete/patron/{p['patron_id']}'>
+              <button class='btn btn-small btn-danger'>🗑️ Delete</button>
+            </form>
+          </div>
+        </div>
+        """
+    html += "</div>"
+    html += "<div class='section'><h3>📚 Books (View Only)</h3><div class='grid'>"
+    for b in books:
+        status = "Available ✅" if (b['available'] or 0) == 1 else "Borrowed ❌"
+        type_class = legacy_type_class(b)
+        html += f"""
+        <div class='card'>
+          <h3>{b['title'] or '-'} <span class='pill'>{status}</span></h3>
+          <p><strong>Author:</strong> {b['author'] or '-'}</p>
+          <p><strong>Genre:</strong> {b['genre'] or '-'} <span class='book-type {type_class}'>{b['type'] or '-'}</span></p>
+          <p><strong>Call #:</strong> {b['call_number'] or '-'}</p>
+          <div class='actions'>
+            <a class='btn btn-small' href='/admin/view/book/{b['book_id']}'>👁️ View</a>
+          </div>
+        </div>
+        """
+    html += "</div></div>"
+    html += "<div class='section'><h3>🎓 Transactions</h3><div class='grid'>"
+    for t in txns:
+        fine = float(t['fine'] or 0)
+        borrow_date = t['borrow_date'] or "-"
+        return_date = t['return_date'] or "Not returned"
+        html += f"""
+        <div class='card'>
+          <h3>Txn #{t['transaction_id']}</h3>
+          <p>Patron: {t['patron_id'] or '-'} • Book: {t['book_id'] or '-'}</p>
+          <p>Borrow: {borrow_date} • Return: {return_date}</p>
+          <p>Type: {t['item_type'] or '-'}</p>
+          <p>Fine: RM {fine:.2f}</p>
+          <div class='actions'>
+            <a class='btn btn-small' href='/admin/view/txn/{t['transaction_id']}'>👁️ View</a>
+            <form class='inline' method='POST' action='/admin/update/txn/{t['transaction_id']}'>
+              <input name='patron_id' placeholder='New patron ID'>
+              <input name='book_id' placeholder='New book ID'>
+              <input name='borrow_date' placeholder='New borrow date'>
+              <input name='return_date' placeholder='New return date'>
+              <input name='fine' placeholder='New fine'>
+              <select name='item_type'>
+                <option value=''>Select Item Type</option>
+                <option value='Physical'>Physical</option>
+                <option value='E-book'>E-book</option>
+                <option value='Audiobook'>Audiobook</option>
+              </select>
+              <button class='btn btn-small'>✏️ Update</button>
+            </form>
+            <form class='inline' method='POST' action='/admin/delete/txn/{t['transaction_id']}'>
+              <button class='btn btn-small btn-danger'>🗑️ Delete</button>
+            </form>
+          </div>
+        </div>
+        """
+    html += "</div></div>"
+    return html + "</div>"
+
+
+class Page(list):
+    """Rows standing in for a pagination.StreamedPage that has been read"""
+    next_cursor = None
+
+    @property
+    def shown(self):
+        return len(self)
+
+
+def best(fn, repeat):
+    """Best wall time of `repeat` runs and the output size"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), len(out)
+
+
+def compile_times(app):
+    """Seconds to load every template in a fresh environment: from source, then from bytecode"""
+    from jinja2 import FileSystemBytecodeCache
+    cache_dir = tempfile.mkdtemp()
+    result = []
+    try:
+        for _ in range(2):
+            env = app.create_jinja_environment()
+            env.filters.update(app.jinja_env.filters)
+            env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            t0 = time.perf_counter()
+            for name in env.list_templates():
+                env.get_template(name)
+            result.append(time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(cache_dir)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Importing the app migrates and opens its database (db.DB_PATH is read
+    # at import), so point it at a scratch copy first
+    workdir = tempfile.mkdtemp()
+    try:
+        shutil.copy(args.db, os.path.join(workdir, "library.db"))
+        os.environ["LIBRARY_DB"] = os.path.join(workdir, "library.db")
+        import app as library
+        from flask import render_template
+
+        books, feedbacks, patrons, txns, fines_due = make_rows(args.rows)
+        books, patrons, txns = Page(books), Page(patrons), Page(txns)
+        patron_rows = [(p, fines_due.get(p['patron_id'], 0)) for p in patrons]
+        style = library.app.jinja_env.loader.get_source(library.app.jinja_env, "base.html")[0].split("{%")[0]
+        counters = {'patrons': args.rows, 'books': args.rows, 'books.borrowed': 0,
+                    'transactions': args.rows, 'fines.total': 0.0}
+
+        with library.app.test_request_context("/guest"):
+            old_guest = best(lambda: legacy_guest(style, books, feedbacks), args.repeat)
+            new_guest = best(lambda: render_template("guest.html", books=books, total_books=args.rows,
+                                                     feedbacks=feedbacks, today="2025-01-01"), args.repeat)
+        with library.app.test_request_context("/admin"):
+            old_admin = best(lambda: legacy_admin(style, patrons, books, txns, fines_due), args.repeat)
+            new_admin = best(lambda: render_template("admin.html", counters=counters, today="2025-01-01",
+                                                     patrons=patrons, patron_rows=patron_rows, books=books, txns=txns),
+                             args.repeat)
+        source, cached = compile_times(library.app)
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{args.rows:,} rows per list, best of {args.repeat}")
+    print(f"{'page':<8} {'f-strings':>12} {'jinja2':>12} {'ratio':>7}   html size old/new")
+    for page, (old, old_size), (new, new_size) in (("/guest", old_guest, new_guest), ("/admin", old_admin, new_admin)):
+        print(f"{page:<8} {old * 1000:>10.1f}ms {new * 1000:>10.1f}ms {old / new:>6.2f}x   "
+              f"{old_size / 1e6:.1f}MB / {new_size / 1e6:.1f}MB")
+    print(f"compile all templates: {source * 1000:.1f}ms from source, {cached * 1000:.1f}ms from bytecode cache")
+
+
+if __name__ == "__main__":
+    main()
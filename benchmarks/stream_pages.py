@@ -0,0 +1,135 @@
+# benchmarks/stream_pages.py
+# Time to first byte and peak memory of the big list pages with 100k
+# transactions (and as many payments), streamed as the app serves them
+# against the same page built whole before it is sent. "buffered" reads the
+# unpaginated lists with fetchall() and renders with render_template(), like
+# the app did before streaming. Each run is a fresh process so its peak RSS
+# is its own.
+#
+#   python benchmarks/stream_pages.py --txns 100000
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = {
+    '/guest?size=500': None,
+    '/admin?size=500': ('/login_admin', {'email': 'admin@lib.com', 'password': 'admin123'}),
+    '/librarian?size=500': ('/login_librarian', {'email': 'librarian@lib.com', 'password': 'lib123'}),
+    '/bank': ('/login_bank', {'email': 'bank@lib.com', 'password': 'bank123'}),
+}
+
+
+def fill(path, txns, payments, feedback, patrons=2000, books=5000):
+    """Migrate a copy of the database and bulk load it (the stats triggers keep the counters right)"""
+    import db
+    import migrations
+
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO Patron (name, role, email, password) VALUES (?, 'Student', ?, 'x')",
+                     [(f"Reader {i}", f"reader{i}@bench.test") for i in range(patrons)])
+    patron_ids = [r[0] for r in conn.execute("SELECT patron_id FROM Patron WHERE email LIKE '%@bench.test'")]
+    conn.executemany("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location)
+        VALUES (?, ?, ?, 2020, 'Bench', 'E-book', ?, 'Online')
+    """, [(f"Streamed title {i}", f"Author {i % 97}", f"STREAM-{i:07d}", f"SB {i}") for i in range(books)])
+    book_ids = [r[0] for r in conn.execute("SELECT book_id FROM Books WHERE isbn LIKE 'STREAM-%'")]
+    # One in ten loans is still out with a fine, so /bank has a long list of fined patrons too
+    conn.executemany("""
+        INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type)
+        VALUES (?, ?, '2025-01-01', ?, ?, 'E-book')
+    """, [(patron_ids[i % patrons], book_ids[i % books],
+           None if i % 10 == 0 else '2025-01-10', (i % 7) * 1.0 if i % 10 == 0 else 0)
+          for i in range(txns)])
+    conn.executemany("INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (?, ?, ?, 'Fine Payment')",
+                     [(patron_ids[i % patrons], (i % 20) + 0.5, f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+                      for i in range(payments)])
+    conn.executemany("INSERT INTO Feedback (patron_id, feedback_date, comment, rating) VALUES (?, '2025-01-01', ?, ?)",
+                     [(patron_ids[i % patrons], f"Streaming benchmark comment number {i}, long enough to be cut " * 2,
+                       i % 5 + 1) for i in range(feedback)])
+    conn.commit()
+    conn.close()
+
+
+def child(path, mode):
+    """Request one page in this process, print its timings as JSON"""
+    import app as library
+    import db
+    from flask import render_template
+
+    if mode == "buffered":
+        iter_rows = db.iter_rows
+        db.iter_rows = lambda *args, **kwargs: list(iter_rows(*args, **kwargs))
+        library.stream_page = render_template
+
+    client = library.app.test_client()
+    login = PAGES[path]
+    if login:
+        client.post(*login[:1], data=login[1])
+    client.get("/").close()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    response = client.get(path, buffered=False)
+    size = 0
+    ttfb = None
+    for chunk in response.iter_encoded():
+        if chunk and ttfb is None:
+            ttfb = time.perf_counter() - t0
+        size += len(chunk)
+    total = time.perf_counter() - t0
+    response.close()
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'status': response.status_code, 'ttfb': ttfb, 'total': total, 'bytes': size,
+                      'rss_growth_kb': rss_peak - rss_before, 'rss_peak_kb': rss_peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", os.path.join(ROOT, "library.db")))
+    parser.add_argument("--txns", type=int, default=100000)
+    parser.add_argument("--payments", type=int, help="default: as many as --txns")
+    parser.add_argument("--feedback", type=int, default=20000)
+    parser.add_argument("--child", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "library.db")
+    try:
+        shutil.copy(args.db, path)
+        env = dict(os.environ, LIBRARY_DB=path, LIBRARY_DB_CHECKPOINT_INTERVAL="0",
+                   LIBRARY_TEMPLATE_CACHE=workdir)
+        os.environ.update(env)
+        t0 = time.perf_counter()
+        payments = args.txns if args.payments is None else args.payments
+        fill(path, args.txns, payments, args.feedback)
+        print(f"{args.txns:,} transactions, {payments:,} payments, {args.feedback:,} feedback "
+              f"(loaded in {time.perf_counter() - t0:.1f}s)")
+        print(f"{'page':<22} {'mode':<9} {'TTFB':>10} {'total':>10} {'size':>8} {'peak RSS':>10} {'growth':>9}")
+        for page in PAGES:
+            for mode in ("buffered", "streamed"):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", page, mode],
+                                     env=env, capture_output=True, text=True, check=True)
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(f"{page:<22} {mode:<9} {r['ttfb'] * 1000:>8.1f}ms {r['total'] * 1000:>8.1f}ms "
+                      f"{r['bytes'] / 1e6:>6.1f}MB {r['rss_peak_kb'] / 1024:>8.1f}MB {r['rss_growth_kb'] / 1024:>7.1f}MB")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/wal_readers.py
+# Read throughput of the /guest catalog query with and without a concurrent
+# writer, in rollback-journal mode vs WAL mode.
+#
+#   python benchmarks/wal_readers.py --seconds 5 --readers 4
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+PROFILES = {
+    'rollback': dict(db.PRAGMAS, journal_mode='DELETE', synchronous='FULL'),
+    'wal': dict(db.PRAGMAS),
+}
+
+
+def run(path, pragmas, readers, seconds, with_writer):
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+
+    def reader(i):
+        conn = db.connect(path, pragmas)
+        while not stop.is_set():
+            try:
+                conn.execute("SELECT * FROM Books").fetchall()
+                conn.execute("SELECT * FROM Feedback").fetchall()
+                reads[i] += 1
+            except Exception:
+                pass
+        conn.close()
+
+    def writer():
+        conn = db.connect(path, pragmas)
+        while not stop.is_set():
+            try:
+                conn.execute("INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (202505, 1, '2025-01-01', 'bench')")
+                conn.commit()
+                writes[0] += 1
+            except Exception:
+                pass
+        conn.close()
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    if with_writer:
+        threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(reads) / seconds, writes[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=db.DB_PATH)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'Mode':<10} {'Writer':<8} {'Reads/s':>10} {'Writes/s':>10}")
+    print("-" * 42)
+    for name, pragmas in PROFILES.items():
+        for with_writer in (False, True):
+            workdir = tempfile.mkdtemp()
+            path = os.path.join(workdir, "bench.db")
+            shutil.copy(args.db, path)
+            try:
+                reads, writes = run(path, pragmas, args.readers, args.seconds, with_writer)
+            finally:
+                shutil.rmtree(workdir)
+            print(f"{name:<10} {'yes' if with_writer else 'no':<8} {reads:>10.0f} {writes:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
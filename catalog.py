@@ -0,0 +1,104 @@
+# catalog.py
+# Read-through cache for the book detail pages.
+#
+# Each worker keeps the most recently viewed Books rows, and the detail cards
+# rendered from them, in an LRU keyed by book_id. Every entry carries the
+# book's version stamp from BookVersions (migration 10), which triggers bump
+# on any change to the book, borrow and return included. A hit is one
+# primary key read of the stamp instead of the row plus a render, and a book
+# changed by another worker is never served stale. Writes in this worker
+# also drop the entry straight away (invalidate()).
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.environ.get("LIBRARY_BOOK_CACHE_SIZE", "1024"))
+
+
+class BookCache:
+    """LRU of {book_id: entry}, entry = {'version', 'row', 'fragments'}"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
+    def lookup(self, conn, book_id):
+        """The cache entry for a book, read from the database on a miss; None if there is no such book"""
+        stamp = conn.execute("SELECT version FROM BookVersions WHERE book_id = ?", (book_id,)).fetchone()
+        version = stamp[0] if stamp else None
+        with self._lock:
+            entry = self._entries.get(book_id)
+            if entry is not None and version is not None and entry['version'] == version:
+                self._entries.move_to_end(book_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Read after the stamp: the row is at least as new as `version`
+        row = conn.execute("SELECT * FROM Books WHERE book_id=?", (book_id,)).fetchone()
+        if row is None or version is None:
+            self.invalidate(book_id)
+            return {'version': None, 'row': row, 'fragments': {}} if row else None
+
+        entry = {'version': version, 'row': row, 'fragments': {}}
+        if self.size > 0:
+            with self._lock:
+                self._entries[book_id] = entry
+                self._entries.move_to_end(book_id)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def get(self, conn, book_id):
+        """A book's row, None if there is no such book"""
+        entry = self.lookup(conn, book_id)
+        return entry['row'] if entry else None
+
+    def fragment(self, entry, key, render):
+        """HTML rendered from an entry's row, `render(row)` only runs the first time per key"""
+        html = entry['fragments'].get(key)
+        if html is None:
+            html = entry['fragments'][key] = render(entry['row'])
+            with self._lock:
+                self.fragment_misses += 1
+        else:
+            with self._lock:
+                self.fragment_hits += 1
+        return html
+
+    def invalidate(self, book_id):
+        """Drop a book after writing to it"""
+        with self._lock:
+            if self._entries.pop(book_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Cache counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': self.size,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'fragment_hits': self.fragment_hits,
+                'fragment_misses': self.fragment_misses,
+            }
+
+
+books = BookCache()
@@ -0,0 +1,211 @@
+# compression.py
+# WSGI middleware that compresses responses (app.wsgi_app is wrapped in app.py).
+#
+# brotli is used when the client accepts it and the `brotli` package is
+# installed (pip install brotli), gzip otherwise. Responses smaller than
+# LIBRARY_COMPRESS_MIN_SIZE go out as they are. Streamed pages are
+# compressed chunk by chunk with a sync flush, so the browser can still
+# render the top of the page while the rest is produced.
+#
+# Fingerprinted static files (Cache-Control: immutable, see assets.py) never
+# change under the same URL, so they are compressed once at the highest
+# level and the result is kept in memory.
+import os
+import threading
+import zlib
+from itertools import chain
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.environ.get("LIBRARY_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("LIBRARY_COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("LIBRARY_COMPRESS_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# The app puts the matched URL rule here so savings are reported per route
+ROUTE_KEY = "library.route"
+
+
+def _gzip(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class _Compressor:
+    """compress()/flush()/finish() over zlib's and brotli's streaming APIs"""
+
+    def __init__(self, encoding, static=False):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=11 if static else BROTLI_QUALITY)
+        else:
+            self._gz = _gzip(9 if static else GZIP_LEVEL)
+
+    def compress(self, data):
+        return self._br.process(data) if self.encoding == "br" else self._gz.compress(data)
+
+    def flush(self):
+        """Everything given so far, decodable by the client now"""
+        return self._br.flush() if self.encoding == "br" else self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._br.finish() if self.encoding == "br" else self._gz.flush()
+
+
+class CompressionMiddleware:
+    """Compress compressible responses from `app` for clients that accept it"""
+
+    def __init__(self, app, min_size=MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+        self._lock = threading.Lock()
+        self._static = {}  # (path, encoding) -> (headers, body)
+        self._routes = {}
+
+    def negotiate(self, environ):
+        """'br', 'gzip' or None from the request's Accept-Encoding"""
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and accept.quality("br") > 0:
+            return "br"
+        if accept.quality("gzip") > 0:
+            return "gzip"
+        return None
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if encoding is None or environ.get("REQUEST_METHOD") == "HEAD" or "HTTP_RANGE" in environ:
+            return self.app(environ, start_response)
+        # Strong ETags of compressed bodies carry an encoding suffix (see
+        # _respond); the app compares against its own tags
+        for key in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MATCH"):
+            if key in environ:
+                environ[key] = environ[key].replace('-gzip"', '"').replace('-br"', '"')
+
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return self._write
+
+        body = self.app(environ, capture)
+        # Close the app's response even if the server never iterates ours
+        return ClosingIterator(self._respond(environ, start_response, captured, body, encoding),
+                               getattr(body, "close", None))
+
+    @staticmethod
+    def _write(data):
+        raise RuntimeError("CompressionMiddleware does not support the WSGI write() callable")
+
+    def _compressible(self, status, headers):
+        if not status.startswith("200") or "Content-Encoding" in headers:
+            return False
+        if "no-transform" in headers.get("Cache-Control", ""):
+            return False
+        content_type = headers.get("Content-Type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get("Content-Length")
+        return length is None or int(length) >= self.min_size
+
+    def _respond(self, environ, start_response, captured, body, encoding):
+        route = environ.get(ROUTE_KEY, "other")
+        chunks = iter(body)
+        pending = []
+        while not captured:  # an app may only call start_response once iterated
+            pending.append(next(chunks))
+        status, header_list, exc_info = captured
+        headers = Headers(header_list)
+
+        if not self._compressible(status, headers):
+            start_response(status, header_list, exc_info)
+            size = 0
+            for data in chain(pending, chunks):
+                size += len(data)
+                yield data
+            self._record(route, size, size, False)
+            return
+
+        immutable = "immutable" in headers.get("Cache-Control", "") and "Set-Cookie" not in headers
+        key = (environ.get("PATH_INFO"), encoding)
+        if immutable and key in self._static:
+            cached_headers, data = self._static[key]
+            start_response(status, cached_headers.to_wsgi_list(), exc_info)
+            self._record(route, int(headers.get("Content-Length", 0)), len(data), True)
+            yield data
+            return
+
+        # Without a Content-Length (streamed pages) read until we know
+        # the body is worth compressing
+        streaming = "Content-Length" not in headers
+        if streaming:
+            size = sum(len(data) for data in pending)
+            for data in chunks:
+                pending.append(data)
+                size += len(data)
+                if size >= self.min_size:
+                    break
+            else:
+                start_response(status, header_list, exc_info)
+                self._record(route, size, size, False)
+                yield b"".join(pending)
+                return
+
+        del headers["Content-Length"]
+        headers["Content-Encoding"] = encoding
+        vary = headers.get("Vary")
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = etag[:-1] + f'-{encoding}"'
+
+        compressor = _Compressor(encoding, static=immutable)
+        if immutable:
+            whole = b"".join(chain(pending, chunks))
+            data = compressor.compress(whole) + compressor.finish()
+            headers["Content-Length"] = str(len(data))
+            with self._lock:
+                self._static[key] = (headers, data)
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            self._record(route, len(whole), len(data), True)
+            yield data
+            return
+
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        size = sent = 0
+        for data in chain(pending, chunks):
+            size += len(data)
+            out = compressor.compress(data)
+            if streaming:
+                out += compressor.flush()
+            if out:
+                sent += len(out)
+                yield out
+        out = compressor.finish()
+        self._record(route, size, sent + len(out), True)
+        yield out
+
+    def _record(self, route, size, sent, compressed):
+        with self._lock:
+            counts = self._routes.setdefault(route, {'responses': 0, 'compressed': 0, 'bytes_in': 0,
+                                                     'bytes_out': 0})
+            counts['responses'] += 1
+            counts['compressed'] += compressed
+            counts['bytes_in'] += size
+            counts['bytes_out'] += sent
+
+    def stats(self):
+        """Per route: responses, how many were compressed, body bytes before/after and saved"""
+        with self._lock:
+            routes = {route: dict(counts) for route, counts in self._routes.items()}
+            static = len(self._static)
+        for counts in routes.values():
+            counts['saved'] = counts['bytes_in'] - counts['bytes_out']
+        return {'encoder': 'br+gzip' if brotli is not None else 'gzip', 'min_size': self.min_size,
+                'static_cached': static, 'routes': routes}
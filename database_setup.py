@@ -1,16 +1,257 @@
 # database_setup.py
+#
+#   python database_setup.py                 fresh library.db with the sample data below
+#   python database_setup.py --patrons 1e5 --books 1e6 --txns 1e7 --seed 7 --db load.db
+#                                            large synthetic database for load testing
+import argparse
+import random
 import sqlite3
 import os
-from datetime import datetime, timedelta
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+import fines
+import migrations
+
+
+def count(value):
+    """Row counts may be written as 1e6"""
+    return int(float(value))
+
+
+parser = argparse.ArgumentParser(description="Create the library database with sample or synthetic data")
+parser.add_argument("--db", default="library.db", help="Database file to (re)create (default: library.db)")
+parser.add_argument("--patrons", type=count, help="Generate this many students and guests")
+parser.add_argument("--books", type=count, help="Generate this many books")
+parser.add_argument("--txns", type=count, help="Generate this many loans")
+parser.add_argument("--days", type=int, default=3 * 365, help="Loans are spread over this many days up to today")
+parser.add_argument("--zipf", type=float, default=1.0, help="Skew of book popularity (0 = uniform)")
+parser.add_argument("--seed", type=int, default=1)
+args = parser.parse_args()
+generating = any(n is not None for n in (args.patrons, args.books, args.txns))
+
+# ===========================================
+# SYNTHETIC DATA (--patrons / --books / --txns)
+# ===========================================
+# Rows are streamed into the bare tables in chunks of GEN_CHUNK with
+# executemany, one large transaction per table (payments go in with the
+# patrons and loans they belong to). The indexes, triggers, FTS index,
+# Stats and Copies all come from migrations.migrate() afterwards, which
+# builds each of them once over the loaded data.
+GEN_CHUNK = 50000
+
+PAYMENT_SQL = "INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (?, ?, ?, ?)"
+
+FIRST_NAMES = ['Aisyah', 'Adam', 'Nurul', 'Daniel', 'Siti', 'Amir', 'Mei Ling', 'Arjun', 'Sofia', 'Hafiz',
+               'Priya', 'Wei Jie', 'Farah', 'Irfan', 'Chloe', 'Ravi', 'Zara', 'Haziq', 'Emma', 'Kumar',
+               'Liyana', 'Jason', 'Nadia', 'Syafiq', 'Grace', 'Aiman', 'Hana', 'Ethan', 'Intan', 'Lucas']
+LAST_NAMES = ['Rahman', 'Tan', 'Abdullah', 'Lim', 'Singh', 'Ismail', 'Wong', 'Hassan', 'Lee', 'Kaur',
+              'Ahmad', 'Chong', 'Yusof', 'Ng', 'Nair', 'Osman', 'Goh', 'Razak', 'Teo', 'Pillai',
+              'Smith', 'Garcia', 'Brown', 'Martin', 'Ibrahim', 'Chen', 'Zainal', 'Koh', 'Das', 'Omar']
+TITLE_WORDS = ['Silent', 'River', 'Shadow', 'Garden', 'Empire', 'Code', 'Night', 'Memory', 'Ocean', 'Winter',
+               'Secret', 'City', 'Stars', 'Data', 'Forest', 'Journey', 'Light', 'History', 'Mind', 'Island',
+               'Fire', 'Glass', 'Machine', 'Kingdom', 'Storm', 'Letters', 'Mountain', 'Atlas', 'Echo', 'Dream']
+GENRES = ['Classic', 'Fantasy', 'Technology', 'History', 'Thriller', 'Romance', 'Biography', 'Science',
+          'Young Adult', 'Self-help', 'Dystopian', 'Memoir', 'Psychology', 'Adventure', 'Mystery']
+BOOK_TYPES = ['Physical', 'E-book', 'Audiobook', 'Reference']
+BOOK_TYPE_WEIGHTS = [70, 15, 10, 5]
+CALL_PREFIX = {'Physical': 'FIC', 'E-book': 'E-FIC', 'Audiobook': 'AUD FIC', 'Reference': 'REF'}
+COMMENTS = ['Great book selection and helpful staff!', 'System is easy to use but could be faster.',
+            'Love the cozy reading area!', 'Found some outdated books, please update.',
+            'Payment process was smooth and secure.', 'Please open longer during exam weeks.',
+            'More e-books please.', 'The new genre categories are helpful for finding books!']
+
+# Loan lengths as (shortest, longest, weight) in days: most loans come back
+# inside the 14-day grace period, a tail runs weeks or months overdue
+LOAN_LENGTHS = [(1, 14, 75), (15, 30, 17), (31, 90, 7), (91, 365, 1)]
+
+
+def zipf_weights(n, s):
+    """Cumulative weights of ranks 1..n under a Zipf law with exponent s"""
+    return list(accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def overdue_fine(days_out):
+    """Fine under the default policy (migration 7 seeds the same rule)"""
+    return max(0, days_out - fines.GRACE_DAYS) * fines.DAILY_RATE
+
+
+def insert_chunks(conn, sql, rows, label, total):
+    """executemany over an iterator of rows, GEN_CHUNK at a time, in one transaction"""
+    started = time.perf_counter()
+    done = 0
+    chunk = []
+    conn.execute("BEGIN")
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == GEN_CHUNK:
+            conn.executemany(sql, chunk)
+            done += len(chunk)
+            chunk = []
+            if done % (20 * GEN_CHUNK) == 0:
+                print(f"   {label}: {done:,} / {total:,}")
+    conn.executemany(sql, chunk)
+    done += len(chunk)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"✅ {done:,} {label} in {elapsed:.1f}s ({done / elapsed if elapsed else 0:,.0f} rows/s)")
+    return done
+
+
+def generate(conn, first_patron_id):
+    """Fill the tables with args.patrons/books/txns rows of skewed, realistic data"""
+    rng = random.Random(args.seed)
+    n_patrons = args.patrons if args.patrons is not None else 1000
+    n_books = args.books if args.books is not None else 10000
+    n_txns = args.txns if args.txns is not None else 100000
+    days = args.days
+    first_day = date.today().toordinal() - days
+    day_str = [date.fromordinal(first_day + d).isoformat() for d in range(days + 1)]
+
+    # Payments are written inside the patron and loan transactions as they
+    # come up, GEN_CHUNK at a time, rather than held until the end
+    payments = []
+    n_payments = 0
+
+    def pay(patron_id, amount, payment_date, purpose):
+        nonlocal n_payments
+        payments.append((patron_id, amount, payment_date, purpose))
+        if len(payments) == GEN_CHUNK:
+            conn.executemany(PAYMENT_SQL, payments)
+            n_payments += len(payments)
+            payments.clear()
+
+    # Patrons: students and guests, each paying a membership fee when they join
+    patron_ids = list(range(first_patron_id, first_patron_id + n_patrons))
+
+    def patron_rows():
+        for patron_id in patron_ids:
+            role = 'Student' if rng.random() < 0.85 else 'Guest'
+            # Student login is by name, so names carry the id to stay unique
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {patron_id}"
+            email = f"{role.lower()}{patron_id}@{'edu.com' if role == 'Student' else 'mail.com'}"
+            joined = rng.randrange(days + 1)
+            pay(patron_id, 25.00, day_str[joined], 'Membership Fee')
+            yield (patron_id, name, role, email, f"{role.lower()}123", rng.randrange(50), 1)
+
+    insert_chunks(conn, """
+        INSERT INTO Patron (patron_id, name, role, email, password, login_count, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, patron_rows(), "patrons", n_patrons)
+
+    # Books: book_types[book_id - 1] is the index into BOOK_TYPES
+    book_types = bytearray(rng.choices(range(len(BOOK_TYPES)), BOOK_TYPE_WEIGHTS, k=n_books))
+    authors = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    author_weights = zipf_weights(len(authors), 1.0)
+
+    def book_rows():
+        for i in range(n_books):
+            book_id = i + 1
+            book_type = BOOK_TYPES[book_types[i]]
+            author = rng.choices(authors, cum_weights=author_weights)[0]
+            genre = rng.choice(GENRES)
+            title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 4)))
+            if book_type == 'Physical':
+                shelf = f"{genre} {chr(65 + book_id % 26)}{book_id % 9 + 1}"
+            elif book_type == 'Reference':
+                shelf = f"Reference G{book_id % 9 + 1}"
+            else:
+                shelf = 'Digital' if book_type == 'E-book' else 'Audio Section'
+            yield (book_id, title, author, f"978{book_id:010d}", rng.randint(1900, 2025), genre, book_type,
+                   f"{CALL_PREFIX[book_type]} {author.split()[-1][:3].upper()} {book_id:07d}", shelf, 1)
+
+    insert_chunks(conn, """
+        INSERT INTO Books (book_id, title, author, isbn, published_year, genre, type, call_number, shelf_location, available)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, book_rows(), "books", n_books)
+
+    # Loans: books by Zipfian popularity (ranks shuffled so popular titles
+    # are spread over the catalog), some patrons borrowing far more than
+    # others. Transaction ids follow borrow dates, as they do in production.
+    book_ranks = list(range(1, n_books + 1))
+    rng.shuffle(book_ranks)
+    book_weights = zipf_weights(n_books, args.zipf)
+    patron_ranks = patron_ids[:]
+    rng.shuffle(patron_ranks)
+    patron_weights = zipf_weights(n_patrons, 0.5)
+    length_weights = list(accumulate(weight for _, _, weight in LOAN_LENGTHS))
+    open_books, open_pairs = set(), set()
+
+    def loan_rows():
+        for start in range(0, n_txns, GEN_CHUNK):
+            k = min(GEN_CHUNK, n_txns - start)
+            books = rng.choices(book_ranks, cum_weights=book_weights, k=k)
+            patrons = rng.choices(patron_ranks, cum_weights=patron_weights, k=k)
+            lengths = rng.choices(LOAN_LENGTHS, cum_weights=length_weights, k=k)
+            for j in range(k):
+                borrow = (start + j) * days // n_txns
+                shortest, longest, _ = lengths[j]
+                returned = borrow + rng.randint(shortest, longest)
+                book_id, patron_id = books[j], patrons[j]
+                item_type = BOOK_TYPES[book_types[book_id - 1]]
+                if returned > days:
+                    # Still out today, unless the book's one copy (or this
+                    # patron's loan of it) is already out: then it came back today
+                    physical = item_type == 'Physical'
+                    if (physical and book_id in open_books) or (patron_id, book_id) in open_pairs:
+                        returned = days
+                    else:
+                        if physical:
+                            open_books.add(book_id)
+                        open_pairs.add((patron_id, book_id))
+                        yield (patron_id, book_id, day_str[borrow], None, overdue_fine(days - borrow), item_type)
+                        continue
+                fine = overdue_fine(returned - borrow)
+                if fine:
+                    # Most fines get paid in full around the return, some in part, the rest never
+                    paid = rng.random()
+                    pay_day = min(returned + rng.randrange(15), days)
+                    if paid < 0.7:
+                        pay(patron_id, fine, day_str[pay_day], 'Fine Payment')
+                    elif paid < 0.85:
+                        pay(patron_id, round(fine * rng.uniform(0.2, 0.8), 2), day_str[pay_day],
+                            'Partial Fine Payment')
+                yield (patron_id, book_id, day_str[borrow], day_str[returned], fine, item_type)
+
+    insert_chunks(conn, """
+        INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, loan_rows(), "transactions", n_txns)
+
+    # The copy of a physical book out on loan is not on the shelf
+    conn.execute("BEGIN")
+    conn.executemany("UPDATE Books SET available = 0 WHERE book_id = ?", ((b,) for b in open_books))
+    conn.executemany(PAYMENT_SQL, payments)
+    conn.commit()
+    print(f"✅ {n_payments + len(payments):,} payments (membership fees and fine payments)")
+
+    n_feedback = max(10, n_patrons // 100)
+    insert_chunks(conn, """
+        INSERT INTO Feedback (patron_id, feedback_date, comment, rating) VALUES (?, ?, ?, ?)
+    """, sorted(((rng.choice(patron_ids) if rng.random() < 0.8 else None, day_str[rng.randrange(days + 1)],
+                  rng.choice(COMMENTS), rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 5, 6])[0])
+                 for _ in range(n_feedback)), key=lambda f: f[1]), "feedbacks", n_feedback)
+    return len(open_pairs)
+
 
 # Delete old database if exists
-if os.path.exists('library.db'):
-    os.remove('library.db')
-    print("🗑️ Old database deleted")
+for suffix in ('', '-wal', '-shm', '-journal'):
+    if os.path.exists(args.db + suffix):
+        os.remove(args.db + suffix)
+        if not suffix:
+            print("🗑️ Old database deleted")
 
 # Create new database
-conn = sqlite3.connect('library.db')
+conn = sqlite3.connect(args.db)
 cursor = conn.cursor()
+if generating:
+    # A half-built file is simply deleted and regenerated, so skip durability while loading
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
 
 print("🔄 Creating database tables...")
 
@@ -98,7 +339,7 @@ print("✅ Tables created successfully!")
 # ===========================================
 # INSERT SAMPLE DATA
 # ===========================================
-print("📥 Inserting sample data...")
+print("📥 Generating synthetic data..." if generating else "📥 Inserting sample data...")
 
 # Get current date and calculate dates
 current_date = datetime.now()
@@ -149,6 +390,23 @@ INSERT INTO Patron (patron_id, name, role, email, password, login_count, is_acti
 VALUES (?, ?, ?, ?, ?, ?, ?)
 ''', patrons)
 
+if generating:
+    # The sample patrons above stay as the login accounts; everything else is generated
+    conn.commit()
+    started = time.perf_counter()
+    open_loans = generate(conn, max(p[0] for p in patrons) + 1)
+    loaded = time.perf_counter()
+    print("🔄 Building indexes, triggers and counters...")
+    migrations.migrate(conn, verbose=True)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    finished = time.perf_counter()
+    print(f"🎉 Database created successfully: {args.db} ({os.path.getsize(args.db) / 2 ** 20:,.0f} MB)")
+    print(f"   {open_loans:,} loans still out; load {loaded - started:.1f}s, "
+          f"indexes {finished - loaded:.1f}s, total {finished - started:.1f}s")
+    sys.exit(0)
+
 # Sample Books with new fields (genre, type, call_number, shelf_location)
 books = [
     # Format: (book_id, title, author, isbn, published_year, genre, type, call_number, shelf_location, available)
@@ -269,10 +527,13 @@ VALUES (?, ?, ?, ?)
 ''', feedbacks)
 
 conn.commit()
+
+# Indexes and later schema changes
+migrations.migrate(conn, verbose=True)
 conn.close()
 
 print(f"✅ Inserted {len(patrons)} patrons, {len(books)} books, {len(transactions)} transactions, {len(payments)} payments, {len(feedbacks)} feedbacks")
-print("🎉 Database created successfully: library.db")
+print(f"🎉 Database created successfully: {args.db}")
 print("\n📊 DATABASE SUMMARY:")
 print("=====================")
 print(f"📚 Total Books: {len(books)}")
@@ -301,4 +562,4 @@ print(f"One Month Ago: {one_month_ago_str}")
 
 
 print(f"✅ Inserted {len(patrons)} patrons, {len(books)} books, {len(transactions)} transactions, {len(payments)} payments, {len(feedbacks)} feedbacks")
-print("🎉 Database created successfully: library.db")
\ No newline at end of file
+print(f"🎉 Database created successfully: {args.db}")
\ No newline at end of file
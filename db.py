@@ -0,0 +1,192 @@
+# db.py
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("LIBRARY_DB", os.path.join(BASE_DIR, "library.db"))
+
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "8"))
+POOL_WARM = int(os.environ.get("LIBRARY_DB_POOL_WARM", "2"))
+POOL_TIMEOUT = float(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", "10"))
+CHECKPOINT_INTERVAL = float(os.environ.get("LIBRARY_DB_CHECKPOINT_INTERVAL", "300"))
+# Rows per fetchmany() call when a result is streamed instead of fetched whole
+FETCH_BATCH = int(os.environ.get("LIBRARY_DB_FETCH_BATCH", "100"))
+
+# Connection profile applied to every new connection. WAL lets readers of
+# /guest and /admin keep going while a borrow or payment is being written.
+PRAGMAS = {
+    'journal_mode': os.environ.get("LIBRARY_DB_JOURNAL_MODE", "WAL"),
+    'synchronous': os.environ.get("LIBRARY_DB_SYNCHRONOUS", "NORMAL"),
+    'busy_timeout': int(os.environ.get("LIBRARY_DB_BUSY_TIMEOUT", "5000")),
+    'cache_size': int(os.environ.get("LIBRARY_DB_CACHE_SIZE", "-16000")),  # negative = KiB
+    'mmap_size': int(os.environ.get("LIBRARY_DB_MMAP_SIZE", str(128 * 1024 * 1024))),
+    'temp_store': os.environ.get("LIBRARY_DB_TEMP_STORE", "MEMORY"),
+}
+
+
+def apply_pragmas(conn, pragmas=None):
+    """Apply a PRAGMA profile to a connection"""
+    for name, value in (PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+
+def connect(path=None, pragmas=None, factory=sqlite3.Connection):
+    """Open a new database connection with the PRAGMA profile applied"""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False, factory=factory)
+    conn.row_factory = sqlite3.Row
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+def iter_rows(conn, sql, params=(), size=FETCH_BATCH):
+    """Yield the rows of a query, fetching `size` at a time instead of all at once.
+
+    The query only runs when the first row is asked for.
+    """
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+# ==================== WAL CHECKPOINTS ====================
+def checkpoint(mode="PASSIVE", path=None):
+    """Fold the WAL back into the main database file"""
+    conn = connect(path)
+    try:
+        busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return {'busy': busy, 'log_frames': log_frames, 'checkpointed': checkpointed}
+    finally:
+        conn.close()
+
+
+def start_checkpointer(interval=CHECKPOINT_INTERVAL, path=None):
+    """Run a PASSIVE checkpoint every `interval` seconds on a daemon thread"""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                checkpoint("PASSIVE", path)
+            except sqlite3.Error as e:
+                print(f"Error checkpointing database: {e}")
+
+    thread = threading.Thread(target=run, name="db-checkpointer", daemon=True)
+    thread.start()
+    return thread
+
+
+# ==================== CONNECTION POOL ====================
+class ConnectionPool:
+    """Bounded pool of SQLite connections, one pool per worker process"""
+
+    def __init__(self, path=None, size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=None, factory=sqlite3.Connection):
+        self.path = path
+        self.pragmas = pragmas
+        # Connection class for new connections (profiling.ProfiledConnection when profiling)
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _check_pid(self):
+        # Connections must not cross a fork (gunicorn workers)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def warm(self, count=POOL_WARM):
+        """Open connections up front so the first requests don't pay for it"""
+        self._check_pid()
+        for _ in range(min(count, self.size)):
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(connect(self.path, self.pragmas, self.factory))
+
+    def acquire(self):
+        """Check out a connection, waiting if the pool is exhausted"""
+        self._check_pid()
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+                self.misses += 1
+        if can_create:
+            try:
+                return connect(self.path, self.pragmas, self.factory)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"Timed out after {self.timeout}s waiting for a database connection")
+        with self._lock:
+            self.waits += 1
+            self.wait_time += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        """Pool counters for monitoring"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': self._idle.qsize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'wait_time': round(self.wait_time, 6),
+            }
+
+
+pool = ConnectionPool()
@@ -0,0 +1,69 @@
+# etags.py
+# Per-table data versions and the weak ETags built from them.
+#
+# Every write to a versioned table bumps its row in DataVersions (triggers
+# from migration 11), so "has anything this page reads changed?" is one
+# small read. A page's ETag is a hash of the versions of the tables it
+# reads plus whatever else its HTML depends on (templates, who is logged
+# in, today's date); when the browser sends it back in If-None-Match and
+# nothing moved, the app answers 304 without running the view.
+import hashlib
+import threading
+
+TABLES = ('Patron', 'Books', 'Copies', 'Transactions', 'Payments', 'Feedback', 'Holds',
+          'FinePolicies', 'Holidays')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS DataVersions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+""" + "".join(f"""
+INSERT OR IGNORE INTO DataVersions (name) VALUES ('{table}');
+""" + "".join(f"""
+CREATE TRIGGER IF NOT EXISTS version_{table.lower()}_{op.lower()} AFTER {op} ON {table} BEGIN
+    UPDATE DataVersions SET version = version + 1 WHERE name = '{table}';
+END;
+""" for op in ('INSERT', 'UPDATE', 'DELETE')) for table in TABLES)
+
+
+def read_versions(conn, tables):
+    """{table: version} for the given tables"""
+    rows = conn.execute("SELECT name, version FROM DataVersions WHERE name IN ({})".format(
+        ','.join('?' * len(tables))), list(tables)).fetchall()
+    return {name: version for name, version in rows}
+
+
+def make_etag(versions, *parts):
+    """Opaque tag for a set of table versions and any other inputs of a page"""
+    h = hashlib.sha256()
+    for table in sorted(versions):
+        h.update(f"{table}={versions[table]};".encode())
+    for part in parts:
+        h.update(f"{part};".encode())
+    return h.hexdigest()[:20]
+
+
+class ETagStats:
+    """Conditional GET counters per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, outcome):
+        """outcome: 'not_modified' (304), 'revalidated' (If-None-Match sent, page changed) or 'fresh' (no tag sent)"""
+        with self._lock:
+            counts = self._routes.setdefault(endpoint, {'not_modified': 0, 'revalidated': 0, 'fresh': 0})
+            counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            routes = {name: dict(counts) for name, counts in self._routes.items()}
+        for counts in routes.values():
+            conditional = counts['not_modified'] + counts['revalidated']
+            counts['hit_ratio'] = round(counts['not_modified'] / conditional, 4) if conditional else 0.0
+        return routes
+
+
+counters = ETagStats()
@@ -0,0 +1,386 @@
+# fines.py
+# Fine policies, fine calculation and fine accrual for open loans.
+#
+# Grace periods, daily rates, caps and holiday calendars live in the
+# FinePolicies and Holidays tables, per item_type and patron role. They are
+# compiled into a PolicyTable (a dict lookup per item_type/role) once and
+# reloaded whenever FinePolicyVersion changes.
+#
+# Open loans only get their final fine written at return time, so between
+# borrow and return the `fine` column would go stale. accrue_fines() brings
+# every open loan up to date with set-based UPDATEs and is meant to run once
+# a day (python main.py accrue-fines).
+import os
+import sqlite3
+import time
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+import db
+
+try:
+    import numpy as np
+except ImportError:  # optional, the pure-Python path gives the same results
+    np = None
+
+GRACE_DAYS = 14
+DAILY_RATE = 1.0  # RM per day after the grace period
+
+JOB_NAME = "fine_accrual"
+
+# How often (seconds) to check FinePolicyVersion for edits
+RELOAD_INTERVAL = float(os.environ.get("LIBRARY_POLICY_RELOAD", "5"))
+
+
+# ==================== FINE POLICIES ====================
+class FinePolicy(namedtuple("FinePolicy", "grace_days daily_rate max_fine calendar holidays")):
+    """One compiled rule; holidays is a sorted tuple of day ordinals"""
+    __slots__ = ()
+
+    def charge(self, days, borrow_ordinal=None):
+        """Fine for a loan that ran `days` days"""
+        overdue = days - self.grace_days
+        if overdue <= 0:
+            return 0.0
+        if self.holidays and borrow_ordinal:
+            # Holidays after the due date are not charged
+            overdue -= self.holidays_between(borrow_ordinal + self.grace_days, borrow_ordinal + days)
+            if overdue <= 0:
+                return 0.0
+        fine = overdue * self.daily_rate
+        if self.max_fine is not None:
+            fine = min(fine, self.max_fine)
+        return round(fine, 2)
+
+    def holidays_between(self, start_ordinal, end_ordinal):
+        """Number of holidays in (start, end]"""
+        return bisect_right(self.holidays, end_ordinal) - bisect_right(self.holidays, start_ordinal)
+
+
+DEFAULT_POLICY = FinePolicy(GRACE_DAYS, DAILY_RATE, None, None, ())
+
+
+class PolicyTable:
+    """FinePolicies rows compiled into a (item_type, role) -> FinePolicy dict.
+
+    A NULL item_type or role in a rule matches anything; the most specific
+    rule wins (item_type+role, then item_type, then role, then the default).
+    """
+
+    def __init__(self, rules=(), calendars=None, version=None):
+        self.version = version
+        calendars = calendars or {}
+        self.rules = {}
+        for item_type, role, grace_days, daily_rate, max_fine, calendar in rules:
+            holidays = tuple(sorted(calendars.get(calendar, ())))
+            self.rules[(item_type, role)] = FinePolicy(grace_days, daily_rate, max_fine, calendar, holidays)
+        self.default = self.rules.get((None, None), DEFAULT_POLICY)
+        self._lookup = {}
+
+    def lookup(self, item_type=None, role=None):
+        """FinePolicy for a loan of `item_type` by a patron with `role`"""
+        key = (item_type, role)
+        try:
+            return self._lookup[key]
+        except KeyError:
+            pass
+        rules = self.rules
+        policy = (rules.get(key) or rules.get((item_type, None))
+                  or rules.get((None, role)) or self.default)
+        self._lookup[key] = policy
+        return policy
+
+
+_policies = PolicyTable()
+_checked_at = 0.0
+
+
+def policy_version(conn):
+    """Current FinePolicyVersion, None if the tables do not exist yet"""
+    try:
+        row = conn.execute("SELECT version FROM FinePolicyVersion WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else 0
+
+
+def load_policies(conn=None):
+    """Compile FinePolicies/Holidays into a PolicyTable and make it current"""
+    global _policies, _checked_at
+    own = conn is None
+    if own:
+        conn = db.connect()
+    try:
+        version = policy_version(conn)
+        if version is None:
+            table = PolicyTable()
+        else:
+            calendars = {}
+            for calendar, holiday in conn.execute("SELECT calendar, holiday_date FROM Holidays"):
+                try:
+                    ordinal = datetime.strptime(holiday, "%Y-%m-%d").toordinal()
+                except (TypeError, ValueError):
+                    continue
+                calendars.setdefault(calendar, []).append(ordinal)
+            rules = conn.execute("""
+                SELECT item_type, role, grace_days, daily_rate, max_fine, calendar
+                FROM FinePolicies ORDER BY policy_id
+            """).fetchall()
+            table = PolicyTable([tuple(r) for r in rules], calendars, version)
+    finally:
+        if own:
+            conn.close()
+    _policies, _checked_at = table, time.monotonic()
+    return table
+
+
+def policies(conn=None):
+    """The compiled PolicyTable, reloaded if the policy tables changed"""
+    global _checked_at
+    if time.monotonic() - _checked_at < RELOAD_INTERVAL:
+        return _policies
+    own = conn is None
+    if own:
+        conn = db.connect()
+    try:
+        if policy_version(conn) != _policies.version:
+            return load_policies(conn)
+        _checked_at = time.monotonic()
+        return _policies
+    finally:
+        if own:
+            conn.close()
+
+
+# ==================== FINE CALCULATION ====================
+def _ordinal(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").toordinal()
+    return value.toordinal()
+
+
+def loan_days(borrow_date, return_date=None):
+    """Days between borrow and return (or now), None if a date is unusable"""
+    try:
+        if isinstance(borrow_date, str):
+            borrow_date = datetime.strptime(borrow_date, "%Y-%m-%d")
+
+        if return_date:
+            if isinstance(return_date, str):
+                return_date = datetime.strptime(return_date, "%Y-%m-%d")
+            return (return_date - borrow_date).days
+        return (datetime.now() - borrow_date).days
+    except:
+        return None
+
+
+def calculate_fine(borrow_date, return_date=None, item_type=None, role=None, conn=None):
+    """Calculate fine based on borrow date, item type and patron role"""
+    days_diff = loan_days(borrow_date, return_date)
+    if days_diff is None:
+        return 0.0
+    policy = policies(conn).lookup(item_type, role)
+    return policy.charge(days_diff, _ordinal(borrow_date))
+
+
+# ==================== BULK CALCULATION ====================
+# Overdue reports need the fine for thousands of loans at once. Calling
+# calculate_fine() per row re-parses the same few hundred distinct dates over
+# and over; calculate_fines() parses each distinct date once into a day
+# ordinal and does the arithmetic on whole columns.
+FineBatch = namedtuple("FineBatch", "days overdue_days fines")
+
+_INVALID = None    # unparseable: 0 days, no fine (same as calculate_fine)
+_SCALAR = False    # datetime objects etc: computed with loan_days() instead
+
+
+def _ordinals(values, today, cache):
+    """Day ordinals for a column of dates, each distinct string parsed once"""
+    out = []
+    for v in values:
+        if not v and today is not None:
+            o = today  # not returned yet ("" too, as in calculate_fine)
+        elif isinstance(v, str):
+            o = cache.get(v, cache)
+            if o is cache:
+                try:
+                    o = datetime.strptime(v, "%Y-%m-%d").toordinal()
+                except ValueError:
+                    o = _INVALID
+                cache[v] = o
+        else:
+            o = _SCALAR
+        out.append(o)
+    return out
+
+
+def calculate_fines(borrow_dates, return_dates=None, today=None, item_types=None, roles=None, conn=None):
+    """Fines for whole columns of loans at once.
+
+    `borrow_dates` and `return_dates` are equal-length sequences (lists,
+    tuples, NumPy arrays) of 'YYYY-MM-DD' strings; an empty/None return date
+    means the book is still out and counts up to `today` (default: now).
+    `item_types` and `roles` pick the fine policy per row (the default
+    policy if omitted). Returns FineBatch(days, overdue_days, fines) as
+    arrays aligned with the input, matching calculate_fine() row for row;
+    overdue_days counts calendar days past the grace period. NumPy is used
+    for the arithmetic when it is installed.
+    """
+    n = len(borrow_dates)
+    if return_dates is None:
+        return_dates = [None] * n
+    if len(return_dates) != n:
+        raise ValueError("borrow_dates and return_dates must be the same length")
+    today = datetime.strptime(today, "%Y-%m-%d") if today else datetime.now()
+
+    cache = {}
+    borrow = _ordinals(borrow_dates, None, cache)
+    returned = _ordinals(return_dates, today.toordinal(), cache)
+
+    if np is not None:
+        b = np.array([o or 0 for o in borrow], dtype=np.int64)
+        r = np.array([o or 0 for o in returned], dtype=np.int64)
+        ok = np.array([bool(x) and bool(y) for x, y in zip(borrow, returned)], dtype=bool)
+        days = np.where(ok, r - b, 0).tolist()
+    else:
+        days = [y - x if x and y else 0 for x, y in zip(borrow, returned)]
+
+    for i in range(n):
+        if borrow[i] is _SCALAR or returned[i] is _SCALAR:
+            days[i] = loan_days(borrow_dates[i], return_dates[i] or today) or 0
+            borrow[i] = _ordinal(borrow_dates[i]) if days[i] else None
+
+    table = policies(conn)
+    if item_types is None and roles is None:
+        row_policies = None
+        policy = table.default
+    else:
+        item_types = item_types if item_types is not None else [None] * n
+        roles = roles if roles is not None else [None] * n
+        row_policies = [table.lookup(t, r) for t, r in zip(item_types, roles)]
+        policy = row_policies[0] if len(set(row_policies)) == 1 else None
+
+    if policy is not None and not policy.holidays:
+        # One policy and no holidays: plain column arithmetic
+        grace, rate, cap = policy.grace_days, policy.daily_rate, policy.max_fine
+        if np is not None:
+            overdue = np.maximum(np.array(days, dtype=np.int64) - grace, 0)
+            charged = overdue * rate
+            if cap is not None:
+                charged = np.minimum(charged, cap)
+            overdue, charged = overdue.tolist(), charged.tolist()
+        else:
+            overdue = [d - grace if d > grace else 0 for d in days]
+            charged = [o * rate for o in overdue]
+            if cap is not None:
+                charged = [min(c, cap) for c in charged]
+        fine_values = [round(c, 2) if c else 0.0 for c in charged]
+    else:
+        row_policies = row_policies or [policy] * n
+        overdue = [max(d - p.grace_days, 0) for d, p in zip(days, row_policies)]
+        fine_values = [p.charge(d, b) for d, b, p in zip(days, borrow, row_policies)]
+
+    return FineBatch(array('q', days), array('q', overdue), array('d', fine_values))
+
+
+# ==================== FINE ACCRUAL ====================
+def get_watermark(conn, job=JOB_NAME):
+    """(run_date, last_txn_id) of the job's last successful run, or None"""
+    row = conn.execute("SELECT run_date, last_txn_id FROM JobWatermarks WHERE job=?", (job,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def set_watermark(conn, run_date, last_txn_id, job=JOB_NAME):
+    conn.execute("""
+        INSERT INTO JobWatermarks (job, run_date, last_txn_id) VALUES (?, ?, ?)
+        ON CONFLICT(job) DO UPDATE SET run_date=excluded.run_date, last_txn_id=excluded.last_txn_id
+    """, (job, run_date, last_txn_id))
+
+
+def _accrue_group(conn, policy, item_type, role, today, watermark):
+    """Accrual UPDATEs for the open loans of one item_type/role pair"""
+    grace = f"-{policy.grace_days + 1} days"
+    group = """AND item_type IS ?
+              AND (SELECT role FROM Patron WHERE patron_id = Transactions.patron_id) IS ?"""
+    continuing = 0
+    if watermark:
+        last_date, last_id = watermark
+        # Already overdue on the last run: add the days elapsed since then
+        charged_days = _ordinal(today) - _ordinal(last_date)
+        charged_days -= policy.holidays_between(_ordinal(last_date), _ordinal(today))
+        continuing = conn.execute(f"""
+            UPDATE Transactions
+            SET fine = MIN(COALESCE(fine, 0) + ? * ?, COALESCE(?, 1e300))
+            WHERE return_date IS NULL
+              AND borrow_date <= date(?, ?)
+              AND transaction_id <= ?
+              AND julianday(borrow_date) IS NOT NULL
+              {group}
+        """, (policy.daily_rate, charged_days, policy.max_fine,
+              last_date, grace, last_id, item_type, role)).rowcount
+        # Everything else that is overdue now crossed the threshold since then
+        scope = "AND (borrow_date > date(?, ?) OR transaction_id > ?)"
+        scope_args = (last_date, grace, last_id)
+    else:
+        scope, scope_args = "", ()
+
+    newly_overdue = conn.execute(f"""
+        UPDATE Transactions
+        SET fine = MIN(
+            ? * (CAST(julianday(?) - julianday(borrow_date) AS INTEGER) - ?
+                 - (SELECT COUNT(*) FROM Holidays
+                    WHERE calendar = ? AND holiday_date > date(borrow_date, ?) AND holiday_date <= ?)),
+            COALESCE(?, 1e300))
+        WHERE return_date IS NULL
+          AND borrow_date <= date(?, ?)
+          AND julianday(borrow_date) IS NOT NULL
+          {group}
+          {scope}
+    """, (policy.daily_rate, today, policy.grace_days, policy.calendar, f"+{policy.grace_days} days",
+          today, policy.max_fine, today, grace, item_type, role) + scope_args).rowcount
+    return continuing, newly_overdue
+
+
+def accrue_fines(conn, today=None, full=False):
+    """Bring fines on open loans up to `today` (YYYY-MM-DD, default: now).
+
+    Loans that were already overdue at the last run (and existed then) only
+    get the days since that run added. Loans that crossed the grace period
+    since then, or were created after it, get their fine computed from the
+    borrow date. Each item_type/role pair is charged by its own fine policy,
+    caps and holidays included. `full=True` recomputes every overdue loan
+    from scratch (do that after editing a policy). Returns a dict with how
+    many rows each part touched.
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    watermark = None if full else get_watermark(conn)
+    if watermark and watermark[0] >= today:
+        return {'date': today, 'continuing': 0, 'newly_overdue': 0, 'skipped': True}
+
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        table = load_policies(conn)
+        last_txn_id = conn.execute("SELECT COALESCE(MAX(transaction_id), 0) FROM Transactions").fetchone()[0]
+        groups = conn.execute("""
+            SELECT DISTINCT t.item_type, p.role
+            FROM Transactions t LEFT JOIN Patron p ON p.patron_id = t.patron_id
+            WHERE t.return_date IS NULL
+        """).fetchall()
+        continuing = newly_overdue = 0
+        for item_type, role in groups:
+            c, n = _accrue_group(conn, table.lookup(item_type, role), item_type, role, today, watermark)
+            continuing += c
+            newly_overdue += n
+
+        set_watermark(conn, today, last_txn_id)
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return {'date': today, 'continuing': continuing, 'newly_overdue': newly_overdue, 'skipped': False}
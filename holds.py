@@ -0,0 +1,167 @@
+# holds.py
+# Hold (reservation) queue for physical books that are out on loan.
+#
+# Waiting holds form a per-book queue ordered by (priority DESC, hold_id),
+# served by the partial index idx_holds_queue, so finding the next holder
+# is one index seek however long the queue gets. When a copy comes back it
+# goes to the next holder (copy 'on_hold', hold 'ready') inside the return's
+# own transaction instead of back on the shelf. Holds not collected within
+# PICKUP_DAYS are expired by expire_holds() and the copy moves on.
+import os
+from datetime import datetime
+
+PICKUP_DAYS = int(os.environ.get("LIBRARY_HOLD_PICKUP_DAYS", "3"))
+
+# place_hold() statuses
+PLACED = "placed"
+NOT_FOUND = "not_found"
+NOT_HOLDABLE = "not_holdable"
+AVAILABLE = "available"
+ALREADY_HELD = "already_held"
+ALREADY_BORROWED = "already_borrowed"
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def next_hold(conn, book_id):
+    """The next waiting hold for a book (hold_id, patron_id), or None"""
+    return conn.execute("""
+        SELECT hold_id, patron_id FROM Holds
+        WHERE book_id = ? AND status = 'waiting'
+        ORDER BY priority DESC, hold_id LIMIT 1
+    """, (book_id,)).fetchone()
+
+
+def dispatch_copy(conn, book_id, copy_id, today=None):
+    """Give a copy to the next waiting holder, returns the hold or None.
+
+    Must run inside the caller's write transaction.
+    """
+    hold = next_hold(conn, book_id)
+    if not hold:
+        return None
+    today = today or _today()
+    conn.execute("UPDATE Copies SET status = 'on_hold' WHERE copy_id = ?", (copy_id,))
+    conn.execute("""
+        UPDATE Holds SET status = 'ready', copy_id = ?, ready_date = ?, expires_date = date(?, ?)
+        WHERE hold_id = ?
+    """, (copy_id, today, today, f"+{PICKUP_DAYS} days", hold['hold_id']))
+    return hold
+
+
+def release_copy(conn, book_id, copy_id, today=None):
+    """A copy is free again: next holder if anyone is waiting, else the shelf"""
+    if not dispatch_copy(conn, book_id, copy_id, today):
+        conn.execute("UPDATE Copies SET status = 'available' WHERE copy_id = ?", (copy_id,))
+
+
+def ready_hold(conn, patron_id, book_id):
+    """The patron's active hold on a book (hold_id, status, copy_id), or None"""
+    return conn.execute("""
+        SELECT hold_id, status, copy_id FROM Holds
+        WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')
+    """, (patron_id, book_id)).fetchone()
+
+
+def place_hold(conn, patron_id, book_id, today=None):
+    """Join the queue for a book, returns a dict with 'status' and 'hold_id'"""
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        book = conn.execute("SELECT type, available_count FROM Books WHERE book_id = ?", (book_id,)).fetchone()
+        existing = ready_hold(conn, patron_id, book_id) if book else None
+        if not book:
+            result = {'status': NOT_FOUND}
+        elif book['type'] != 'Physical':
+            result = {'status': NOT_HOLDABLE}
+        elif existing:
+            result = {'status': ALREADY_HELD, 'hold_id': existing['hold_id']}
+        elif book['available_count'] > 0:
+            result = {'status': AVAILABLE}
+        elif conn.execute("""
+                SELECT 1 FROM Transactions WHERE book_id = ? AND patron_id = ? AND return_date IS NULL
+             """, (book_id, patron_id)).fetchone():
+            result = {'status': ALREADY_BORROWED}
+        else:
+            hold_id = conn.execute("""
+                INSERT INTO Holds (book_id, patron_id, status, placed_date) VALUES (?, ?, 'waiting', ?)
+            """, (book_id, patron_id, today or _today())).lastrowid
+            result = {'status': PLACED, 'hold_id': hold_id}
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return result
+
+
+def cancel_hold(conn, hold_id, patron_id, today=None):
+    """Cancel a patron's hold; a copy waiting for them goes to the next in line"""
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        hold = conn.execute("""
+            SELECT book_id, status, copy_id FROM Holds
+            WHERE hold_id = ? AND patron_id = ? AND status IN ('waiting', 'ready')
+        """, (hold_id, patron_id)).fetchone()
+        if hold:
+            conn.execute("UPDATE Holds SET status = 'cancelled' WHERE hold_id = ?", (hold_id,))
+            if hold['status'] == 'ready':
+                release_copy(conn, hold['book_id'], hold['copy_id'], today)
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return hold is not None
+
+
+def expire_holds(conn, today=None):
+    """Expire ready holds past their pickup date, returns how many expired"""
+    today = today or _today()
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        expired = conn.execute("""
+            SELECT hold_id, book_id, copy_id FROM Holds
+            WHERE status = 'ready' AND expires_date < ?
+            ORDER BY expires_date
+        """, (today,)).fetchall()
+        for hold in expired:
+            conn.execute("UPDATE Holds SET status = 'expired' WHERE hold_id = ?", (hold['hold_id'],))
+            release_copy(conn, hold['book_id'], hold['copy_id'], today)
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return len(expired)
+
+
+def patron_holds(conn, patron_id):
+    """A patron's active holds with book titles and queue positions"""
+    holds = conn.execute("""
+        SELECT h.*, b.title, b.author FROM Holds h
+        JOIN Books b ON b.book_id = h.book_id
+        WHERE h.patron_id = ? AND h.status IN ('waiting', 'ready')
+        ORDER BY h.hold_id
+    """, (patron_id,)).fetchall()
+    result = []
+    for h in holds:
+        position = None
+        if h['status'] == 'waiting':
+            position = 1 + conn.execute("""
+                SELECT COUNT(*) FROM Holds
+                WHERE book_id = ? AND status = 'waiting'
+                  AND (priority > ? OR (priority = ? AND hold_id < ?))
+            """, (h['book_id'], h['priority'], h['priority'], h['hold_id'])).fetchone()[0]
+        result.append((h, position))
+    return result
@@ -0,0 +1,245 @@
+# loans.py
+# Borrowing and returning, shared by the web app and the CLI.
+#
+# Physical books are lent copy by copy (Copies table). Claiming a copy is a
+# conditional UPDATE inside BEGIN IMMEDIATE, so two students borrowing the
+# last copy at once get exactly one winner; triggers keep
+# Books.available_count and Books.available in step with the copies.
+# Returned copies go to the next hold in line first (see holds.py).
+import holds
+
+# borrow_book() statuses
+BORROWED = "borrowed"
+NOT_FOUND = "not_found"
+UNAVAILABLE = "unavailable"
+ALREADY_BORROWED = "already_borrowed"
+
+# IDs per IN (...) lookup in the batch functions
+CHUNK = 500
+
+
+def _open_loan(conn, patron_id, book_id):
+    return conn.execute("""
+        SELECT transaction_id, borrow_date FROM Transactions
+        WHERE book_id = ? AND patron_id = ? AND return_date IS NULL
+    """, (book_id, patron_id)).fetchone()
+
+
+def _claim_copy(conn, book_id):
+    """Mark one available copy of a book as on loan, returns its copy_id or None"""
+    copy = conn.execute("""
+        SELECT copy_id FROM Copies WHERE book_id = ? AND status = 'available' LIMIT 1
+    """, (book_id,)).fetchone()
+    if not copy:
+        return None
+    claimed = conn.execute("""
+        UPDATE Copies SET status = 'on_loan' WHERE copy_id = ? AND status = 'available'
+    """, (copy['copy_id'],)).rowcount
+    return copy['copy_id'] if claimed else None
+
+
+def borrow_book(conn, patron_id, book_id, borrow_date):
+    """Borrow a book for a patron in one write transaction.
+
+    Returns a dict with 'status' (BORROWED, NOT_FOUND, UNAVAILABLE or
+    ALREADY_BORROWED) plus 'transaction_id', 'item_type', 'copy_id' and,
+    when the patron already has it, the existing 'borrow_date'.
+    """
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        book = conn.execute("SELECT type FROM Books WHERE book_id = ?", (book_id,)).fetchone()
+        result = None
+        copy_id = None
+        if not book:
+            result = {'status': NOT_FOUND}
+        else:
+            item_type = book['type']
+            existing = _open_loan(conn, patron_id, book_id)
+            if existing:
+                result = {'status': ALREADY_BORROWED, 'transaction_id': existing['transaction_id'],
+                          'borrow_date': existing['borrow_date'], 'item_type': item_type}
+            elif item_type == 'Physical':
+                hold = holds.ready_hold(conn, patron_id, book_id)
+                if hold and hold['status'] == 'ready':
+                    # Collecting a copy that was set aside for this patron
+                    copy_id = hold['copy_id']
+                    conn.execute("UPDATE Copies SET status = 'on_loan' WHERE copy_id = ?", (copy_id,))
+                else:
+                    # Only one writer at a time gets here, and the claim is conditional
+                    copy_id = _claim_copy(conn, book_id)
+                if copy_id is None:
+                    result = {'status': UNAVAILABLE, 'item_type': item_type}
+                elif hold:
+                    conn.execute("UPDATE Holds SET status = 'collected' WHERE hold_id = ?", (hold['hold_id'],))
+        if result:
+            if own_txn:
+                conn.rollback()
+            return result
+
+        txn_id = conn.execute("""
+            INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type, copy_id)
+            VALUES (?, ?, ?, NULL, 0, ?, ?)
+        """, (patron_id, book_id, borrow_date, item_type, copy_id)).lastrowid
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return {'status': BORROWED, 'transaction_id': txn_id, 'item_type': item_type, 'copy_id': copy_id}
+
+
+def return_loan(conn, transaction_id, return_date, fine):
+    """Close an open loan and pass its copy to the next holder or the shelf.
+
+    Returns False if the loan does not exist or was already returned.
+    """
+    return return_loans(conn, [(transaction_id, return_date, fine)]) == 1
+
+
+def return_loans(conn, returns):
+    """Close many open loans in one write transaction, returns how many were closed.
+
+    `returns` is a list of (transaction_id, return_date, fine); loans that
+    do not exist or are already returned are skipped.
+    """
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        loans = {}
+        ids = list({r[0] for r in returns})
+        for start in range(0, len(ids), CHUNK):
+            chunk = ids[start:start + CHUNK]
+            loans.update((row['transaction_id'], row) for row in conn.execute("""
+                SELECT transaction_id, book_id, item_type, copy_id FROM Transactions
+                WHERE return_date IS NULL AND transaction_id IN ({})
+            """.format(','.join('?' * len(chunk))), chunk))
+        # First return of a loan wins if it is listed twice
+        closing = {}
+        for transaction_id, return_date, fine in returns:
+            if transaction_id in loans and transaction_id not in closing:
+                closing[transaction_id] = (return_date, fine)
+        conn.executemany("""
+            UPDATE Transactions SET return_date = ?, fine = ?
+            WHERE transaction_id = ?
+        """, [(return_date, fine, transaction_id) for transaction_id, (return_date, fine) in closing.items()])
+        for transaction_id, (return_date, fine) in closing.items():
+            txn = loans[transaction_id]
+            copy_id = txn['copy_id']
+            if copy_id is None and txn['item_type'] == 'Physical':
+                # Loans from before copies were tracked: release any copy on loan
+                copy = conn.execute("""
+                    SELECT copy_id FROM Copies WHERE book_id = ? AND status = 'on_loan' LIMIT 1
+                """, (txn['book_id'],)).fetchone()
+                copy_id = copy['copy_id'] if copy else None
+            if copy_id is not None:
+                holds.release_copy(conn, txn['book_id'], copy_id, return_date)
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return len(closing)
+
+
+def record_returned_loan(conn, patron_id, book_id, borrow_date, return_date, fine, item_type):
+    """Add a loan that is already over (a back-dated record), returns its transaction_id.
+
+    No copy changes hands, so Copies and availability are left alone; open
+    loans go through borrow_book().
+    """
+    txn_id = conn.execute("""
+        INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (patron_id, book_id, borrow_date, return_date, fine, item_type)).lastrowid
+    conn.commit()
+    return txn_id
+
+
+def delete_loan(conn, transaction_id, today):
+    """Delete a loan record in one write transaction, returns False if there is none.
+
+    An open loan is closed first (as returned `today`, no fine) so its copy
+    goes back to the next holder or the shelf instead of staying on loan.
+    """
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        return_loans(conn, [(transaction_id, today, 0)])
+        deleted = conn.execute("DELETE FROM Transactions WHERE transaction_id = ?", (transaction_id,)).rowcount
+        if own_txn:
+            conn.commit()
+    except Exception:
+        if own_txn:
+            conn.rollback()
+        raise
+    return deleted == 1
+
+
+def find_open_loan(conn, transaction_id=None, barcode=None):
+    """The open loan with this transaction_id, or the one the copy with this barcode is out on.
+
+    The row carries the borrower's name and role (for the fine policy) and
+    the copy's barcode; None if there is no such open loan.
+    """
+    if transaction_id is not None:
+        return conn.execute("""
+            SELECT t.*, p.name AS patron_name, p.role, c.barcode FROM Transactions t
+            LEFT JOIN Patron p ON p.patron_id = t.patron_id
+            LEFT JOIN Copies c ON c.copy_id = t.copy_id
+            WHERE t.transaction_id = ? AND t.return_date IS NULL
+        """, (transaction_id,)).fetchone()
+    return conn.execute("""
+        SELECT t.*, p.name AS patron_name, p.role, c.barcode FROM Copies c
+        JOIN Transactions t ON t.copy_id = c.copy_id AND t.return_date IS NULL
+        LEFT JOIN Patron p ON p.patron_id = t.patron_id
+        WHERE c.barcode = ?
+    """, (barcode,)).fetchone()
+
+
+def open_loans(conn, book_id):
+    """Every open loan of a book with borrower and copy barcode, oldest first"""
+    return conn.execute("""
+        SELECT t.transaction_id, t.patron_id, t.borrow_date, t.fine, p.name AS patron_name, c.barcode
+        FROM Transactions t
+        LEFT JOIN Patron p ON p.patron_id = t.patron_id
+        LEFT JOIN Copies c ON c.copy_id = t.copy_id
+        WHERE t.book_id = ? AND t.return_date IS NULL
+        ORDER BY t.transaction_id
+    """, (book_id,)).fetchall()
+
+
+def add_copies(conn, book_id, count=1, shelf_location=None):
+    """Add `count` available copies of a book, returns their barcodes"""
+    book = conn.execute("""
+        SELECT shelf_location, (SELECT COUNT(*) FROM Copies WHERE book_id = b.book_id) AS copies
+        FROM Books b WHERE book_id = ?
+    """, (book_id,)).fetchone()
+    if not book:
+        return []
+    barcodes = []
+    n = book['copies']
+    while len(barcodes) < count:
+        n += 1
+        barcode = f"BK{int(book_id):06d}-{n}"
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO Copies (barcode, book_id, status, shelf_location) VALUES (?, ?, 'available', ?)
+        """, (barcode, book_id, shelf_location or book['shelf_location']))
+        if cursor.rowcount:
+            barcodes.append(barcode)
+            holds.dispatch_copy(conn, book_id, cursor.lastrowid)
+    conn.commit()
+    return barcodes
+
+
+def copy_counts(conn, book_id):
+    """(available, total) copies of a book"""
+    row = conn.execute("""
+        SELECT SUM(status = 'available') AS available, COUNT(*) AS total FROM Copies WHERE book_id = ?
+    """, (book_id,)).fetchone()
+    return row['available'] or 0, row['total']
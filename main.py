@@ -1,8 +1,20 @@
+import argparse
+import csv
+import json
 import sqlite3
 import sys
 import os
+import time
 from datetime import datetime, timedelta
 from getpass import getpass
+from itertools import chain
+
+import fines
+import holds
+import loans
+import migrations
+import search
+import stats
 
 def get_db():
     """Create database connection"""
@@ -10,7 +22,7 @@ def get_db():
     conn.row_factory = sqlite3.Row
     return conn
 
-def initialize_database():
+def initialize_database(quiet=False):
     """Initialize database tables if they don't exist"""
     conn = get_db()
     cursor = conn.cursor()
@@ -112,29 +124,12 @@ def initialize_database():
         )
     
     conn.commit()
+    # A half-read SELECT on the connection would make the migrations' DROP TABLE fail
+    cursor.close()
+    migrations.migrate(conn)
     conn.close()
-    print("✅ Database initialized successfully!")
-
-def calculate_fine(borrow_date, return_date=None):
-    """Calculate fine based on borrow date"""
-    try:
-        if isinstance(borrow_date, str):
-            borrow_date = datetime.strptime(borrow_date, "%Y-%m-%d")
-        
-        if return_date:
-            if isinstance(return_date, str):
-                return_date = datetime.strptime(return_date, "%Y-%m-%d")
-            days_diff = (return_date - borrow_date).days
-        else:
-            days_diff = (datetime.now() - borrow_date).days
-        
-        # Fine calculation: RM 1 per day after 14 days
-        if days_diff > 14:
-            fine = (days_diff - 14) * 1.0
-            return round(fine, 2)
-        return 0.0
-    except:
-        return 0.0
+    if not quiet:
+        print("✅ Database initialized successfully!")
 
 def get_patron_total_fine(patron_id):
     """Get total fine for a patron"""
@@ -518,12 +513,14 @@ def create_transaction():
         return
     
     try:
-        cursor.execute("""
-            INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type) 
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (patron_id, book_id, borrow_date, None, 0, book['type']))
-        conn.commit()
-        print("\n✅ Transaction created successfully!")
+        # An open loan claims a copy like any other borrow
+        result = loans.borrow_book(conn, patron['patron_id'], book['book_id'], borrow_date)
+        if result['status'] == loans.BORROWED:
+            print("\n✅ Transaction created successfully!")
+        elif result['status'] == loans.ALREADY_BORROWED:
+            print(f"\n❌ Patron already has this book on loan (since {result['borrow_date']})!")
+        else:
+            print("\n❌ No copy of this book is available!")
     except Exception as e:
         print(f"\n❌ Error: {e}")
     
@@ -565,6 +562,15 @@ def update_transaction():
     return_date = input(f"New return date (press Enter to keep current): ").strip()
     fine = input(f"New fine amount (press Enter to keep {transaction['fine']}): ").strip()
     
+    is_open = transaction['return_date'] is None
+    
+    # An open loan holds a copy of its book: return it, don't move it
+    if is_open and book_id and int(book_id) != transaction['book_id']:
+        print("\n❌ Return this loan before changing its book!")
+        conn.close()
+        input("Press Enter to continue...")
+        return
+    
     updates = []
     params = []
     
@@ -577,9 +583,9 @@ def update_transaction():
     if borrow_date:
         updates.append("borrow_date = ?")
         params.append(borrow_date)
-    if return_date is not None:
+    if return_date and not is_open:
         updates.append("return_date = ?")
-        params.append(return_date if return_date else None)
+        params.append(return_date)
     if fine:
         updates.append("fine = ?")
         params.append(float(fine))
@@ -589,6 +595,10 @@ def update_transaction():
         query = f"UPDATE Transactions SET {', '.join(updates)} WHERE transaction_id = ?"
         cursor.execute(query, params)
         conn.commit()
+    if is_open and return_date:
+        # Closing the loan passes its copy on, as a return at the desk does
+        loans.return_loans(conn, [(int(txn_id), return_date, float(fine) if fine else transaction['fine'])])
+    if updates or (is_open and return_date):
         print("\n✅ Transaction updated successfully!")
     else:
         print("\n⚠️ No changes made.")
@@ -613,12 +623,10 @@ def delete_transaction():
         return
     
     conn = get_db()
-    cursor = conn.cursor()
     
     try:
-        cursor.execute("DELETE FROM Transactions WHERE transaction_id = ?", (txn_id,))
-        conn.commit()
-        if cursor.rowcount > 0:
+        # An open loan's copy goes back to the shelf (or the next hold) first
+        if loans.delete_loan(conn, int(txn_id), datetime.now().strftime("%Y-%m-%d")):
             print("\n✅ Transaction deleted successfully!")
         else:
             print("\n❌ Transaction not found!")
@@ -633,55 +641,27 @@ def view_system_statistics():
     display_title("SYSTEM STATISTICS")
     
     conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total patrons
-    cursor.execute("SELECT COUNT(*) as count FROM Patron")
-    total_patrons = cursor.fetchone()['count']
-    
-    # Total books
-    cursor.execute("SELECT COUNT(*) as count FROM Books")
-    total_books = cursor.fetchone()['count']
-    
-    # Available books
-    cursor.execute("SELECT COUNT(*) as count FROM Books WHERE available = 1")
-    available_books = cursor.fetchone()['count']
-    
-    # Borrowed books
-    cursor.execute("SELECT COUNT(*) as count FROM Books WHERE available = 0")
-    borrowed_books = cursor.fetchone()['count']
-    
-    # Total transactions
-    cursor.execute("SELECT COUNT(*) as count FROM Transactions")
-    total_transactions = cursor.fetchone()['count']
-    
-    # Total fines
-    cursor.execute("SELECT SUM(fine) as total FROM Transactions")
-    total_fines = cursor.fetchone()['total'] or 0
-    
-    print(f"Total Patrons: {total_patrons}")
-    print(f"Total Books: {total_books}")
-    print(f"Available Books: {available_books}")
-    print(f"Borrowed Books: {borrowed_books}")
-    print(f"Total Transactions: {total_transactions}")
-    print(f"Total Fines: RM {total_fines:.2f}")
+    counters = stats.read_stats(conn)
+    
+    print(f"Total Patrons: {counters['patrons']}")
+    print(f"Total Books: {counters['books']}")
+    print(f"Available Books: {counters['books.available']}")
+    print(f"Borrowed Books: {counters['books.borrowed']}")
+    print(f"Total Transactions: {counters['transactions']}")
+    print(f"Total Fines: RM {counters['fines.total']:.2f}")
     print()
     
     # Patrons by role
     print("Patrons by Role:")
-    cursor.execute("SELECT role, COUNT(*) as count FROM Patron GROUP BY role ORDER BY count DESC")
-    roles = cursor.fetchall()
-    for r in roles:
-        print(f"  {r['role']}: {r['count']}")
+    for role, count in stats.grouped(counters, 'patrons.role.'):
+        print(f"  {role}: {count}")
     
     print()
     
     # Books by type
     print("Books by Type:")
-    cursor.execute("SELECT type, COUNT(*) as count FROM Books GROUP BY type ORDER BY count DESC")
-    types = cursor.fetchall()
-    for t in types:
-        print(f"  {t['type']}: {t['count']}")
+    for book_type, count in stats.grouped(counters, 'books.type.'):
+        print(f"  {book_type}: {count}")
     
     conn.close()
     input("\nPress Enter to continue...")
@@ -807,7 +787,6 @@ def update_book():
     book_type = input(f"New type (press Enter to keep '{book['type']}'): ").strip().capitalize()
     call_number = input(f"New call number (press Enter to keep '{book['call_number']}'): ").strip()
     shelf_location = input(f"New shelf location (press Enter to keep current): ").strip()
-    available = input("Set available? (1=Yes, 0=No, press Enter to skip): ").strip()
     
     updates = []
     params = []
@@ -836,9 +815,7 @@ def update_book():
     if shelf_location is not None:
         updates.append("shelf_location = ?")
         params.append(shelf_location)
-    if available in ['0', '1']:
-        updates.append("available = ?")
-        params.append(int(available))
+    # Availability follows the copies (borrow, return, add copies), never edited here
     
     if updates:
         params.append(book_id)
@@ -888,51 +865,38 @@ def process_book_return():
     """Process book return"""
     display_title("PROCESS BOOK RETURN")
     
-    book_id = input("Enter book ID to return: ").strip()
-    if not book_id.isdigit():
-        print("\n❌ Invalid book ID!")
+    # The copy handed back (its barcode) or the loan's transaction ID
+    key = input("Scan copy barcode or enter transaction ID: ").strip()
+    if not key:
+        print("\n❌ Invalid barcode or transaction ID!")
         input("Press Enter to continue...")
         return
     
     conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if book exists
-    cursor.execute("SELECT * FROM Books WHERE book_id = ?", (book_id,))
-    book = cursor.fetchone()
-    if not book:
-        print("\n❌ Book not found!")
-        conn.close()
-        input("Press Enter to continue...")
-        return
-    
-    # Check if book is borrowed
-    if book['available'] == 1:
-        print("\n❌ This book is not borrowed!")
-        conn.close()
-        input("Press Enter to continue...")
-        return
     
-    # Get the active transaction
-    cursor.execute("""
-        SELECT * FROM Transactions 
-        WHERE book_id = ? AND return_date IS NULL
-        ORDER BY transaction_id DESC LIMIT 1
-    """, (book_id,))
-    transaction = cursor.fetchone()
+    if key.isdigit():
+        transaction = loans.find_open_loan(conn, transaction_id=int(key))
+    else:
+        transaction = loans.find_open_loan(conn, barcode=key)
     
     if not transaction:
-        print("\n❌ No active transaction found for this book!")
+        print("\n❌ No open loan found for that copy!")
         conn.close()
         input("Press Enter to continue...")
         return
     
+    book = conn.execute("SELECT title FROM Books WHERE book_id = ?", (transaction['book_id'],)).fetchone()
+    
     today = datetime.now().strftime("%Y-%m-%d")
     
     # Calculate final fine
-    final_fine = calculate_fine(transaction['borrow_date'], today)
+    final_fine = fines.calculate_fine(transaction['borrow_date'], today,
+                                      transaction['item_type'], transaction['role'], conn)
     
-    print(f"\nBook: {book['title']}")
+    print(f"\nBook: {book['title'] if book else transaction['book_id']}")
+    if transaction['barcode']:
+        print(f"Copy: {transaction['barcode']}")
+    print(f"Borrower: {transaction['patron_name']} ({transaction['role']})")
     print(f"Borrowed on: {transaction['borrow_date']}")
     print(f"Returning on: {today}")
     print(f"Calculated fine: RM {final_fine:.2f}")
@@ -945,18 +909,8 @@ def process_book_return():
         return
     
     try:
-        # Update transaction
-        cursor.execute("""
-            UPDATE Transactions 
-            SET return_date = ?, fine = ?
-            WHERE transaction_id = ?
-        """, (today, final_fine, transaction['transaction_id']))
-        
-        # Update book availability (only for physical books)
-        if book['type'] == 'Physical':
-            cursor.execute("UPDATE Books SET available = 1 WHERE book_id = ?", (book_id,))
-        
-        conn.commit()
+        # Close the loan and put its copy back on the shelf
+        loans.return_loans(conn, [(transaction['transaction_id'], today, final_fine)])
         print("\n✅ Book returned successfully!")
         print(f"Fine charged: RM {final_fine:.2f}")
     except Exception as e:
@@ -971,11 +925,11 @@ def view_borrowed_books():
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT b.*, p.name as patron_name, t.borrow_date, t.transaction_id
+        SELECT b.*, p.name as patron_name, p.role, t.borrow_date, t.transaction_id, t.item_type
         FROM Books b
         JOIN Transactions t ON b.book_id = t.book_id
         JOIN Patron p ON t.patron_id = p.patron_id
-        WHERE b.available = 0 AND t.return_date IS NULL
+        WHERE b.type = 'Physical' AND t.return_date IS NULL
         ORDER BY t.borrow_date DESC
     """)
     books = cursor.fetchall()
@@ -987,10 +941,11 @@ def view_borrowed_books():
     
     print(f"{'BookID':<7} {'Title':<30} {'Patron':<20} {'Borrow Date':<12} {'Days':<6}")
     print("-" * 80)
-    for b in books:
-        borrow_date = datetime.strptime(b['borrow_date'], "%Y-%m-%d")
-        days_borrowed = (datetime.now() - borrow_date).days
-        overdue = "(Overdue)" if days_borrowed > 14 else ""
+    loan_days = fines.calculate_fines([b['borrow_date'] for b in books],
+                                      item_types=[b['item_type'] for b in books],
+                                      roles=[b['role'] for b in books], conn=conn)
+    for b, days_borrowed, overdue_days in zip(books, loan_days.days, loan_days.overdue_days):
+        overdue = "(Overdue)" if overdue_days > 0 else ""
         print(f"{b['book_id']:<7} {b['title'][:28]:<30} {b['patron_name'][:18]:<20} {b['borrow_date']:<12} {days_borrowed:<6} {overdue}")
     
     conn.close()
@@ -1088,43 +1043,21 @@ def borrow_book(user):
         input("Press Enter to continue...")
         return
     
-    # Check if book is available
-    if book['available'] == 0:
-        print("\n❌ This book is already borrowed!")
-        conn.close()
-        input("Press Enter to continue...")
-        return
-    
-    # Check if student already borrowed this book
-    cursor.execute("""
-        SELECT * FROM Transactions 
-        WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-    """, (user['patron_id'], book_id))
-    existing_loan = cursor.fetchone()
-    
-    if existing_loan:
-        print("\n❌ You already borrowed this book!")
-        print(f"You borrowed it on {existing_loan['borrow_date']}")
-        conn.close()
-        input("Press Enter to continue...")
-        return
-    
     try:
-        # Create transaction
-        cursor.execute("""
-            INSERT INTO Transactions (patron_id, book_id, borrow_date, return_date, fine, item_type) 
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user['patron_id'], book_id, borrow_date, None, 0, book['type']))
-        
-        # Update book availability (only for physical books)
-        if book['type'] == 'Physical':
-            cursor.execute("UPDATE Books SET available = 0 WHERE book_id = ?", (book_id,))
-        
-        conn.commit()
-        print("\n✅ Book borrowed successfully!")
-        print(f"Book: {book['title']}")
-        print(f"Borrow Date: {borrow_date}")
-        print(f"Due Date: {(datetime.strptime(borrow_date, '%Y-%m-%d') + timedelta(days=14)).strftime('%Y-%m-%d')}")
+        result = loans.borrow_book(conn, user['patron_id'], book_id, borrow_date)
+        if result['status'] == loans.ALREADY_BORROWED:
+            print("\n❌ You already borrowed this book!")
+            print(f"You borrowed it on {result['borrow_date']}")
+        elif result['status'] == loans.UNAVAILABLE:
+            print("\n❌ This book is already borrowed!")
+        elif result['status'] == loans.NOT_FOUND:
+            print("\n❌ Book not found!")
+        else:
+            print("\n✅ Book borrowed successfully!")
+            print(f"Book: {book['title']}")
+            print(f"Borrow Date: {borrow_date}")
+            grace_days = fines.policies(conn).lookup(result['item_type'], user['role']).grace_days
+            print(f"Due Date: {(datetime.strptime(borrow_date, '%Y-%m-%d') + timedelta(days=grace_days)).strftime('%Y-%m-%d')}")
     except Exception as e:
         print(f"\n❌ Error: {e}")
     
@@ -1154,15 +1087,15 @@ def view_my_current_loans(user):
     total_fine = 0
     print(f"{'TxnID':<7} {'Book':<30} {'Borrow Date':<12} {'Days':<6} {'Fine':<8}")
     print("-" * 70)
-    for loan in loans:
-        borrow_date = datetime.strptime(loan['borrow_date'], "%Y-%m-%d")
-        days_borrowed = (datetime.now() - borrow_date).days
-        overdue_days = max(0, days_borrowed - 14)
-        fine = overdue_days * 1.0
+    loan_days = fines.calculate_fines([loan['borrow_date'] for loan in loans],
+                                      item_types=[loan['item_type'] for loan in loans],
+                                      roles=[user['role']] * len(loans), conn=conn)
+    for loan, days_borrowed, overdue_days in zip(loans, loan_days.days, loan_days.overdue_days):
+        fine = float(loan['fine'] or 0)  # kept current by the daily accrual job
         total_fine += fine
         
         status = ""
-        if days_borrowed > 14:
+        if overdue_days > 0:
             status = f"(Overdue {overdue_days} days)"
         
         print(f"{loan['transaction_id']:<7} {loan['title'][:28]:<30} {loan['borrow_date']:<12} {days_borrowed:<6} RM {fine:.2f} {status}")
@@ -1204,7 +1137,8 @@ def return_book(user):
     today = datetime.now().strftime("%Y-%m-%d")
     
     # Calculate final fine
-    final_fine = calculate_fine(transaction['borrow_date'], today)
+    final_fine = fines.calculate_fine(transaction['borrow_date'], today,
+                                      transaction['item_type'], user['role'], conn)
     
     print(f"\nBook: {transaction['title']}")
     print(f"Borrowed on: {transaction['borrow_date']}")
@@ -1219,18 +1153,8 @@ def return_book(user):
         return
     
     try:
-        # Update transaction
-        cursor.execute("""
-            UPDATE Transactions 
-            SET return_date = ?, fine = ?
-            WHERE transaction_id = ? AND patron_id = ?
-        """, (today, final_fine, transaction_id, user['patron_id']))
-        
-        # Update book availability (only for physical books)
-        if transaction['type'] == 'Physical':
-            cursor.execute("UPDATE Books SET available = 1 WHERE book_id = ?", (transaction['book_id'],))
-        
-        conn.commit()
+        # Close the loan and put its copy back on the shelf
+        loans.return_loans(conn, [(transaction['transaction_id'], today, final_fine)])
         print("\n✅ Book returned successfully!")
         if final_fine > 0:
             print(f"Fine charged: RM {final_fine:.2f}")
@@ -1300,7 +1224,7 @@ def view_my_fines(user):
     
     # Show overdue books
     cursor.execute("""
-        SELECT b.title, t.borrow_date, t.fine
+        SELECT b.title, t.borrow_date, t.fine, t.item_type
         FROM Transactions t 
         JOIN Books b ON t.book_id = b.book_id 
         WHERE t.patron_id = ? AND t.return_date IS NULL
@@ -1310,12 +1234,12 @@ def view_my_fines(user):
     
     if loans:
         print("Current loans:")
-        for loan in loans:
-            borrow_date = datetime.strptime(loan['borrow_date'], "%Y-%m-%d")
-            days_borrowed = (datetime.now() - borrow_date).days
-            if days_borrowed > 14:
-                overdue_days = days_borrowed - 14
-                print(f"  {loan['title'][:30]}: {overdue_days} days overdue (RM {overdue_days * 1.0:.2f})")
+        loan_days = fines.calculate_fines([loan['borrow_date'] for loan in loans],
+                                          item_types=[loan['item_type'] for loan in loans],
+                                          roles=[user['role']] * len(loans), conn=conn)
+        for loan, overdue_days in zip(loans, loan_days.overdue_days):
+            if overdue_days > 0:
+                print(f"  {loan['title'][:30]}: {overdue_days} days overdue (RM {float(loan['fine'] or 0):.2f})")
     
     conn.close()
     input("\nPress Enter to continue...")
@@ -1677,12 +1601,11 @@ def view_patrons_with_fines():
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT p.patron_id, p.name, p.role, SUM(t.fine) as total_fine
-        FROM Patron p
-        JOIN Transactions t ON p.patron_id = t.patron_id
-        WHERE t.return_date IS NULL AND t.fine > 0
-        GROUP BY p.patron_id
-        ORDER BY total_fine DESC
+        SELECT p.patron_id, p.name, p.role, f.total_fine
+        FROM (SELECT patron_id, SUM(fine) AS total_fine FROM Transactions
+              WHERE return_date IS NULL AND fine > 0 GROUP BY patron_id) f
+        JOIN Patron p ON p.patron_id = f.patron_id
+        ORDER BY f.total_fine DESC
     """)
     patrons = cursor.fetchall()
     
@@ -1755,17 +1678,11 @@ def view_bank_statistics():
     conn = get_db()
     cursor = conn.cursor()
     
-    # Total payments
-    cursor.execute("SELECT COUNT(*) as count FROM Payments")
-    total_payments = cursor.fetchone()['count']
-    
-    # Total received
-    cursor.execute("SELECT SUM(amount) as total FROM Payments")
-    total_received = cursor.fetchone()['total'] or 0
-    
-    # Average payment
-    cursor.execute("SELECT AVG(amount) as avg FROM Payments")
-    avg_payment = cursor.fetchone()['avg'] or 0
+    # Payment totals (maintained by triggers, see stats.py)
+    counters = stats.read_stats(conn)
+    total_payments = counters['payments']
+    total_received = counters['payments.total']
+    avg_payment = total_received / total_payments if total_payments else 0
     
     # Patrons with fines
     cursor.execute("""
@@ -1805,20 +1722,14 @@ def search_books():
     """Search books"""
     display_title("SEARCH BOOKS")
     
-    keyword = input("Enter search keyword (title, author, genre, ISBN): ").strip()
+    keyword = input("Enter search keyword (title, author, genre, ISBN, call number): ").strip()
     if not keyword:
         print("\n❌ Please enter a search keyword!")
         input("Press Enter to continue...")
         return
     
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM Books 
-        WHERE title LIKE ? OR author LIKE ? OR genre LIKE ? OR isbn LIKE ? 
-        ORDER BY title
-    """, (f"%{keyword}%", f"%{keyword}%", f"%{keyword}%", f"%{keyword}%"))
-    books = cursor.fetchall()
+    books = search.search_books(conn, keyword)
     
     if not books:
         print(f"\nNo books found matching '{keyword}'")
@@ -1836,6 +1747,396 @@ def search_books():
     conn.close()
     input("\nPress Enter to continue...")
 
+# ==================== BATCH COMMANDS ====================
+# python main.py <command> runs one job without the menus, e.g. from cron
+# or a shell pipeline. Bulk input (books import, txns return, payments add)
+# is JSON lines or CSV with a header row on stdin; every row is checked
+# first and the whole batch is then written in one transaction, so a bad
+# line leaves the database untouched.
+
+BOOK_TYPES = ['Physical', 'E-book', 'Audiobook', 'Reference']
+
+# Per-row triggers that books import replaces with one statement each
+BULK_TRIGGERS = ('books_first_copy', 'copies_insert', 'books_fts_insert')
+
+def read_records(stream, fmt="auto"):
+    """(line number, dict) for each record in JSON lines or CSV on `stream`"""
+    first = stream.readline()
+    if fmt == "auto":
+        fmt = "jsonl" if first.lstrip().startswith("{") else "csv"
+    lines = chain([first], stream)
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {line_no}: invalid JSON ({e})")
+        if not isinstance(record, dict):
+            raise ValueError(f"line {line_no}: expected a JSON object")
+        yield line_no, record
+
+def field(record, name):
+    """A record's value as a stripped string ('' if missing)"""
+    value = record.get(name)
+    return "" if value is None else str(value).strip()
+
+def load_batch(stream, fmt, parse):
+    """Parse every record with `parse`, returns (rows, errors)"""
+    rows, errors = [], []
+    try:
+        for line_no, record in read_records(stream, fmt):
+            try:
+                rows.append(parse(record))
+            except ValueError as e:
+                errors.append(f"line {line_no}: {e}")
+    except (ValueError, csv.Error) as e:
+        errors.append(str(e))
+    return rows, errors
+
+def report_errors(errors, limit=10):
+    print(f"❌ {len(errors)} bad record(s), nothing written:", file=sys.stderr)
+    for error in errors[:limit]:
+        print(f"  {error}", file=sys.stderr)
+    if len(errors) > limit:
+        print(f"  ... and {len(errors) - limit} more", file=sys.stderr)
+    return 1
+
+def report_rate(verb, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    print(f"✅ {count} {verb} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def parse_book(record):
+    title, author, isbn = field(record, 'title'), field(record, 'author'), field(record, 'isbn')
+    genre, call_number = field(record, 'genre'), field(record, 'call_number')
+    missing = [name for name, value in (('title', title), ('author', author), ('isbn', isbn),
+                                        ('genre', genre), ('call_number', call_number)) if not value]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    # Same default as add_book() when the type is left out, a typo is an error
+    book_type = field(record, 'type').capitalize() or 'Physical'
+    if book_type not in BOOK_TYPES:
+        raise ValueError(f"invalid type {field(record, 'type')!r} (one of {', '.join(BOOK_TYPES)})")
+    published_year = field(record, 'published_year')
+    published_year = int(published_year) if published_year.isdigit() else None
+    return (title, author, isbn, published_year, genre, book_type, call_number,
+            field(record, 'shelf_location'))
+
+def cmd_books_import(args):
+    """Add books from stdin (title, author, isbn, genre, call_number, [published_year, type, shelf_location])"""
+    rows, errors = load_batch(sys.stdin, args.format, parse_book)
+    if errors:
+        return report_errors(errors)
+    
+    initialize_database(quiet=True)
+    conn = get_db()
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # The first copy and the search index rows are written once for the
+        # whole batch below: their per-row triggers are set aside until then
+        # (inside this transaction, so a failed import puts them back too)
+        suspended = conn.execute(f"""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND name IN ({','.join('?' * len(BULK_TRIGGERS))})
+        """, BULK_TRIGGERS).fetchall()
+        for trigger in suspended:
+            conn.execute(f"DROP TRIGGER {trigger['name']}")
+        last_id = conn.execute("SELECT COALESCE(MAX(book_id), 0) FROM Books").fetchone()[0]
+        
+        # A physical book is counted with the copy it is about to get
+        cursor = conn.executemany(f"""
+            INSERT {'OR IGNORE ' if args.skip_existing else ''}INTO Books
+                (title, author, isbn, published_year, genre, type, call_number, shelf_location,
+                 available, available_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?6 = 'Physical')
+        """, rows)
+        imported = cursor.rowcount
+        # What books_first_copy and books_fts_insert do, for every new book at once
+        conn.execute("""
+            INSERT INTO Copies (barcode, book_id, status, shelf_location)
+            SELECT printf('BK%06d-1', book_id), book_id, 'available', shelf_location
+            FROM Books WHERE book_id > ? AND type = 'Physical'
+        """, (last_id,))
+        conn.execute("""
+            INSERT INTO BooksFTS(rowid, title, author, genre, isbn, call_number)
+            SELECT book_id, title, author, genre, isbn, call_number FROM Books WHERE book_id > ?
+        """, (last_id,))
+        for trigger in suspended:
+            conn.execute(trigger['sql'])
+        conn.commit()
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        print(f"❌ Import aborted, nothing written: {e}", file=sys.stderr)
+        if "UNIQUE" in str(e):
+            print("   (ISBN or Call Number already exists, use --skip-existing to ignore)", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    
+    report_rate("book(s) imported", imported, started)
+    if imported < len(rows):
+        print(f"⚠️ {len(rows) - imported} book(s) skipped, ISBN or Call Number already exists")
+    return 0
+
+def parse_return(record):
+    transaction_id, barcode, book_id = (field(record, 'transaction_id'), field(record, 'barcode'),
+                                        field(record, 'book_id'))
+    if not (transaction_id or barcode or book_id):
+        raise ValueError("needs transaction_id, barcode or book_id")
+    if transaction_id and not transaction_id.isdigit():
+        raise ValueError("invalid transaction_id")
+    if not (transaction_id or barcode) and not book_id.isdigit():
+        raise ValueError("invalid book_id")
+    return_date = field(record, 'return_date') or None
+    if return_date:
+        datetime.strptime(return_date, "%Y-%m-%d")
+    fine = field(record, 'fine')
+    fine = float(fine) if fine else None
+    if transaction_id:
+        return ('transaction_id', int(transaction_id), return_date, fine)
+    if barcode:
+        return ('barcode', barcode, return_date, fine)
+    return ('book_id', int(book_id), return_date, fine)
+
+def find_open_loans(conn, column, ids):
+    """{id: [open loans]} for transaction ids, copy barcodes or book ids"""
+    found = {}
+    ids = list(set(ids))
+    # A copy's loan is found from its barcode, the others from Transactions
+    where, copies = ("c.barcode", "JOIN") if column == 'barcode' else (f"t.{column}", "LEFT JOIN")
+    for start in range(0, len(ids), loans.CHUNK):
+        chunk = ids[start:start + loans.CHUNK]
+        for row in conn.execute(f"""
+            SELECT t.transaction_id, t.book_id, t.borrow_date, t.item_type, p.role, c.barcode FROM Transactions t
+            {copies} Copies c ON c.copy_id = t.copy_id
+            LEFT JOIN Patron p ON p.patron_id = t.patron_id
+            WHERE t.return_date IS NULL AND {where} IN ({','.join('?' * len(chunk))})
+            ORDER BY t.transaction_id
+        """, chunk):
+            found.setdefault(row[column], []).append(row)
+    return found
+
+def cmd_txns_return(args):
+    """Return loans given by --transaction-id/--barcode/--book-id, or records on stdin"""
+    today = args.date or datetime.now().strftime("%Y-%m-%d")
+    if args.book_id or args.transaction_id or args.barcode:
+        requested = ([('book_id', i, None, None) for i in args.book_id] +
+                     [('barcode', b, None, None) for b in args.barcode] +
+                     [('transaction_id', i, None, None) for i in args.transaction_id])
+    else:
+        requested, errors = load_batch(sys.stdin, args.format, parse_return)
+        if errors:
+            return report_errors(errors)
+    
+    initialize_database(quiet=True)
+    conn = get_db()
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        by_column = {column: find_open_loans(conn, column, [r[1] for r in requested if r[0] == column])
+                     for column in ('transaction_id', 'barcode', 'book_id')}
+        # A book with several copies out does not say whose loan to close
+        ambiguous = sorted({value for column, value, _, _ in requested
+                            if column == 'book_id' and len(by_column[column].get(value, [])) > 1})
+        if ambiguous:
+            conn.rollback()
+            return report_errors([f"book_id {book_id} has {len(by_column['book_id'][book_id])} open loans, "
+                                  "give its transaction_id or the copy's barcode" for book_id in ambiguous])
+        
+        matched, missing, seen = [], [], set()
+        for column, value, return_date, fine in requested:
+            txn = by_column[column].get(value, [None])[0]
+            if txn is None:
+                missing.append(f"{column} {value}")
+            elif txn['transaction_id'] not in seen:
+                # A loan named twice (by its id and its copy or book) is returned once
+                seen.add(txn['transaction_id'])
+                matched.append((txn, return_date or today, fine))
+        
+        # Fines the same way process_book_return() charges them, for all rows at once
+        charged = fines.calculate_fines([txn['borrow_date'] for txn, _, _ in matched],
+                                        [return_date for _, return_date, _ in matched],
+                                        item_types=[txn['item_type'] for txn, _, _ in matched],
+                                        roles=[txn['role'] for txn, _, _ in matched],
+                                        conn=conn).fines
+        returns = [(txn['transaction_id'], return_date, float(fine if fine is not None else charged[i]))
+                   for i, (txn, return_date, fine) in enumerate(matched)]
+        returned = loans.return_loans(conn, returns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    report_rate("loan(s) returned", returned, started)
+    print(f"Fines charged: RM {sum(r[2] for r in returns):.2f}")
+    if missing:
+        print(f"⚠️ No open loan for {len(missing)} record(s): {', '.join(missing[:10])}"
+              f"{' ...' if len(missing) > 10 else ''}")
+    return 0
+
+def parse_payment(record, default_date=None, default_purpose="Fine Payment"):
+    patron_id = field(record, 'patron_id')
+    if not patron_id.isdigit():
+        raise ValueError("invalid patron_id")
+    try:
+        amount = float(field(record, 'amount'))
+    except ValueError:
+        raise ValueError("invalid amount")
+    if amount <= 0:
+        raise ValueError("amount must be positive")
+    payment_date = field(record, 'payment_date') or default_date or datetime.now().strftime("%Y-%m-%d")
+    datetime.strptime(payment_date, "%Y-%m-%d")
+    return (int(patron_id), amount, payment_date, field(record, 'purpose') or default_purpose)
+
+def cmd_payments_add(args):
+    """Record payments given by --patron-id/--amount, or records on stdin"""
+    if args.patron_id is not None:
+        try:
+            rows = [parse_payment({'patron_id': args.patron_id, 'amount': args.amount},
+                                  args.date, args.purpose)]
+        except ValueError as e:
+            return report_errors([str(e)])
+    else:
+        rows, errors = load_batch(sys.stdin, args.format,
+                                  lambda record: parse_payment(record, args.date, args.purpose))
+        if errors:
+            return report_errors(errors)
+    
+    initialize_database(quiet=True)
+    conn = get_db()
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        patron_ids = list({row[0] for row in rows})
+        known = set()
+        for start in range(0, len(patron_ids), loans.CHUNK):
+            chunk = patron_ids[start:start + loans.CHUNK]
+            known.update(r[0] for r in conn.execute(
+                f"SELECT patron_id FROM Patron WHERE patron_id IN ({','.join('?' * len(chunk))})", chunk))
+        unknown = sorted(set(patron_ids) - known)
+        if unknown:
+            conn.rollback()
+            return report_errors([f"patron {patron_id} not found" for patron_id in unknown])
+        conn.executemany(
+            "INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    report_rate("payment(s) recorded", len(rows), started)
+    print(f"Total: RM {sum(row[1] for row in rows):.2f}")
+    return 0
+
+def cmd_stats(args):
+    """Print the system counters"""
+    initialize_database(quiet=True)
+    conn = get_db()
+    try:
+        counters = stats.read_stats(conn)
+    finally:
+        conn.close()
+    
+    if args.json:
+        print(json.dumps(counters, indent=2, sort_keys=True))
+        return 0
+    width = max(len(key) for key in counters) if counters else 0
+    for key in sorted(counters):
+        value = counters[key]
+        print(f"{key:<{width}}  {value:.2f}" if isinstance(value, float) else f"{key:<{width}}  {value}")
+    return 0
+
+def cmd_accrue_fines(args):
+    """Non-interactive daily fine accrual (python main.py accrue-fines)"""
+    initialize_database(quiet=True)
+    conn = get_db()
+    try:
+        result = fines.accrue_fines(conn, today=args.date, full=args.full)
+    finally:
+        conn.close()
+    
+    if result['skipped']:
+        print(f"⚠️ Fines already accrued for {result['date']}")
+    else:
+        print(f"✅ Fines accrued for {result['date']}: "
+              f"{result['continuing']} overdue loans updated, {result['newly_overdue']} newly overdue")
+    return 0
+
+def cmd_expire_holds(args):
+    """Expire holds that were not collected in time (python main.py expire-holds)"""
+    initialize_database(quiet=True)
+    conn = get_db()
+    try:
+        expired = holds.expire_holds(conn, today=args.date)
+    finally:
+        conn.close()
+    
+    print(f"✅ {expired} hold(s) expired")
+    return 0
+
+def build_parser():
+    """Command line for the batch commands (no command starts the menus)"""
+    parser = argparse.ArgumentParser(prog="main.py", description="Library Borrowing System")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    
+    def input_format(p):
+        p.add_argument("--format", choices=["auto", "jsonl", "csv"], default="auto",
+                       help="Format of the records on stdin (default: by the first line)")
+    
+    books = commands.add_parser("books", help="Catalog commands").add_subparsers(dest="action", required=True)
+    p = books.add_parser("import", help="Add books from JSON lines or CSV on stdin")
+    input_format(p)
+    p.add_argument("--skip-existing", action="store_true",
+                   help="Skip books whose ISBN or Call Number exists instead of aborting")
+    p.set_defaults(func=cmd_books_import)
+    
+    txns = commands.add_parser("txns", help="Loan commands").add_subparsers(dest="action", required=True)
+    p = txns.add_parser("return",
+                        help="Return loans (by --transaction-id/--barcode/--book-id or records on stdin)")
+    p.add_argument("--transaction-id", type=int, action="append", default=[],
+                   help="Return this loan (repeatable)")
+    p.add_argument("--barcode", action="append", default=[],
+                   help="Return the loan this copy is out on (repeatable)")
+    p.add_argument("--book-id", type=int, action="append", default=[],
+                   help="Return the open loan of this book, if it has only one (repeatable)")
+    p.add_argument("--date", help="Return date for records without one (YYYY-MM-DD), default today")
+    input_format(p)
+    p.set_defaults(func=cmd_txns_return)
+    
+    payments = commands.add_parser("payments", help="Payment commands").add_subparsers(dest="action", required=True)
+    p = payments.add_parser("add", help="Record payments (by --patron-id/--amount or records on stdin)")
+    p.add_argument("--patron-id", type=int)
+    p.add_argument("--amount", type=float)
+    p.add_argument("--date", help="Payment date for records without one (YYYY-MM-DD), default today")
+    p.add_argument("--purpose", default="Fine Payment")
+    input_format(p)
+    p.set_defaults(func=cmd_payments_add)
+    
+    p = commands.add_parser("stats", help="Print the system counters")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_stats)
+    
+    p = commands.add_parser("accrue-fines", help="Update fines on all open loans")
+    p.add_argument("--date", help="Accrue up to this date (YYYY-MM-DD), default today")
+    p.add_argument("--full", action="store_true", help="Recompute every overdue loan, ignoring the watermark")
+    p.set_defaults(func=cmd_accrue_fines)
+    
+    p = commands.add_parser("expire-holds", help="Expire uncollected holds and pass their copies on")
+    p.add_argument("--date", help="Expire holds due before this date (YYYY-MM-DD), default today")
+    p.set_defaults(func=cmd_expire_holds)
+    return parser
+
 # ==================== MAIN ====================
 def main():
     """Main function"""
@@ -1860,6 +2161,9 @@ def main():
     home_menu()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        args = build_parser().parse_args()
+        sys.exit(args.func(args))
     try:
         main()
     except KeyboardInterrupt:
@@ -0,0 +1,322 @@
+# metrics.py
+# Prometheus metrics for the web app, served by /metrics in the text
+# exposition format (app.py records the requests, see METRICS there).
+#
+# Each gunicorn worker keeps its own counters and histograms in memory.
+# With LIBRARY_METRICS_DIR set, every worker also writes them to
+# <dir>/<pid>.json every LIBRARY_METRICS_FLUSH seconds, and whichever
+# worker answers a scrape adds up all the files, so the numbers cover the
+# whole deployment and not just one worker. Files of workers that have
+# exited still count towards counters (which must never go down) but not
+# towards gauges. Point the directory at an empty one on every deploy,
+# e.g. a tmpfs cleared before gunicorn starts.
+#
+# Gauges about the library itself (open and overdue loans, fine totals)
+# are read from the Stats table at scrape time, the scheduler's job runs
+# and durations from the Jobs table.
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import catalog
+import db
+import etags
+import stats
+
+ENABLED = os.environ.get("LIBRARY_METRICS", "1") not in ("", "0")
+METRICS_DIR = os.environ.get("LIBRARY_METRICS_DIR")
+FLUSH_INTERVAL = float(os.environ.get("LIBRARY_METRICS_FLUSH", "5"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# name: (type, help, histogram buckets)
+FAMILIES = {
+    'library_http_requests_total': ('counter', "HTTP requests by Flask endpoint, method and status", None),
+    'library_http_request_duration_seconds': (
+        'histogram', "Time from the start of a request until its response body was sent", REQUEST_BUCKETS),
+    # Checkout time, not SQL time: it includes the Python work between
+    # statements and, for streamed pages, the rendering
+    'library_db_pool_checkout_seconds': (
+        'histogram', "Time one request kept its pooled connection checked out", REQUEST_BUCKETS),
+    'library_db_duration_seconds': (
+        'histogram', "SQL time spent by one request (with LIBRARY_SQL_PROFILE=1 only)", DB_BUCKETS),
+    'library_db_queries_total': ('counter', "SQL statements executed by requests", None),
+    'library_db_pool_connections': ('gauge', "Pooled SQLite connections in the live workers", None),
+    'library_db_pool_checkouts_total': (
+        'counter', "Connection checkouts: idle connection reused, new one opened, or waited for", None),
+    'library_db_pool_wait_seconds_total': ('counter', "Time spent waiting for a pooled connection", None),
+    'library_cache_requests_total': ('counter', "Cache lookups by cache and result", None),
+    'library_cache_hit_ratio': ('gauge', "Hits over lookups since the workers started", None),
+    'library_conditional_requests_total': (
+        'counter', "Conditional GET outcomes by endpoint (not_modified is a 304)", None),
+    'library_worker_processes': ('gauge', "gunicorn workers reporting metrics", None),
+    'library_loans_open': ('gauge', "Loans not yet returned", None),
+    'library_loans_overdue': ('gauge', "Open loans that carry a fine, as of the last fine accrual", None),
+    'library_fines_charged': ('gauge', "Fines charged on all loans, RM", None),
+    'library_fines_outstanding': ('gauge', "Fines on loans not yet returned, RM", None),
+    'library_payments_received': ('gauge', "Payments recorded, RM", None),
+    'library_books': ('gauge', "Books in the catalog", None),
+    'library_patrons': ('gauge', "Registered patrons", None),
+    'library_job_runs_total': ('counter', "Scheduler job runs by outcome (see scheduler.py)", None),
+    'library_job_duration_seconds_total': ('counter', "Time spent running each scheduler job", None),
+    'library_job_last_duration_seconds': ('gauge', "Duration of the job's last run", None),
+    'library_job_last_success_timestamp_seconds': ('gauge', "Unix time of the job's last successful run", None),
+    'library_job_retry_attempt': ('gauge', "Failed attempts since the job last succeeded, 0 when healthy", None),
+}
+
+
+class Registry:
+    """Counters and histograms of one process.
+
+    Series are keyed by (name, labels) with labels a tuple of (key, value)
+    pairs. Collectors are called at snapshot time for values other modules
+    already keep (pool and cache counters); they return
+    [(kind, name, labels, value)] with kind 'counter' or 'gauge'.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters = {}
+        self._histograms = {}
+        self._flusher = None
+
+    def _check_pid(self):
+        # A forked worker starts its own series and its own flush thread
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        if METRICS_DIR and self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                    self._flusher.start()
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def inc(self, name, labels=(), amount=1.0):
+        self._check_pid()
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name, labels, value):
+        self._check_pid()
+        buckets = FAMILIES[name][2]
+        key = (name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # per-bucket counts (not cumulative) with +Inf last, then sum and count
+                series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            series[bisect_left(buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """This process's series as a JSON-able dict"""
+        with self._lock:
+            counters = [[name, labels, value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, labels, list(series)] for (name, labels), series in self._histograms.items()]
+        gauges = []
+        for collect in self._collectors:
+            for kind, name, labels, value in collect():
+                (counters if kind == 'counter' else gauges).append([name, labels, value])
+        return {'pid': os.getpid(), 'time': time.time(), 'counters': counters, 'histograms': histograms,
+                'gauges': gauges}
+
+    def write(self, directory=METRICS_DIR):
+        """Save this process's snapshot for the other workers to read"""
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def gather(registry, directory=METRICS_DIR):
+    """Snapshots of every worker: this one live, the others from their files"""
+    if not directory:
+        return [registry.snapshot()]
+    registry.write(directory)
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # replaced or removed while reading
+    return snapshots
+
+
+def merge(snapshots):
+    """Sum counters and histograms over all snapshots, gauges over live workers only"""
+    counters, histograms, gauges = {}, {}, {}
+    live = 0
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, series in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.get(key)
+            histograms[key] = series if total is None else [a + b for a, b in zip(total, series)]
+        if snap['pid'] == os.getpid() or _alive(snap['pid']):
+            live += 1
+            for name, labels, value in snap['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0.0) + value
+    gauges[('library_worker_processes', ())] = live
+    # Hit ratios from the merged counters; a conditional GET hits when it gets a 304
+    lookups = {}
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name == 'library_cache_requests_total':
+            cache, hit = labels['cache'], labels['result'] == 'hit'
+        elif name == 'library_conditional_requests_total' and labels['outcome'] != 'fresh':
+            cache, hit = 'etag', labels['outcome'] == 'not_modified'
+        else:
+            continue
+        hits, total = lookups.get(cache, (0.0, 0.0))
+        lookups[cache] = (hits + value * hit, total + value)
+    for cache, (hits, total) in lookups.items():
+        gauges[('library_cache_hit_ratio', (('cache', cache),))] = round(hits / total, 4) if total else 0.0
+    return counters, histograms, gauges
+
+
+def collect_process():
+    """Counters the pool and the caches of this process keep themselves"""
+    pool = db.pool.stats()
+    yield 'gauge', 'library_db_pool_connections', (('state', 'open'),), pool['open']
+    yield 'gauge', 'library_db_pool_connections', (('state', 'idle'),), pool['idle']
+    for result, key in (('hit', 'hits'), ('miss', 'misses'), ('wait', 'waits')):
+        yield 'counter', 'library_db_pool_checkouts_total', (('result', result),), pool[key]
+    yield 'counter', 'library_db_pool_wait_seconds_total', (), pool['wait_time']
+    books = catalog.books.stats()
+    for cache, prefix in (('book_rows', ''), ('book_fragments', 'fragment_')):
+        yield 'counter', 'library_cache_requests_total', (('cache', cache), ('result', 'hit')), books[prefix + 'hits']
+        yield 'counter', 'library_cache_requests_total', (('cache', cache), ('result', 'miss')), books[prefix + 'misses']
+    for endpoint, counts in etags.counters.stats().items():
+        for outcome in ('not_modified', 'revalidated', 'fresh'):
+            yield 'counter', 'library_conditional_requests_total', (('endpoint', endpoint), ('outcome', outcome)), \
+                counts[outcome]
+
+
+def library_gauges(conn):
+    """Gauges read from the database: loans, fines, payments, catalog size"""
+    counters = stats.read_stats(conn)
+    overdue = conn.execute(
+        "SELECT COUNT(*) FROM Transactions WHERE return_date IS NULL AND fine > 0").fetchone()[0]
+    return {
+        ('library_loans_open', ()): counters.get('loans.open', 0),
+        ('library_loans_overdue', ()): overdue,
+        ('library_fines_charged', ()): counters.get('fines.total', 0),
+        ('library_fines_outstanding', ()): counters.get('fines.outstanding', 0),
+        ('library_payments_received', ()): counters.get('payments.total', 0),
+        ('library_books', ()): counters.get('books', 0),
+        ('library_patrons', ()): counters.get('patrons', 0),
+    }
+
+
+def job_series(conn):
+    """Counters and gauges of the scheduler worker, which keeps them in the Jobs table"""
+    counters, gauges = {}, {}
+    for name, runs, failures, seconds, last_duration, last_success, attempt in conn.execute(
+            "SELECT name, runs, failures, seconds, last_duration, last_success, attempt FROM Jobs"):
+        job = (('job', name),)
+        counters[('library_job_runs_total', job + (('status', 'ok'),))] = runs - failures
+        counters[('library_job_runs_total', job + (('status', 'failed'),))] = failures
+        counters[('library_job_duration_seconds_total', job)] = seconds
+        gauges[('library_job_retry_attempt', job)] = attempt
+        if last_duration is not None:
+            gauges[('library_job_last_duration_seconds', job)] = last_duration
+        if last_success is not None:
+            gauges[('library_job_last_success_timestamp_seconds', job)] = last_success
+    return counters, gauges
+
+
+# ==================== EXPOSITION FORMAT ====================
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms, gauges):
+    """Text exposition format, one HELP/TYPE block per family"""
+    series = {}
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), value in histograms.items():
+        series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in FAMILIES.items():
+        if name not in series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series[name]):
+            if kind != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-2]):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def exposition(registry, conn=None):
+    """The /metrics page: all workers' series plus the ones kept in the database"""
+    counters, histograms, gauges = merge(gather(registry))
+    if conn is not None:
+        gauges.update(library_gauges(conn))
+        job_counters, job_gauges = job_series(conn)
+        counters.update(job_counters)
+        gauges.update(job_gauges)
+    return render(counters, histograms, gauges)
+
+
+registry = Registry()
+registry.add_collector(collect_process)
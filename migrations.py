@@ -0,0 +1,475 @@
+# migrations.py
+# Versioned schema changes, tracked with PRAGMA user_version.
+#
+#   python migrations.py               apply pending migrations
+#   python migrations.py check_plans [file.py ...]   EXPLAIN every query in the app's modules (or the files given)
+import ast
+import os
+import sqlite3
+import sys
+
+import db
+import etags
+import stats
+
+# Copies maintenance triggers, shared by migration 8 and the table rebuild
+# in migration 9.
+COPIES_TRIGGERS = """
+        -- Books.available_count counts 'available' copies, Books.available is
+        -- kept as "at least one copy on the shelf" for the existing pages
+        CREATE TRIGGER IF NOT EXISTS copies_insert AFTER INSERT ON Copies
+        WHEN new.status = 'available' BEGIN
+            UPDATE Books SET available_count = available_count + 1, available = 1
+            WHERE book_id = new.book_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS copies_delete AFTER DELETE ON Copies
+        WHEN old.status = 'available' BEGIN
+            UPDATE Books SET available_count = available_count - 1, available = (available_count - 1 > 0)
+            WHERE book_id = old.book_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS copies_update AFTER UPDATE OF status, book_id ON Copies
+        WHEN (old.status = 'available') <> (new.status = 'available') OR old.book_id <> new.book_id BEGIN
+            UPDATE Books SET available_count = available_count - 1, available = (available_count - 1 > 0)
+            WHERE book_id = old.book_id AND old.status = 'available';
+            UPDATE Books SET available_count = available_count + 1, available = 1
+            WHERE book_id = new.book_id AND new.status = 'available';
+        END;
+"""
+
+HOLDS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS Holds (
+            hold_id INTEGER PRIMARY KEY,
+            book_id INTEGER NOT NULL,
+            patron_id INTEGER NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'waiting'
+                CHECK(status IN ('waiting', 'ready', 'collected', 'cancelled', 'expired')),
+            placed_date TEXT NOT NULL,
+            copy_id INTEGER,
+            ready_date TEXT,
+            expires_date TEXT,
+            FOREIGN KEY (book_id) REFERENCES Books(book_id),
+            FOREIGN KEY (patron_id) REFERENCES Patron(patron_id),
+            FOREIGN KEY (copy_id) REFERENCES Copies(copy_id)
+        );
+
+        -- holds.next_hold: head of a book's queue is one index seek
+        CREATE INDEX IF NOT EXISTS idx_holds_queue
+            ON Holds(book_id, priority DESC, hold_id) WHERE status = 'waiting';
+
+        -- one active hold per patron and book; also serves the patron's hold list
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_active
+            ON Holds(patron_id, book_id) WHERE status IN ('waiting', 'ready');
+
+        -- holds.expire_holds
+        CREATE INDEX IF NOT EXISTS idx_holds_expiry
+            ON Holds(expires_date) WHERE status = 'ready';
+"""
+
+
+def _add_holds(conn):
+    """Rebuild Copies to allow status 'on_hold' (SQLite cannot alter a CHECK), add Holds"""
+    # Keep the triggers on Books that mention Copies from being re-parsed
+    # while the table is briefly missing
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        conn.execute("""
+            CREATE TABLE Copies_new (
+                copy_id INTEGER PRIMARY KEY,
+                barcode TEXT UNIQUE NOT NULL,
+                book_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'available'
+                    CHECK(status IN ('available', 'on_loan', 'on_hold', 'lost', 'repair')),
+                shelf_location TEXT,
+                FOREIGN KEY (book_id) REFERENCES Books(book_id)
+            )
+        """)
+        conn.execute("INSERT INTO Copies_new SELECT copy_id, barcode, book_id, status, shelf_location FROM Copies")
+        conn.execute("DROP TABLE Copies")
+        conn.execute("ALTER TABLE Copies_new RENAME TO Copies")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+    script = "CREATE INDEX IF NOT EXISTS idx_copies_book_status ON Copies(book_id, status);\n"
+    for statement in _statements(script + COPIES_TRIGGERS + HOLDS_SCHEMA):
+        conn.execute(statement)
+
+
+# Each step is (version, description, SQL script or callable(conn)).
+# Steps are applied in order inside one BEGIN IMMEDIATE transaction so two
+# gunicorn workers starting together cannot both run the same step.
+MIGRATIONS = [
+    (1, "Indexes for the hot Transactions/Payments queries", """
+        -- get_patron_total_fine, /student, admin patron list: SUM(fine) per patron
+        CREATE INDEX IF NOT EXISTS idx_txn_patron_return
+            ON Transactions(patron_id, return_date, fine);
+
+        -- librarian_return_book / process_book_return: open loan for a book
+        CREATE INDEX IF NOT EXISTS idx_txn_book_open
+            ON Transactions(book_id, transaction_id) WHERE return_date IS NULL;
+
+        -- /bank outstanding fines: only open loans that carry a fine
+        CREATE INDEX IF NOT EXISTS idx_txn_open_fines
+            ON Transactions(patron_id, fine) WHERE return_date IS NULL AND fine > 0;
+
+        -- student history ordered by borrow date
+        CREATE INDEX IF NOT EXISTS idx_txn_patron_borrow
+            ON Transactions(patron_id, borrow_date);
+
+        CREATE INDEX IF NOT EXISTS idx_payments_patron
+            ON Payments(patron_id, payment_date);
+        CREATE INDEX IF NOT EXISTS idx_payments_date
+            ON Payments(payment_date);
+
+        -- student_login / guest feedback lookups by name
+        CREATE INDEX IF NOT EXISTS idx_patron_name_role
+            ON Patron(name, role);
+
+        CREATE INDEX IF NOT EXISTS idx_books_available
+            ON Books(available, title);
+    """),
+    (2, "FTS5 catalog index over Books", """
+        CREATE VIRTUAL TABLE IF NOT EXISTS BooksFTS USING fts5(
+            title, author, genre, isbn, call_number,
+            content='Books', content_rowid='book_id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON Books BEGIN
+            INSERT INTO BooksFTS(rowid, title, author, genre, isbn, call_number)
+            VALUES (new.book_id, new.title, new.author, new.genre, new.isbn, new.call_number);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON Books BEGIN
+            INSERT INTO BooksFTS(BooksFTS, rowid, title, author, genre, isbn, call_number)
+            VALUES ('delete', old.book_id, old.title, old.author, old.genre, old.isbn, old.call_number);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS books_fts_update
+        AFTER UPDATE OF title, author, genre, isbn, call_number ON Books BEGIN
+            INSERT INTO BooksFTS(BooksFTS, rowid, title, author, genre, isbn, call_number)
+            VALUES ('delete', old.book_id, old.title, old.author, old.genre, old.isbn, old.call_number);
+            INSERT INTO BooksFTS(rowid, title, author, genre, isbn, call_number)
+            VALUES (new.book_id, new.title, new.author, new.genre, new.isbn, new.call_number);
+        END;
+
+        INSERT INTO BooksFTS(BooksFTS) VALUES ('rebuild');
+    """),
+    (3, "Keyset pagination index for title-sorted book lists", """
+        CREATE INDEX IF NOT EXISTS idx_books_title ON Books(title, book_id);
+    """),
+    (4, "Stats counters table and maintenance triggers", stats.SCHEMA),
+    (5, "Backfill Stats from existing rows", stats.rebuild_stats),
+    (6, "Fine accrual watermark and open-loan borrow_date index", """
+        CREATE TABLE IF NOT EXISTS JobWatermarks (
+            job TEXT PRIMARY KEY,
+            run_date TEXT NOT NULL,
+            last_txn_id INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_txn_open_borrow
+            ON Transactions(borrow_date) WHERE return_date IS NULL;
+    """),
+    (7, "Fine policies per item type and role, holiday calendars", """
+        -- NULL item_type / role means "any"; the most specific row wins
+        CREATE TABLE IF NOT EXISTS FinePolicies (
+            policy_id INTEGER PRIMARY KEY,
+            item_type TEXT,
+            role TEXT,
+            grace_days INTEGER NOT NULL DEFAULT 14 CHECK(grace_days >= 0),
+            daily_rate REAL NOT NULL DEFAULT 1.0 CHECK(daily_rate >= 0),
+            max_fine REAL CHECK(max_fine IS NULL OR max_fine >= 0),
+            calendar TEXT
+        );
+
+        -- Days on which no fine is charged, grouped into named calendars
+        CREATE TABLE IF NOT EXISTS Holidays (
+            calendar TEXT NOT NULL,
+            holiday_date TEXT NOT NULL,
+            name TEXT,
+            PRIMARY KEY (calendar, holiday_date)
+        ) WITHOUT ROWID;
+
+        -- Bumped on every edit so running processes know to recompile
+        CREATE TABLE IF NOT EXISTS FinePolicyVersion (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO FinePolicyVersion (id, version) VALUES (1, 0);
+
+        CREATE TRIGGER IF NOT EXISTS fine_policies_insert AFTER INSERT ON FinePolicies BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS fine_policies_update AFTER UPDATE ON FinePolicies BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS fine_policies_delete AFTER DELETE ON FinePolicies BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS holidays_insert AFTER INSERT ON Holidays BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS holidays_update AFTER UPDATE ON Holidays BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS holidays_delete AFTER DELETE ON Holidays BEGIN
+            UPDATE FinePolicyVersion SET version = version + 1 WHERE id = 1;
+        END;
+
+        -- The rule that used to be hardcoded: RM 1 per day after 14 days
+        INSERT INTO FinePolicies (item_type, role, grace_days, daily_rate, max_fine, calendar)
+        SELECT NULL, NULL, 14, 1.0, NULL, NULL
+        WHERE NOT EXISTS (SELECT 1 FROM FinePolicies);
+    """),
+    (8, "Copies of physical books with a trigger-kept available_count", """
+        CREATE TABLE IF NOT EXISTS Copies (
+            copy_id INTEGER PRIMARY KEY,
+            barcode TEXT UNIQUE NOT NULL,
+            book_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'available'
+                CHECK(status IN ('available', 'on_loan', 'lost', 'repair')),
+            shelf_location TEXT,
+            FOREIGN KEY (book_id) REFERENCES Books(book_id)
+        );
+
+        -- loans.borrow_book: first available copy of a book
+        CREATE INDEX IF NOT EXISTS idx_copies_book_status ON Copies(book_id, status);
+
+        ALTER TABLE Books ADD COLUMN available_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE Transactions ADD COLUMN copy_id INTEGER REFERENCES Copies(copy_id);
+
+    """ + COPIES_TRIGGERS + """
+        -- Every new physical book starts with one copy
+        CREATE TRIGGER IF NOT EXISTS books_first_copy AFTER INSERT ON Books
+        WHEN new.type = 'Physical' BEGIN
+            INSERT INTO Copies (barcode, book_id, status, shelf_location)
+            VALUES (printf('BK%06d-1', new.book_id), new.book_id,
+                    CASE WHEN COALESCE(new.available, 1) = 1 THEN 'available' ELSE 'on_loan' END,
+                    new.shelf_location);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS books_delete_copies AFTER DELETE ON Books BEGIN
+            DELETE FROM Copies WHERE book_id = old.book_id;
+        END;
+
+        -- Backfill: one copy per existing physical book, open loans point at it
+        INSERT INTO Copies (barcode, book_id, status, shelf_location)
+        SELECT printf('BK%06d-1', book_id), book_id,
+               CASE WHEN COALESCE(available, 1) = 1 THEN 'available' ELSE 'on_loan' END,
+               shelf_location
+        FROM Books WHERE type = 'Physical';
+
+        UPDATE Transactions SET copy_id = (
+            SELECT c.copy_id FROM Copies c WHERE c.book_id = Transactions.book_id)
+        WHERE return_date IS NULL AND item_type = 'Physical';
+    """),
+    (9, "Hold queue; copies can be set aside for a holder", _add_holds),
+    (10, "Book version stamps for the detail page cache", """
+        -- catalog.BookCache tags entries with these; any change to a book,
+        -- including available/available_count moving on borrow and return,
+        -- gives it a new version. Rows outlive their book so a reused
+        -- book_id never matches an old entry.
+        CREATE TABLE IF NOT EXISTS BookVersions (
+            book_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TRIGGER IF NOT EXISTS book_versions_insert AFTER INSERT ON Books BEGIN
+            INSERT INTO BookVersions (book_id) VALUES (new.book_id)
+            ON CONFLICT(book_id) DO UPDATE SET version = version + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS book_versions_update AFTER UPDATE ON Books BEGIN
+            UPDATE BookVersions SET version = version + 1 WHERE book_id IN (old.book_id, new.book_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS book_versions_delete AFTER DELETE ON Books BEGIN
+            UPDATE BookVersions SET version = version + 1 WHERE book_id = old.book_id;
+        END;
+
+        INSERT OR IGNORE INTO BookVersions (book_id) SELECT book_id FROM Books;
+    """),
+    (11, "Per-table data versions for ETags", etags.SCHEMA),
+    (12, "Job table for the scheduler worker", """
+        -- One row per scheduled job (see scheduler.py). A worker owns a job
+        -- while lease_expires (unix time) is in the future.
+        CREATE TABLE IF NOT EXISTS Jobs (
+            name TEXT PRIMARY KEY,
+            schedule TEXT NOT NULL,
+            next_run TEXT NOT NULL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            attempt INTEGER NOT NULL DEFAULT 0,
+            runs INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            seconds REAL NOT NULL DEFAULT 0,
+            last_started TEXT,
+            last_duration REAL,
+            last_status TEXT CHECK(last_status IN ('ok', 'failed')),
+            last_result TEXT,
+            last_success REAL
+        ) WITHOUT ROWID;
+    """),
+    (13, "Open loan of a copy, for returns by barcode", """
+        -- loans.find_open_loan: the loan a scanned copy is out on
+        CREATE INDEX IF NOT EXISTS idx_txn_copy_open
+            ON Transactions(copy_id) WHERE return_date IS NULL;
+    """),
+]
+
+
+def _statements(script):
+    """Split a SQL script into complete statements (trigger bodies stay intact)"""
+    statements, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                statements.append(buf.strip())
+            buf = ""
+    if buf.strip() and not buf.strip().startswith("--"):
+        statements.append(buf.strip())
+    return statements
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None, verbose=False):
+    """Apply every pending migration, returns the resulting schema version"""
+    own = conn is None
+    if own:
+        conn = db.connect()
+    try:
+        if current_version(conn) >= MIGRATIONS[-1][0]:
+            return current_version(conn)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = current_version(conn)
+            for step_version, description, step in MIGRATIONS:
+                if step_version <= version:
+                    continue
+                if verbose:
+                    print(f"🔄 Migration {step_version}: {description}")
+                if callable(step):
+                    step(conn)
+                else:
+                    for statement in _statements(step):
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={step_version}")
+                version = step_version
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        conn.execute("PRAGMA optimize")
+        return version
+    finally:
+        if own:
+            conn.close()
+
+
+# ==================== QUERY PLAN CHECK ====================
+# Statements that are meant to read a whole table. Anything else that shows
+# up as "SCAN <table>" without an index is reported as a failure.
+ALLOW_FULL_SCAN = {
+    "SELECT f.*, p.name AS patron_name FROM Feedback f LEFT JOIN Patron p ON p.patron_id = f.patron_id ORDER BY f.feedback_id",
+    "SELECT p.*, pt.name AS patron_name FROM Payments p LEFT JOIN Patron pt ON pt.patron_id = p.patron_id ORDER BY p.payment_date DESC",
+    # fines.load_policies: compiles the whole (small) policy tables
+    "SELECT calendar, holiday_date FROM Holidays",
+    "SELECT item_type, role, grace_days, daily_rate, max_fine, calendar FROM FinePolicies ORDER BY policy_id",
+    # main.py initialize_database: default staff accounts, the scan stops at the first match
+    "SELECT * FROM Patron WHERE role = 'Admin'",
+    "SELECT * FROM Patron WHERE role = 'Librarian'",
+    "SELECT * FROM Patron WHERE role = 'Bank'",
+    # main.py admin menus: list every row of a table
+    "SELECT * FROM Patron ORDER BY patron_id",
+    "SELECT * FROM Books ORDER BY book_id",
+    "SELECT t.*, p.name as patron_name, b.title as book_title FROM Transactions t LEFT JOIN Patron p ON t.patron_id = p.patron_id LEFT JOIN Books b ON t.book_id = b.book_id ORDER BY t.transaction_id DESC",
+    "SELECT f.*, p.name as patron_name FROM Feedback f LEFT JOIN Patron p ON f.patron_id = p.patron_id ORDER BY f.feedback_date DESC",
+    # stats.rebuild_stats counts whole tables; read_stats reads the few Stats rows
+    "INSERT INTO Stats(key, value) SELECT 'books.type.' || type, COUNT(*) FROM Books GROUP BY type ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+    "SELECT key, value FROM Stats",
+    # scheduler.py and /metrics: one row per job
+    "SELECT name, schedule FROM Jobs",
+    "SELECT name, schedule, next_run, lease_owner, attempt, runs, failures, seconds, last_started, last_duration, last_status, last_result FROM Jobs ORDER BY next_run",
+    "SELECT name, runs, failures, seconds, last_duration, last_success, attempt FROM Jobs",
+}
+
+# Modules whose queries check_query_plans() EXPLAINs by default
+PLAN_CHECK_MODULES = ("app.py", "main.py", "loans.py", "holds.py", "fines.py", "stats.py", "catalog.py",
+                      "etags.py", "search.py", "pagination.py", "scheduler.py", "metrics.py")
+
+
+def _normalize(sql):
+    return " ".join(sql.split())
+
+
+def find_queries(source_path):
+    """Every literal SQL string passed to .execute()/.executemany() in a file"""
+    with open(source_path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), source_path)
+    queries = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ("execute", "executemany") and node.args
+                and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+            queries.append((node.lineno, node.args[0].value))
+    return queries
+
+
+def check_query_plans(source_paths=None, conn=None):
+    """EXPLAIN QUERY PLAN every query in PLAN_CHECK_MODULES (or `source_paths`).
+
+    Returns a list of (file name, line, statement, plan detail) for the full scans.
+    """
+    if source_paths is None:
+        source_paths = [os.path.join(db.BASE_DIR, name) for name in PLAN_CHECK_MODULES]
+    elif isinstance(source_paths, str):
+        source_paths = [source_paths]
+    own = conn is None
+    if own:
+        conn = db.connect()
+    try:
+        migrate(conn)
+        failures = []
+        for source_path in source_paths:
+            source = os.path.basename(source_path)
+            for lineno, sql in find_queries(source_path):
+                normalized = _normalize(sql)
+                if not normalized.upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+                    continue
+                params = [None] * normalized.count("?")
+                try:
+                    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+                except sqlite3.Error as e:
+                    failures.append((source, lineno, normalized, f"error: {e}"))
+                    continue
+                # Subqueries and CTEs show up as "SCAN <name>" too; their own tables are checked
+                subqueries = {row[3].split()[-1] for row in plan if row[3].startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+                for row in plan:
+                    detail = row[3]
+                    if (detail.startswith("SCAN ") and "INDEX" not in detail and normalized not in ALLOW_FULL_SCAN
+                            and detail.split()[1] not in subqueries):
+                        failures.append((source, lineno, normalized, detail))
+        return failures
+    finally:
+        if own:
+            conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check_plans":
+        failures = check_query_plans(sys.argv[2:] or None)
+        for source, lineno, sql, detail in failures:
+            print(f"❌ {source}:{lineno}: {detail}\n   {sql}")
+        if failures:
+            print(f"\n{len(failures)} full table scan(s) found")
+            sys.exit(1)
+        print("✅ No unexpected full table scans")
+    else:
+        print(f"✅ Schema at version {migrate(verbose=True)}")
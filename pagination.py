@@ -0,0 +1,113 @@
+# pagination.py
+# Keyset (seek) pagination for the list pages.
+import base64
+import json
+import os
+
+from db import FETCH_BATCH
+
+PAGE_SIZE = int(os.environ.get("LIBRARY_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("LIBRARY_MAX_PAGE_SIZE", "500"))
+
+
+def page_size(value):
+    """Parse a ?size= argument, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, width):
+    """Decode an ?after= cursor, None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != width:
+        return None
+    return values
+
+
+def keyset_query(table, order_by, after=None, size=PAGE_SIZE, where="", params=()):
+    """SQL and arguments for one keyset page, with one extra row to detect a next page"""
+    cols = ", ".join(order_by)
+    clauses = [where] if where else []
+    args = list(params)
+    values = decode_cursor(after, len(order_by))
+    if values is not None:
+        clauses.append(f"({cols}) > ({', '.join('?' * len(order_by))})")
+        args.extend(values)
+    sql = f"SELECT * FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {cols} LIMIT ?"
+    args.append(size + 1)
+    return sql, args
+
+
+def keyset_page(conn, table, order_by, after=None, size=PAGE_SIZE, where="", params=()):
+    """Fetch one page of `table` ordered by `order_by` (the last column must be unique).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Seeking on the sort key keeps every page an index range scan instead of
+    an OFFSET that re-reads all earlier rows.
+    """
+    sql, args = keyset_query(table, order_by, after, size, where, params)
+    rows = conn.execute(sql, args).fetchall()
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1][c] for c in order_by)
+    return rows, next_cursor
+
+
+class StreamedPage:
+    """A keyset page that fetches its rows in batches while it is iterated.
+
+    Used by the streamed list pages: `shown` and `next_cursor` are only
+    known once the rows have been consumed, so the pager goes after the list.
+    """
+
+    def __init__(self, conn, table, order_by, after=None, size=PAGE_SIZE, where="", params=(),
+                 batch=FETCH_BATCH):
+        self.conn = conn
+        self.order_by = order_by
+        self.size = size
+        self.batch = batch
+        self.query = keyset_query(table, order_by, after, size, where, params)
+        self.shown = 0
+        self.next_cursor = None
+
+    def batches(self):
+        """Yield lists of at most `batch` rows; single use"""
+        cursor = self.conn.execute(*self.query)
+        last = None
+        try:
+            while self.next_cursor is None:
+                rows = cursor.fetchmany(min(self.batch, self.size + 1 - self.shown))
+                if not rows:
+                    break
+                if self.shown + len(rows) > self.size:
+                    rows.pop()  # the extra row only says there is a next page
+                    last = rows[-1] if rows else last
+                    self.next_cursor = encode_cursor(last[c] for c in self.order_by)
+                if rows:
+                    last = rows[-1]
+                    self.shown += len(rows)
+                    yield rows
+        finally:
+            cursor.close()
+
+    def __iter__(self):
+        for rows in self.batches():
+            yield from rows
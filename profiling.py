@@ -0,0 +1,184 @@
+# profiling.py
+# SQL profiling for the web app, off unless LIBRARY_SQL_PROFILE=1.
+#
+# When on, the pool opens ProfiledConnections: every execute() records the
+# statement, its parameter count, the rows it returned (or changed) and the
+# wall time spent executing and fetching it. app.py collects the records
+# of each request, adds them to per-route aggregates (/sql_stats), logs
+# the statements slower than LIBRARY_SQL_SLOW_MS and sends a Server-Timing
+# header with the request's database time against the rest.
+#
+# Slow statements go to the "library.sql" logger (stderr, or the file in
+# LIBRARY_SQL_SLOW_LOG), one line each with the parameter count but never
+# the parameter values.
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+ENABLED = os.environ.get("LIBRARY_SQL_PROFILE", "0") not in ("", "0")
+SLOW_MS = float(os.environ.get("LIBRARY_SQL_SLOW_MS", "100"))
+SLOW_LOG = os.environ.get("LIBRARY_SQL_SLOW_LOG")
+
+log = logging.getLogger("library.sql")
+if SLOW_LOG:
+    _handler = logging.FileHandler(SLOW_LOG)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    log.addHandler(_handler)
+
+_SPACES = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize(sql):
+    """One line per statement shape: whitespace collapsed, IN (?, ?, ?) lists folded"""
+    return _IN_LIST.sub("(?, ...)", _SPACES.sub(" ", sql).strip())
+
+
+# ==================== INSTRUMENTED CONNECTION ====================
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that adds its execute and fetch time and rows to its query record"""
+
+    _record = None
+
+    def _run(self, method, sql, parameters, param_count):
+        queries = self.connection.queries
+        if queries is None:
+            self._record = None
+            return method(self, sql, parameters)
+        started = time.perf_counter()
+        try:
+            return method(self, sql, parameters)
+        finally:
+            # rowcount is -1 for SELECT; fetched rows are added as they are read
+            self._record = {'sql': sql, 'params': param_count, 'rows': max(self.rowcount, 0),
+                            'seconds': time.perf_counter() - started}
+            queries.append(self._record)
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters, len(parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        # Parameter sets may be a generator; only lists report a count
+        count = len(seq_of_parameters[0]) if isinstance(seq_of_parameters, list) and seq_of_parameters else None
+        return self._run(sqlite3.Cursor.executemany, sql, seq_of_parameters, count)
+
+    def _fetch(self, method, *args):
+        record = self._record
+        if record is None:
+            return method(self, *args)
+        started = time.perf_counter()
+        try:
+            result = method(self, *args)
+        finally:
+            record['seconds'] += time.perf_counter() - started
+        if isinstance(result, list):
+            record['rows'] += len(result)
+        elif result is not None:
+            record['rows'] += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        record = self._record
+        if record is None:
+            return sqlite3.Cursor.__next__(self)
+        started = time.perf_counter()
+        try:
+            row = sqlite3.Cursor.__next__(self)
+        finally:
+            record['seconds'] += time.perf_counter() - started
+        record['rows'] += 1
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are recorded into `queries` while it is a list"""
+
+    queries = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ==================== AGGREGATES ====================
+class SQLProfile:
+    """Statement counts and times per route, and per statement shape within a route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, queries):
+        shapes = [(normalize(q['sql']), q) for q in queries]
+        with self._lock:
+            counts = self._routes.setdefault(route, {'requests': 0, 'queries': 0, 'seconds': 0.0,
+                                                     'statements': {}})
+            counts['requests'] += 1
+            counts['queries'] += len(queries)
+            for sql, q in shapes:
+                counts['seconds'] += q['seconds']
+                statement = counts['statements'].setdefault(sql, {'count': 0, 'seconds': 0.0,
+                                                                  'max_seconds': 0.0, 'rows': 0})
+                statement['count'] += 1
+                statement['seconds'] += q['seconds']
+                statement['max_seconds'] = max(statement['max_seconds'], q['seconds'])
+                statement['rows'] += q['rows']
+
+    def stats(self, top=10):
+        """Per route: requests, queries and db ms per request, and the `top` statements by total time"""
+        with self._lock:
+            routes = {route: (dict(counts), [(sql, dict(s)) for sql, s in counts['statements'].items()])
+                      for route, counts in self._routes.items()}
+        result = {}
+        for route, (counts, statements) in sorted(routes.items(), key=lambda kv: -kv[1][0]['seconds']):
+            requests = counts['requests']
+            statements.sort(key=lambda item: -item[1]['seconds'])
+            result[route] = {
+                'requests': requests,
+                'queries_per_request': round(counts['queries'] / requests, 2),
+                'db_ms_per_request': round(counts['seconds'] * 1000 / requests, 3),
+                'db_ms': round(counts['seconds'] * 1000, 3),
+                'statements': [{'sql': sql, 'count': s['count'], 'total_ms': round(s['seconds'] * 1000, 3),
+                                'mean_ms': round(s['seconds'] * 1000 / s['count'], 3),
+                                'max_ms': round(s['max_seconds'] * 1000, 3),
+                                'rows_per_call': round(s['rows'] / s['count'], 2)}
+                               for sql, s in statements[:top]],
+            }
+        return result
+
+
+def log_slow(route, queries, threshold_ms=SLOW_MS):
+    """Log every statement of a request that took at least `threshold_ms`"""
+    for q in queries:
+        ms = q['seconds'] * 1000
+        if ms >= threshold_ms:
+            log.warning("slow query %.1fms route=%s rows=%d params=%s %s",
+                        ms, route, q['rows'], q['params'], normalize(q['sql']))
+
+
+def server_timing(queries, total_seconds):
+    """Server-Timing header value: db time and count, the rest (view and rendering), total"""
+    db_ms = sum(q['seconds'] for q in queries) * 1000
+    total_ms = total_seconds * 1000
+    return (f'db;dur={db_ms:.2f};desc="{len(queries)} queries", '
+            f'render;dur={max(total_ms - db_ms, 0):.2f}, total;dur={total_ms:.2f}')
+
+
+collector = SQLProfile()
@@ -0,0 +1,402 @@
+# scheduler.py
+# Periodic jobs: fine accrual, hold expiry, Stats rebuild, ANALYZE and VACUUM.
+# Run by the `worker:` line of the procfile, next to the web process.
+#
+#   python scheduler.py               run jobs as they come due, until SIGTERM
+#   python scheduler.py --once        run every job that is due now and exit
+#   python scheduler.py --run NAME    run one job now, whatever its schedule
+#   python scheduler.py --list        schedules, next runs and last results
+#
+# Schedules are five-field cron expressions (minute hour day month weekday,
+# local time); LIBRARY_SCHEDULE_<JOB> replaces one and "off" disables it.
+# Job state lives in the Jobs table, so several workers can share a
+# database: a worker takes a lease on a due job (LIBRARY_JOB_LEASE seconds,
+# renewed while the job runs) and no other worker starts that job until
+# the lease is released or runs out. A failed run is retried up to
+# LIBRARY_JOB_RETRIES times with exponential backoff, then waits for its
+# next scheduled time. Runs, failures and durations per job are in /metrics.
+import argparse
+import logging
+import os
+import random
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+import fines
+import holds
+import migrations
+import stats
+
+LEASE_SECONDS = float(os.environ.get("LIBRARY_JOB_LEASE", "600"))
+RETRIES = int(os.environ.get("LIBRARY_JOB_RETRIES", "3"))
+RETRY_DELAY = float(os.environ.get("LIBRARY_JOB_RETRY_DELAY", "60"))  # doubles each attempt
+RETRY_MAX_DELAY = float(os.environ.get("LIBRARY_JOB_RETRY_MAX_DELAY", "3600"))
+POLL_INTERVAL = float(os.environ.get("LIBRARY_JOB_POLL", "30"))
+
+OFF = "off"
+NEVER = "9999-12-31 00:00:00"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+log = logging.getLogger("library.jobs")
+
+
+# ==================== CRON SCHEDULES ====================
+# (low, high) of minute, hour, day of month, month, weekday (0 and 7 are Sunday)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(text, low, high):
+    """Values matched by one cron field: *, n, a-b, lists and /step"""
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = low, high
+        elif "-" in span:
+            start, end = (int(v) for v in span.split("-", 1))
+        else:
+            start = int(span)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"cron field {part!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Five-field cron expression, matched against naive local datetimes"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS))
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, when both day and weekday are restricted either may match
+        self.either_day = fields[2] != "*" and fields[4] != "*"
+
+    def _day_matches(self, dt):
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        return day or weekday if self.either_day else day and weekday
+
+    def next_after(self, dt):
+        """First matching minute after `dt`"""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=5 * 366)  # "0 0 30 2 *" never comes
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"cron expression never matches: {self.expression!r}")
+
+
+def next_run(expression, now):
+    """next_run column value for a schedule"""
+    if expression == OFF:
+        return NEVER
+    return CronSchedule(expression).next_after(now).strftime(TIME_FORMAT)
+
+
+# ==================== JOBS ====================
+# Each job takes the worker's connection, manages its own transaction and
+# returns a one-line summary for the Jobs table and the log.
+def accrue_fines(conn):
+    result = fines.accrue_fines(conn)
+    if result['skipped']:
+        return f"already accrued for {result['date']}"
+    return f"{result['continuing']} overdue loans updated, {result['newly_overdue']} newly overdue"
+
+
+def expire_holds(conn):
+    return f"{holds.expire_holds(conn)} hold(s) expired"
+
+
+def rebuild_stats(conn):
+    """Recount the Stats table in case a counter drifted from its base tables"""
+    before = stats.read_stats(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stats.rebuild_stats(conn)
+        after = stats.read_stats(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    drifted = sorted(key for key in after if round(after[key], 2) != round(before.get(key, 0), 2))
+    return f"{len(drifted)} counter(s) corrected" + (f": {', '.join(drifted)}" if drifted else "")
+
+
+def analyze(conn):
+    conn.execute("ANALYZE")
+    return "statistics refreshed"
+
+
+def vacuum(conn):
+    """Rebuild the file without free pages, then empty the WAL it went through"""
+    before = conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.execute("VACUUM")
+    after = conn.execute("PRAGMA page_count").fetchone()[0]
+    db.checkpoint("TRUNCATE")
+    return f"{before} -> {after} pages"
+
+
+# (name, default schedule, function)
+JOBS = [
+    ("accrue_fines", "5 0 * * *", accrue_fines),
+    ("expire_holds", "*/15 * * * *", expire_holds),
+    ("rebuild_stats", "30 3 * * *", rebuild_stats),
+    ("analyze", "0 4 * * *", analyze),
+    ("vacuum", "30 4 * * 0", vacuum),
+]
+JOB_FUNCTIONS = {name: function for name, _, function in JOBS}
+
+
+def schedules():
+    """{job: cron expression or "off"}, with the LIBRARY_SCHEDULE_<JOB> overrides"""
+    result = {}
+    for name, default, _ in JOBS:
+        expression = os.environ.get(f"LIBRARY_SCHEDULE_{name.upper()}", default).strip()
+        if expression != OFF:
+            CronSchedule(expression)  # fail at start, not at the first run
+        result[name] = expression
+    return result
+
+
+# ==================== JOB TABLE ====================
+def sync_jobs(conn, now=None):
+    """Add new jobs to the Jobs table and reschedule those whose schedule changed"""
+    now = now or datetime.now()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = dict(conn.execute("SELECT name, schedule FROM Jobs").fetchall())
+        for name, expression in schedules().items():
+            if name not in existing:
+                conn.execute("INSERT INTO Jobs (name, schedule, next_run) VALUES (?, ?, ?)",
+                             (name, expression, next_run(expression, now)))
+            elif existing[name] != expression:
+                conn.execute("UPDATE Jobs SET schedule=?, next_run=?, attempt=0 WHERE name=?",
+                             (expression, next_run(expression, now), name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def claim(conn, owner, name=None, now=None):
+    """Lease the job that has been due longest (or job `name`, due or not).
+
+    Returns the job's name, or None if nothing is due or it is leased by
+    another worker.
+    """
+    now = now or datetime.now()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if name is None:
+            row = conn.execute(f"""
+                SELECT name FROM Jobs
+                WHERE next_run <= ? AND (lease_expires IS NULL OR lease_expires < ?)
+                AND name IN ({','.join('?' * len(JOBS))})
+                ORDER BY next_run LIMIT 1
+            """, (now.strftime(TIME_FORMAT), now.timestamp(), *JOB_FUNCTIONS)).fetchone()
+        else:
+            row = conn.execute("""
+                SELECT name FROM Jobs WHERE name = ? AND (lease_expires IS NULL OR lease_expires < ?)
+            """, (name, now.timestamp())).fetchone()
+        if row is not None:
+            conn.execute("UPDATE Jobs SET lease_owner=?, lease_expires=?, last_started=? WHERE name=?",
+                         (owner, now.timestamp() + LEASE_SECONDS, now.strftime(TIME_FORMAT), row[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row[0] if row is not None else None
+
+
+def retry_delay(attempt):
+    """Seconds before retry number `attempt` (1, 2, ...), with jitter so workers spread out"""
+    return min(RETRY_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY) * random.uniform(0.8, 1.2)
+
+
+def finish(conn, name, owner, seconds, result=None, error=None, now=None):
+    """Record a run, release the lease and set the job's next run"""
+    now = now or datetime.now()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        schedule, attempt, lease_owner = conn.execute(
+            "SELECT schedule, attempt, lease_owner FROM Jobs WHERE name=?", (name,)).fetchone()
+        if error is None:
+            attempt, run_at = 0, next_run(schedule, now)
+        elif attempt < RETRIES:
+            attempt += 1
+            run_at = (now + timedelta(seconds=retry_delay(attempt))).strftime(TIME_FORMAT)
+        else:
+            attempt, run_at = 0, next_run(schedule, now)
+        conn.execute("""
+            UPDATE Jobs SET runs = runs + 1, failures = failures + ?, seconds = seconds + ?,
+                last_duration = ?, last_status = ?, last_result = ?,
+                last_success = CASE WHEN ? THEN ? ELSE last_success END
+            WHERE name = ?
+        """, (error is not None, seconds, seconds, 'failed' if error else 'ok', error or result,
+              error is None, now.timestamp(), name))
+        if lease_owner == owner:
+            conn.execute("""
+                UPDATE Jobs SET attempt=?, next_run=?, lease_owner=NULL, lease_expires=NULL WHERE name=?
+            """, (attempt, run_at, name))
+        else:
+            # The lease ran out mid-run and another worker took the job over
+            log.warning("%s: lease lost to %s, not rescheduling", name, lease_owner)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return attempt, run_at
+
+
+def _renew_lease(name, owner, stop):
+    """Push the lease forward every third of its length until `stop` is set"""
+    conn = db.connect()
+    try:
+        while not stop.wait(LEASE_SECONDS / 3):
+            try:
+                with conn:
+                    conn.execute("UPDATE Jobs SET lease_expires=? WHERE name=? AND lease_owner=?",
+                                 (time.time() + LEASE_SECONDS, name, owner))
+            except sqlite3.Error as e:
+                log.warning("%s: could not renew lease: %s", name, e)
+    finally:
+        conn.close()
+
+
+def run_job(conn, name, owner):
+    """Run a leased job and record the outcome, returns True if it succeeded"""
+    stop = threading.Event()
+    renewer = threading.Thread(target=_renew_lease, args=(name, owner, stop), name=f"lease-{name}",
+                               daemon=True)
+    renewer.start()
+    started = time.perf_counter()
+    result = error = None
+    try:
+        result = JOB_FUNCTIONS[name](conn)
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        error = f"{type(e).__name__}: {e}"
+        log.exception("%s failed", name)
+    finally:
+        stop.set()
+        renewer.join()
+    seconds = time.perf_counter() - started
+    attempt, run_at = finish(conn, name, owner, seconds, result, error)
+    if error is None:
+        log.info("%s done in %.2fs: %s (next %s)", name, seconds, result, run_at)
+    elif attempt:
+        log.warning("%s: retry %d of %d at %s", name, attempt, RETRIES, run_at)
+    else:
+        log.warning("%s: giving up until %s", name, run_at)
+    return error is None
+
+
+def run_due(conn, owner, stop=None):
+    """Run due jobs one after another until none is left, returns how many ran"""
+    count = 0
+    while stop is None or not stop.is_set():
+        name = claim(conn, owner)
+        if name is None:
+            break
+        run_job(conn, name, owner)
+        count += 1
+    return count
+
+
+def seconds_until_due(conn, now=None):
+    """Time until the next job comes due (a leased job counts from its lease end)"""
+    now = now or datetime.now()
+    row = conn.execute(f"""
+        SELECT MIN(MAX(next_run, COALESCE(datetime(lease_expires, 'unixepoch', 'localtime'), '')))
+        FROM Jobs WHERE name IN ({','.join('?' * len(JOBS))})
+    """, list(JOB_FUNCTIONS)).fetchone()
+    if row[0] is None:
+        return None
+    return (datetime.strptime(row[0], TIME_FORMAT) - now).total_seconds()
+
+
+def run_forever(conn, owner, poll=POLL_INTERVAL):
+    """Worker loop: run due jobs, sleep until the next one, stop on SIGTERM or SIGINT"""
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    log.info("scheduler %s started: %s", owner,
+             ", ".join(f"{name} [{expression}]" for name, expression in schedules().items()))
+    while not stop.is_set():
+        run_due(conn, owner, stop)
+        wait = seconds_until_due(conn)
+        # Never sleep past `poll`: schedules and leases change under us
+        stop.wait(poll if wait is None else min(max(wait, 1), poll))
+    log.info("scheduler %s stopped", owner)
+
+
+def print_jobs(conn):
+    rows = conn.execute("""
+        SELECT name, schedule, next_run, lease_owner, attempt, runs, failures, seconds,
+               last_started, last_duration, last_status, last_result
+        FROM Jobs ORDER BY next_run
+    """).fetchall()
+    for row in rows:
+        running = f", running on {row['lease_owner']}" if row['lease_owner'] else ""
+        retry = f", retry {row['attempt']}" if row['attempt'] else ""
+        print(f"{row['name']:<14} [{row['schedule']}] next {row['next_run']}{running}{retry}")
+        if row['runs']:
+            print(f"{'':<14} {row['runs']} runs, {row['failures']} failed, "
+                  f"mean {row['seconds'] / row['runs']:.2f}s; last {row['last_started']} "
+                  f"{row['last_status']} in {row['last_duration']:.2f}s: {row['last_result']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library background jobs")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--once", action="store_true", help="run the jobs that are due, then exit")
+    group.add_argument("--run", metavar="JOB", choices=list(JOB_FUNCTIONS), help="run one job now")
+    group.add_argument("--list", action="store_true", help="show the job table")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    migrations.migrate()
+    conn = db.connect()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        sync_jobs(conn)
+        if args.list:
+            print_jobs(conn)
+        elif args.run:
+            if claim(conn, owner, name=args.run) is None:
+                print(f"⚠️ {args.run} is running on another worker")
+                return 1
+            return 0 if run_job(conn, args.run, owner) else 1
+        elif args.once:
+            run_due(conn, owner)
+        else:
+            run_forever(conn, owner)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
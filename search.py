@@ -0,0 +1,36 @@
+# search.py
+# Catalog search backed by the BooksFTS full-text index (see migrations.py).
+import re
+
+# Column weights for bm25(): title, author, genre, isbn, call_number
+BM25_WEIGHTS = (10.0, 6.0, 2.0, 4.0, 1.0)
+
+
+def fts_query(keyword):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    terms = re.findall(r"\w+", keyword or "")
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_books(conn, keyword, limit=100, highlight=None):
+    """Search the catalog, best BM25 match first.
+
+    With `highlight=(open_tag, close_tag)` the rows also carry title_hl and
+    author_hl with the matched terms wrapped in those tags.
+    """
+    query = fts_query(keyword)
+    if not query:
+        return conn.execute("SELECT * FROM Books ORDER BY title LIMIT ?", (limit,)).fetchall()
+
+    open_tag, close_tag = highlight or ("", "")
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    return conn.execute(f"""
+        SELECT b.*,
+               highlight(BooksFTS, 0, ?, ?) AS title_hl,
+               highlight(BooksFTS, 1, ?, ?) AS author_hl
+        FROM BooksFTS
+        JOIN Books b ON b.book_id = BooksFTS.rowid
+        WHERE BooksFTS MATCH ?
+        ORDER BY bm25(BooksFTS, {weights})
+        LIMIT ?
+    """, (open_tag, close_tag, open_tag, close_tag, query, limit)).fetchall()
@@ -0,0 +1,149 @@
+# stats.py
+# Dashboard counters kept current by triggers, so the admin, librarian and
+# bank pages read a handful of rows instead of scanning every table.
+#
+# Keys:
+#   patrons, patrons.role.<role>
+#   books, books.type.<type>, books.available, books.borrowed
+#   transactions, loans.open, fines.total, fines.outstanding
+#   payments, payments.total
+
+ROLES = ('Admin', 'Librarian', 'Student', 'Guest', 'Bank')
+BOOK_TYPES = ('Physical', 'E-book', 'Audiobook', 'Reference')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Stats (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Patron
+CREATE TRIGGER IF NOT EXISTS stats_patron_insert AFTER INSERT ON Patron BEGIN
+    INSERT OR IGNORE INTO Stats(key, value) VALUES ('patrons.role.' || new.role, 0);
+    UPDATE Stats SET value = value + 1 WHERE key IN ('patrons', 'patrons.role.' || new.role);
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_patron_delete AFTER DELETE ON Patron BEGIN
+    UPDATE Stats SET value = value - 1 WHERE key IN ('patrons', 'patrons.role.' || old.role);
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_patron_update AFTER UPDATE OF role ON Patron
+WHEN old.role IS NOT new.role BEGIN
+    INSERT OR IGNORE INTO Stats(key, value) VALUES ('patrons.role.' || new.role, 0);
+    UPDATE Stats SET value = value - 1 WHERE key = 'patrons.role.' || old.role;
+    UPDATE Stats SET value = value + 1 WHERE key = 'patrons.role.' || new.role;
+END;
+
+-- Books
+CREATE TRIGGER IF NOT EXISTS stats_books_insert AFTER INSERT ON Books BEGIN
+    INSERT OR IGNORE INTO Stats(key, value) VALUES ('books.type.' || new.type, 0);
+    UPDATE Stats SET value = value + 1 WHERE key IN (
+        'books', 'books.type.' || new.type,
+        CASE WHEN COALESCE(new.available, 1) = 1 THEN 'books.available' ELSE 'books.borrowed' END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_books_delete AFTER DELETE ON Books BEGIN
+    UPDATE Stats SET value = value - 1 WHERE key IN (
+        'books', 'books.type.' || old.type,
+        CASE WHEN COALESCE(old.available, 1) = 1 THEN 'books.available' ELSE 'books.borrowed' END);
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_books_update AFTER UPDATE OF type, available ON Books BEGIN
+    INSERT OR IGNORE INTO Stats(key, value) VALUES ('books.type.' || new.type, 0);
+    UPDATE Stats SET value = value - 1 WHERE key IN (
+        'books.type.' || old.type,
+        CASE WHEN COALESCE(old.available, 1) = 1 THEN 'books.available' ELSE 'books.borrowed' END);
+    UPDATE Stats SET value = value + 1 WHERE key IN (
+        'books.type.' || new.type,
+        CASE WHEN COALESCE(new.available, 1) = 1 THEN 'books.available' ELSE 'books.borrowed' END);
+END;
+
+-- Transactions
+CREATE TRIGGER IF NOT EXISTS stats_txn_insert AFTER INSERT ON Transactions BEGIN
+    UPDATE Stats SET value = value + 1 WHERE key = 'transactions';
+    UPDATE Stats SET value = value + COALESCE(new.fine, 0) WHERE key = 'fines.total';
+    UPDATE Stats SET value = value + 1 WHERE key = 'loans.open' AND new.return_date IS NULL;
+    UPDATE Stats SET value = value + COALESCE(new.fine, 0) WHERE key = 'fines.outstanding' AND new.return_date IS NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_txn_delete AFTER DELETE ON Transactions BEGIN
+    UPDATE Stats SET value = value - 1 WHERE key = 'transactions';
+    UPDATE Stats SET value = value - COALESCE(old.fine, 0) WHERE key = 'fines.total';
+    UPDATE Stats SET value = value - 1 WHERE key = 'loans.open' AND old.return_date IS NULL;
+    UPDATE Stats SET value = value - COALESCE(old.fine, 0) WHERE key = 'fines.outstanding' AND old.return_date IS NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_txn_update AFTER UPDATE OF fine, return_date ON Transactions BEGIN
+    UPDATE Stats SET value = value - COALESCE(old.fine, 0) + COALESCE(new.fine, 0) WHERE key = 'fines.total';
+    UPDATE Stats SET value = value
+        - (CASE WHEN old.return_date IS NULL THEN 1 ELSE 0 END)
+        + (CASE WHEN new.return_date IS NULL THEN 1 ELSE 0 END)
+        WHERE key = 'loans.open';
+    UPDATE Stats SET value = value
+        - (CASE WHEN old.return_date IS NULL THEN COALESCE(old.fine, 0) ELSE 0 END)
+        + (CASE WHEN new.return_date IS NULL THEN COALESCE(new.fine, 0) ELSE 0 END)
+        WHERE key = 'fines.outstanding';
+END;
+
+-- Payments
+CREATE TRIGGER IF NOT EXISTS stats_payments_insert AFTER INSERT ON Payments BEGIN
+    UPDATE Stats SET value = value + 1 WHERE key = 'payments';
+    UPDATE Stats SET value = value + COALESCE(new.amount, 0) WHERE key = 'payments.total';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_payments_delete AFTER DELETE ON Payments BEGIN
+    UPDATE Stats SET value = value - 1 WHERE key = 'payments';
+    UPDATE Stats SET value = value - COALESCE(old.amount, 0) WHERE key = 'payments.total';
+END;
+
+CREATE TRIGGER IF NOT EXISTS stats_payments_update AFTER UPDATE OF amount ON Payments BEGIN
+    UPDATE Stats SET value = value - COALESCE(old.amount, 0) + COALESCE(new.amount, 0) WHERE key = 'payments.total';
+END;
+"""
+
+
+def rebuild_stats(conn):
+    """Recompute every counter from the base tables"""
+    conn.execute("DELETE FROM Stats")
+    keys = ['patrons', 'books', 'books.available', 'books.borrowed', 'transactions',
+            'loans.open', 'fines.total', 'fines.outstanding', 'payments', 'payments.total']
+    keys += [f'patrons.role.{r}' for r in ROLES] + [f'books.type.{t}' for t in BOOK_TYPES]
+    conn.executemany("INSERT INTO Stats(key, value) VALUES (?, 0)", [(k,) for k in keys])
+
+    totals = {
+        'patrons': "SELECT COUNT(*) FROM Patron",
+        'books': "SELECT COUNT(*) FROM Books",
+        'books.available': "SELECT COUNT(*) FROM Books WHERE COALESCE(available, 1) = 1",
+        'books.borrowed': "SELECT COUNT(*) FROM Books WHERE COALESCE(available, 1) <> 1",
+        'transactions': "SELECT COUNT(*) FROM Transactions",
+        'loans.open': "SELECT COUNT(*) FROM Transactions WHERE return_date IS NULL",
+        'fines.total': "SELECT COALESCE(SUM(fine), 0) FROM Transactions",
+        'fines.outstanding': "SELECT COALESCE(SUM(fine), 0) FROM Transactions WHERE return_date IS NULL",
+        'payments': "SELECT COUNT(*) FROM Payments",
+        'payments.total': "SELECT COALESCE(SUM(amount), 0) FROM Payments",
+    }
+    for key, sql in totals.items():
+        conn.execute("UPDATE Stats SET value = (" + sql + ") WHERE key = ?", (key,))
+    conn.execute("""
+        INSERT INTO Stats(key, value) SELECT 'patrons.role.' || role, COUNT(*) FROM Patron GROUP BY role
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """)
+    conn.execute("""
+        INSERT INTO Stats(key, value) SELECT 'books.type.' || type, COUNT(*) FROM Books GROUP BY type
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """)
+
+
+def read_stats(conn):
+    """All counters as a dict (counts as int, money as float)"""
+    stats = {}
+    for key, value in conn.execute("SELECT key, value FROM Stats"):
+        money = key.startswith('fines.') or key == 'payments.total'
+        stats[key] = round(value, 2) if money else int(value)
+    return stats
+
+
+def grouped(stats, prefix):
+    """[(name, count)] for keys under a prefix, largest first"""
+    items = [(k[len(prefix):], v) for k, v in stats.items() if k.startswith(prefix) and v]
+    return sorted(items, key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,50 @@
+# tests/conftest.py
+# Every test runs against a copy of the sample library.db, never the file in
+# the repo: LIBRARY_DB points at a scratch copy before any module reads it.
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_scratch = tempfile.mkdtemp()
+os.environ["LIBRARY_DB"] = os.path.join(_scratch, "library.db")
+os.environ["LIBRARY_DB_CHECKPOINT_INTERVAL"] = "0"
+os.environ.pop("LIBRARY_METRICS_DIR", None)
+shutil.copy(os.path.join(ROOT, "library.db"), os.environ["LIBRARY_DB"])
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_scratch, ignore_errors=True)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated copy of the sample database of its own"""
+    path = str(tmp_path / "library.db")
+    shutil.copy(os.path.join(ROOT, "library.db"), path)
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = db.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client():
+    """Test client of the web app, on the session's scratch database"""
+    import app
+    return app.app.test_client()
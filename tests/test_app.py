@@ -0,0 +1,97 @@
+import logging
+
+import app as library
+import db
+import loans
+from test_loans import add_book, add_students, book_state, copy_statuses
+
+
+def test_query_count_warning_is_logged_after_the_request(client, monkeypatch, caplog):
+    # The warning is written in teardown_appcontext, after the request context is gone
+    monkeypatch.setattr(library, "QUERY_WARN_THRESHOLD", 1)
+    with caplog.at_level(logging.WARNING):
+        response = client.get("/guest")
+        response.get_data()
+    assert response.status_code == 200
+    assert any("GET /guest ran" in record.getMessage() for record in caplog.records)
+
+
+def test_no_query_count_warning_under_the_threshold(client, caplog):
+    with caplog.at_level(logging.WARNING):
+        client.get("/guest").get_data()
+    assert not any("SQL statements" in record.getMessage() for record in caplog.records)
+
+
+def test_librarian_return_closes_the_scanned_copy(client):
+    conn = db.connect(db.DB_PATH)
+    try:
+        book_id = add_book(conn, copies=2)
+        first, second = add_students(conn, 2)
+        loans.borrow_book(conn, first, book_id, "2025-01-01")
+        loans.borrow_book(conn, second, book_id, "2025-01-02")
+        older, newer = loans.open_loans(conn, book_id)
+        with client.session_transaction() as session:
+            session["role"] = "Librarian"
+
+        assert client.post(f"/librarian/return_book/{book_id}").status_code == 200  # nothing scanned
+        response = client.post(f"/librarian/return_book/{book_id}", data={"barcode": older['barcode']})
+        assert response.status_code == 302
+        assert [t['transaction_id'] for t in loans.open_loans(conn, book_id)] == [newer['transaction_id']]
+
+        response = client.post(f"/librarian/return_book/{book_id}", data={"transaction_id": newer['transaction_id']})
+        assert response.status_code == 302
+        assert loans.open_loans(conn, book_id) == []
+    finally:
+        conn.close()
+
+
+def test_admin_loans_and_book_edits_keep_copies_in_step(client):
+    conn = db.connect(db.DB_PATH)
+    try:
+        book_id = add_book(conn)
+        patron, other = add_students(conn, 2)
+
+        client.post("/admin/create/txn", data={"patron_id": patron, "book_id": book_id, "borrow_date": "2025-01-01"})
+        [loan] = loans.open_loans(conn, book_id)
+        assert copy_statuses(conn, book_id) == ['on_loan']
+        response = client.post("/admin/create/txn", data={"patron_id": other, "book_id": book_id,
+                                                          "borrow_date": "2025-01-02"})
+        assert b"No copy of this book is available" in response.data
+
+        # Editing the book leaves availability to the copies
+        with client.session_transaction() as session:
+            session["role"] = "Librarian"
+        client.post(f"/librarian/edit/{book_id}", data={"title": "Loan Test", "available": "1"})
+        assert book_state(conn, book_id) == (0, 0)
+
+        client.post(f"/admin/update/txn/{loan['transaction_id']}", data={"return_date": ""})
+        assert loans.open_loans(conn, book_id)  # an empty field does not reopen or close anything
+        client.post(f"/admin/delete/txn/{loan['transaction_id']}")
+        assert loans.open_loans(conn, book_id) == []
+        assert copy_statuses(conn, book_id) == ['available']
+        assert book_state(conn, book_id) == (1, 1)
+    finally:
+        conn.close()
+
+
+def test_bank_update_changes_the_payment(client):
+    conn = db.connect(db.DB_PATH)
+    try:
+        book_id = add_book(conn)
+        [patron] = add_students(conn, 1)
+        loan = loans.borrow_book(conn, patron, book_id, "2025-01-01")['transaction_id']
+        # One payment whose id is also an open loan's, one whose id is no loan's
+        conn.execute("INSERT OR IGNORE INTO Payments (payment_id, patron_id, amount, payment_date, purpose) "
+                     "VALUES (?, ?, 1.0, '2025-01-01', 'Fine')", (loan, patron))
+        other = conn.execute("INSERT INTO Payments (patron_id, amount, payment_date, purpose) "
+                             "VALUES (?, 1.0, '2025-01-01', 'Fine')", (patron,)).lastrowid
+        conn.commit()
+        assert not conn.execute("SELECT 1 FROM Transactions WHERE transaction_id = ?", (other,)).fetchone()
+
+        for payment_id in (loan, other):
+            response = client.post(f"/bank/update/{payment_id}", data={"amount": "7.5", "purpose": "Fine paid"})
+            assert response.status_code == 302 and response.location.endswith("/bank")
+            row = conn.execute("SELECT amount, purpose FROM Payments WHERE payment_id = ?", (payment_id,)).fetchone()
+            assert (row['amount'], row['purpose']) == (7.5, "Fine paid")
+    finally:
+        conn.close()
@@ -0,0 +1,34 @@
+import db
+import etags
+from test_loans import add_book
+
+
+def test_writes_bump_the_table_version(conn):
+    before = etags.read_versions(conn, etags.TABLES)
+    assert set(before) == set(etags.TABLES)
+    book_id = add_book(conn)  # a Books row and its first copy
+    conn.execute("UPDATE Books SET genre = 'Changed' WHERE book_id = ?", (book_id,))
+    conn.commit()
+    after = etags.read_versions(conn, etags.TABLES)
+    assert after['Books'] > before['Books'] and after['Copies'] > before['Copies']
+    assert {t: v for t, v in after.items() if t not in ('Books', 'Copies')} == \
+        {t: v for t, v in before.items() if t not in ('Books', 'Copies')}
+    assert etags.make_etag(after) != etags.make_etag(before)
+    assert etags.make_etag(after, "page") != etags.make_etag(after, "other page")
+
+
+def test_conditional_get_until_the_data_changes(client):
+    first = client.get("/guest_view_book/1")
+    first.get_data()
+    tag = first.headers["ETag"]
+    assert first.status_code == 200 and tag.startswith('W/')
+    assert client.get("/guest_view_book/1", headers={"If-None-Match": tag}).status_code == 304
+
+    conn = db.connect(db.DB_PATH)
+    try:
+        add_book(conn)
+    finally:
+        conn.close()
+    changed = client.get("/guest_view_book/1", headers={"If-None-Match": tag})
+    changed.get_data()
+    assert changed.status_code == 200 and changed.headers["ETag"] != tag
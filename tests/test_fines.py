@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import fines
+
+TODAY = datetime.now()
+AGO = lambda days: (TODAY - timedelta(days=days)).strftime("%Y-%m-%d")  # noqa: E731
+
+# (borrow_date, return_date) pairs calculate_fine() accepts
+LOANS = [
+    ("2024-01-01", "2024-01-20"),
+    ("2024-01-01", "2024-01-10"),
+    ("2024-01-01", ""),
+    ("2024-01-01", None),
+    (AGO(40), ""),
+    (AGO(40), None),
+    (AGO(3), None),
+    ("2024-01-01", datetime(2024, 3, 1)),
+    (datetime(2024, 1, 1), "2024-03-01"),
+    (datetime(2024, 1, 1), None),
+    ("not a date", "2024-03-01"),
+    ("2024-01-01", "2024-13-40"),
+    ("", "2024-03-01"),
+    (None, "2024-03-01"),
+    ("2024-03-01", "2024-01-01"),
+]
+
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(fines, "np", None)
+    return request.param
+
+
+@pytest.fixture
+def holiday_policies(conn, monkeypatch):
+    """A Physical/Student rule with a cap and a holiday calendar in force for the test"""
+    monkeypatch.setattr(fines, "_policies", fines._policies)
+    monkeypatch.setattr(fines, "_checked_at", fines._checked_at)
+    conn.executemany("INSERT INTO Holidays (calendar, holiday_date, name) VALUES ('MY', ?, 'Holiday')",
+                     [("2024-01-25",), ("2024-02-01",), ("2024-02-02",), (AGO(10),)])
+    conn.execute("""
+        INSERT INTO FinePolicies (item_type, role, grace_days, daily_rate, max_fine, calendar)
+        VALUES ('Physical', 'Student', 7, 0.5, 20, 'MY')
+    """)
+    conn.commit()
+    fines.load_policies(conn)
+    return conn
+
+
+def batch(loans, **kwargs):
+    return list(fines.calculate_fines([b for b, _ in loans], [r for _, r in loans], **kwargs).fines)
+
+
+def test_calculate_fines_matches_calculate_fine(backend):
+    assert batch(LOANS) == [fines.calculate_fine(b, r) for b, r in LOANS]
+
+
+def test_empty_return_date_means_still_out(backend):
+    assert batch([("2024-01-01", "")]) == [fines.calculate_fine("2024-01-01", "")]
+    assert batch([("2024-01-01", "")])[0] > 0
+
+
+def test_calculate_fines_matches_per_policy_and_holidays(backend, holiday_policies):
+    conn = holiday_policies
+    types = [("Physical", "Student"), ("Physical", "Staff"), ("E-book", "Student")]
+    rows = [(loan, kind) for loan in LOANS for kind in types]
+    expected = [fines.calculate_fine(b, r, t, role, conn) for (b, r), (t, role) in rows]
+    got = batch([loan for loan, _ in rows], item_types=[t for _, (t, _) in rows],
+                roles=[role for _, (_, role) in rows], conn=conn)
+    assert got == expected
+    # The holidays and the cap did apply: 40 days - 7 grace - 3 holidays at RM 0.50, capped at RM 20
+    assert fines.calculate_fine("2024-01-01", "2024-02-10", "Physical", "Student", conn) == 15.0
+    assert fines.calculate_fine("2024-01-01", "2024-06-01", "Physical", "Student", conn) == 20.0
+
+
+def test_policy_edits_are_picked_up_after_the_reload_interval(conn, monkeypatch):
+    monkeypatch.setattr(fines, "_policies", fines._policies)
+    monkeypatch.setattr(fines, "_checked_at", fines._checked_at)
+    loaded = fines.load_policies(conn)
+    assert fines.policies(conn) is loaded  # nothing changed
+
+    conn.execute("""
+        INSERT INTO FinePolicies (item_type, role, grace_days, daily_rate, max_fine, calendar)
+        VALUES ('Audiobook', 'Staff', 30, 2.0, NULL, NULL)
+    """)
+    conn.commit()
+    # Within the interval the compiled table is used as is
+    monkeypatch.setattr(fines, "RELOAD_INTERVAL", 3600)
+    assert fines.policies(conn) is loaded
+    monkeypatch.setattr(fines, "RELOAD_INTERVAL", 0)
+    reloaded = fines.policies(conn)
+    assert reloaded is not loaded and reloaded.version == fines.policy_version(conn) > loaded.version
+    assert reloaded.lookup('Audiobook', 'Staff').grace_days == 30
+    assert fines.calculate_fine("2024-01-01", "2024-02-10", 'Audiobook', 'Staff', conn) == 20.0
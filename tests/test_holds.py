@@ -0,0 +1,47 @@
+import holds
+import loans
+from test_loans import add_book, add_students, copy_statuses
+
+
+def test_place_hold_statuses(conn):
+    book_id = add_book(conn)
+    reader, waiting = add_students(conn, 2)
+    assert holds.place_hold(conn, waiting, book_id)['status'] == holds.AVAILABLE  # a copy is on the shelf
+    loans.borrow_book(conn, reader, book_id, "2025-01-01")
+
+    assert holds.place_hold(conn, reader, book_id)['status'] == holds.ALREADY_BORROWED
+    assert holds.place_hold(conn, waiting, 10 ** 9)['status'] == holds.NOT_FOUND
+    ebook = conn.execute("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, available)
+        VALUES ('Hold Test', 'Tester', 'HOLD-TEST', 2025, 'Test', 'E-book', 'HT 1', 1)
+    """).lastrowid
+    assert holds.place_hold(conn, waiting, ebook)['status'] == holds.NOT_HOLDABLE
+    placed = holds.place_hold(conn, waiting, book_id, "2025-01-02")
+    assert placed['status'] == holds.PLACED
+    assert holds.place_hold(conn, waiting, book_id) == {'status': holds.ALREADY_HELD, 'hold_id': placed['hold_id']}
+
+
+def test_queue_order_and_positions(conn):
+    book_id = add_book(conn)
+    reader, first, second, urgent = add_students(conn, 4)
+    txn = loans.borrow_book(conn, reader, book_id, "2025-01-01")['transaction_id']
+    ids = {p: holds.place_hold(conn, p, book_id, "2025-01-02")['hold_id'] for p in (first, second, urgent)}
+    conn.execute("UPDATE Holds SET priority = 1 WHERE hold_id = ?", (ids[urgent],))
+    conn.commit()
+
+    # Higher priority first, then first come first served
+    assert holds.next_hold(conn, book_id)['patron_id'] == urgent
+    assert [position for _, position in holds.patron_holds(conn, second)] == [3]
+    assert [position for _, position in holds.patron_holds(conn, first)] == [2]
+
+    loans.return_loan(conn, txn, "2025-01-05", 0)
+    assert holds.ready_hold(conn, urgent, book_id)['status'] == 'ready'
+    assert [position for _, position in holds.patron_holds(conn, second)] == [2]
+    assert copy_statuses(conn, book_id) == ['on_hold']
+
+
+def test_dispatch_copy_without_a_queue_leaves_the_copy_alone(conn):
+    book_id = add_book(conn)
+    copy_id = conn.execute("SELECT copy_id FROM Copies WHERE book_id = ?", (book_id,)).fetchone()[0]
+    assert holds.dispatch_copy(conn, book_id, copy_id, "2025-01-01") is None
+    assert copy_statuses(conn, book_id) == ['available']
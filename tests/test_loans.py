@@ -0,0 +1,178 @@
+import threading
+
+import db
+import holds
+import loans
+
+
+def add_book(conn, copies=1):
+    """A physical book with `copies` copies on the shelf, returns its book_id"""
+    book_id = conn.execute("""
+        INSERT INTO Books (title, author, isbn, published_year, genre, type, call_number, shelf_location, available)
+        VALUES ('Loan Test', 'Tester', 'LOAN-TEST-' || (SELECT MAX(book_id) + 1 FROM Books), 2025, 'Test',
+                'Physical', 'LT 1', 'T', 1)
+    """).lastrowid
+    conn.commit()
+    loans.add_copies(conn, book_id, copies - 1)
+    return book_id
+
+
+def add_students(conn, count):
+    ids = [conn.execute("""
+        INSERT INTO Patron (name, role, email, password)
+        VALUES (?, 'Student', 'student' || (SELECT MAX(patron_id) + 1 FROM Patron) || '@loans.test', 'x')
+    """, (f"Student {i}",)).lastrowid for i in range(count)]
+    conn.commit()
+    return ids
+
+
+def book_state(conn, book_id):
+    row = conn.execute("SELECT available, available_count FROM Books WHERE book_id = ?", (book_id,)).fetchone()
+    return row['available'], row['available_count']
+
+
+def copy_statuses(conn, book_id):
+    return sorted(r['status'] for r in conn.execute("SELECT status FROM Copies WHERE book_id = ?", (book_id,)))
+
+
+def test_one_winner_for_the_last_copy(db_path, conn):
+    book_id = add_book(conn)
+    patron_ids = add_students(conn, 8)
+    for round_no in range(5):
+        barrier = threading.Barrier(len(patron_ids))
+        results = []
+
+        def borrow(patron_id):
+            own = db.connect(db_path)
+            try:
+                barrier.wait()
+                results.append(loans.borrow_book(own, patron_id, book_id, "2025-01-01")['status'])
+            finally:
+                own.close()
+
+        threads = [threading.Thread(target=borrow, args=(p,)) for p in patron_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(results) == [loans.BORROWED] + [loans.UNAVAILABLE] * (len(patron_ids) - 1)
+        open_loans = conn.execute("SELECT transaction_id FROM Transactions WHERE book_id = ? AND return_date IS NULL",
+                                  (book_id,)).fetchall()
+        assert len(open_loans) == 1
+        assert book_state(conn, book_id) == (0, 0)
+        assert loans.return_loan(conn, open_loans[0]['transaction_id'], "2025-01-02", 0)
+        assert book_state(conn, book_id) == (1, 1)
+
+
+def test_borrow_statuses(conn):
+    book_id = add_book(conn)
+    first, second = add_students(conn, 2)
+    borrowed = loans.borrow_book(conn, first, book_id, "2025-01-01")
+    assert borrowed['status'] == loans.BORROWED and borrowed['copy_id'] is not None
+    assert loans.borrow_book(conn, first, book_id, "2025-01-02")['status'] == loans.ALREADY_BORROWED
+    assert loans.borrow_book(conn, second, book_id, "2025-01-02")['status'] == loans.UNAVAILABLE
+    assert loans.borrow_book(conn, second, 10 ** 9, "2025-01-02")['status'] == loans.NOT_FOUND
+
+
+def test_return_loans_closes_each_open_loan_once(conn):
+    book_id = add_book(conn, copies=3)
+    patrons = add_students(conn, 3)
+    txns = [loans.borrow_book(conn, p, book_id, "2025-01-01")['transaction_id'] for p in patrons]
+    assert book_state(conn, book_id) == (0, 0)
+    assert loans.return_loan(conn, txns[2], "2025-01-05", 0)
+
+    closed = loans.return_loans(conn, [
+        (txns[0], "2025-01-20", 6.0),
+        (txns[0], "2025-01-21", 7.0),   # listed twice: the first wins
+        (txns[1], "2025-01-10", 0),
+        (txns[2], "2025-01-30", 16.0),  # already returned
+        (10 ** 9, "2025-01-30", 1.0),   # no such loan
+    ])
+    assert closed == 2
+    rows = {r['transaction_id']: (r['return_date'], r['fine']) for r in conn.execute(
+        "SELECT transaction_id, return_date, fine FROM Transactions WHERE book_id = ?", (book_id,))}
+    assert rows == {txns[0]: ("2025-01-20", 6.0), txns[1]: ("2025-01-10", 0), txns[2]: ("2025-01-05", 0)}
+    assert book_state(conn, book_id) == (1, 3)
+    assert copy_statuses(conn, book_id) == ['available'] * 3
+    assert loans.return_loans(conn, []) == 0
+
+
+def test_find_open_loan_by_barcode_or_transaction(conn):
+    book_id = add_book(conn, copies=3)
+    patrons = add_students(conn, 3)
+    txns = [loans.borrow_book(conn, p, book_id, "2025-01-01")['transaction_id'] for p in patrons]
+    out = loans.open_loans(conn, book_id)
+    assert [t['transaction_id'] for t in out] == txns
+    assert len({t['barcode'] for t in out}) == 3
+
+    # The copy handed back decides whose loan closes, not which loan is newest
+    scanned = loans.find_open_loan(conn, barcode=out[0]['barcode'])
+    assert scanned['transaction_id'] == txns[0] and scanned['patron_id'] == patrons[0]
+    assert scanned['role'] == 'Student' and scanned['patron_name'] == "Student 0"
+    assert loans.find_open_loan(conn, transaction_id=txns[1])['barcode'] == out[1]['barcode']
+
+    assert loans.return_loans(conn, [(scanned['transaction_id'], "2025-01-05", 0)]) == 1
+    assert [t['transaction_id'] for t in loans.open_loans(conn, book_id)] == txns[1:]
+    assert loans.find_open_loan(conn, barcode=out[0]['barcode']) is None
+    assert loans.find_open_loan(conn, transaction_id=txns[0]) is None
+    assert loans.find_open_loan(conn, barcode="NO-SUCH-COPY") is None
+
+
+def test_deleting_an_open_loan_frees_its_copy(conn):
+    book_id = add_book(conn)
+    reader, waiting = add_students(conn, 2)
+    txn = loans.borrow_book(conn, reader, book_id, "2025-01-01")['transaction_id']
+    past = loans.record_returned_loan(conn, waiting, book_id, "2024-12-01", "2024-12-08", 0, 'Physical')
+    assert copy_statuses(conn, book_id) == ['on_loan']  # the back-dated loan holds no copy
+
+    assert loans.delete_loan(conn, txn, "2025-01-05")
+    assert copy_statuses(conn, book_id) == ['available']
+    assert book_state(conn, book_id) == (1, 1)
+    assert loans.delete_loan(conn, past, "2025-01-05")
+    assert not loans.delete_loan(conn, txn, "2025-01-05")
+    assert conn.execute("SELECT COUNT(*) FROM Transactions WHERE book_id = ?", (book_id,)).fetchone()[0] == 0
+
+
+def test_returned_copy_goes_to_the_next_hold(conn):
+    book_id = add_book(conn)
+    reader, first, second = add_students(conn, 3)
+    txn = loans.borrow_book(conn, reader, book_id, "2025-01-01")['transaction_id']
+    assert holds.place_hold(conn, first, book_id, "2025-01-02")['status'] == holds.PLACED
+    assert holds.place_hold(conn, second, book_id, "2025-01-03")['status'] == holds.PLACED
+    assert holds.place_hold(conn, first, book_id)['status'] == holds.ALREADY_HELD
+
+    loans.return_loan(conn, txn, "2025-01-10", 0)
+    # Set aside for the first in line instead of going back on the shelf
+    assert copy_statuses(conn, book_id) == ['on_hold']
+    assert book_state(conn, book_id) == (0, 0)
+    hold = holds.ready_hold(conn, first, book_id)
+    assert hold['status'] == 'ready'
+    assert conn.execute("SELECT expires_date FROM Holds WHERE hold_id = ?", (hold['hold_id'],)).fetchone()[0] \
+        == "2025-01-13"
+    assert loans.borrow_book(conn, second, book_id, "2025-01-11")['status'] == loans.UNAVAILABLE
+
+    # Collecting it
+    collected = loans.borrow_book(conn, first, book_id, "2025-01-11")
+    assert collected['status'] == loans.BORROWED and collected['copy_id'] == hold['copy_id']
+    assert conn.execute("SELECT status FROM Holds WHERE hold_id = ?", (hold['hold_id'],)).fetchone()[0] == 'collected'
+    assert copy_statuses(conn, book_id) == ['on_loan']
+
+
+def test_uncollected_hold_expires_and_the_copy_moves_on(conn):
+    book_id = add_book(conn)
+    reader, first, second = add_students(conn, 3)
+    txn = loans.borrow_book(conn, reader, book_id, "2025-01-01")['transaction_id']
+    holds.place_hold(conn, first, book_id, "2025-01-02")
+    holds.place_hold(conn, second, book_id, "2025-01-03")
+    loans.return_loan(conn, txn, "2025-01-10", 0)
+
+    assert holds.expire_holds(conn, "2025-01-13") == 0
+    assert holds.expire_holds(conn, "2025-01-14") == 1
+    assert holds.ready_hold(conn, first, book_id) is None
+    assert holds.ready_hold(conn, second, book_id)['status'] == 'ready'
+
+    # Cancelling the last hold puts the copy back on the shelf
+    assert holds.cancel_hold(conn, holds.ready_hold(conn, second, book_id)['hold_id'], second)
+    assert copy_statuses(conn, book_id) == ['available']
+    assert book_state(conn, book_id) == (1, 1)
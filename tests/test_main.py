@@ -0,0 +1,68 @@
+import io
+import os
+
+import loans
+import main
+import stats
+from test_loans import add_book, add_students
+
+
+def test_book_import_rejects_an_unknown_type_with_its_line():
+    stream = io.StringIO(
+        "title,author,isbn,genre,call_number,type\n"
+        "Dune,Herbert,111,SF,SF 1,ebook\n"
+        "Emma,Austen,222,Classic,CL 1,\n"
+        "Kim,Kipling,333,Classic,CL 2,audiobook\n"
+    )
+    rows, errors = main.load_batch(stream, "csv", main.parse_book)
+    assert errors == ["line 2: invalid type 'ebook' (one of Physical, E-book, Audiobook, Reference)"]
+    assert [row[5] for row in rows] == ['Physical', 'Audiobook']  # left out: Physical, as in add_book()
+
+
+def test_txns_return_by_book_id_needs_a_single_open_loan(db_path, conn, monkeypatch, capsys):
+    monkeypatch.chdir(os.path.dirname(db_path))  # main.get_db() opens ./library.db
+    book_id = add_book(conn, copies=2)
+    first, second = add_students(conn, 2)
+    loans.borrow_book(conn, first, book_id, "2025-01-01")
+    loans.borrow_book(conn, second, book_id, "2025-01-02")
+    older, newer = loans.open_loans(conn, book_id)
+
+    def txns_return(*options):
+        args = main.build_parser().parse_args(["txns", "return", "--date", "2025-01-03", *options])
+        return args.func(args)
+
+    # Two copies out: the book id alone does not say whose loan it is
+    assert txns_return("--book-id", str(book_id)) == 1
+    assert "give its transaction_id or the copy's barcode" in capsys.readouterr().err
+    assert len(loans.open_loans(conn, book_id)) == 2
+
+    assert txns_return("--barcode", older['barcode']) == 0
+    assert [t['transaction_id'] for t in loans.open_loans(conn, book_id)] == [newer['transaction_id']]
+    assert txns_return("--book-id", str(book_id)) == 0
+    assert loans.open_loans(conn, book_id) == []
+
+
+def test_books_import_matches_what_the_triggers_would_write(db_path, conn, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(db_path))
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name").fetchall()
+    monkeypatch.setattr("sys.stdin", io.StringIO(
+        "title,author,isbn,genre,call_number,type\n"
+        "Zephyr Atlas,Mora,IMP-1,Maps,IMP 1,Physical\n"
+        "Zephyr Audio,Mora,IMP-2,Maps,IMP 2,Audiobook\n"
+    ))
+    args = main.build_parser().parse_args(["books", "import"])
+    assert args.func(args) == 0
+
+    physical, audio = conn.execute("SELECT book_id, available, available_count FROM Books "
+                                   "WHERE isbn IN ('IMP-1', 'IMP-2') ORDER BY isbn").fetchall()
+    assert tuple(physical)[1:] == (1, 1) and tuple(audio)[1:] == (1, 0)
+    assert [tuple(r) for r in conn.execute("SELECT barcode, status FROM Copies WHERE book_id IN (?, ?)",
+                                           (physical[0], audio[0]))] == [(f"BK{physical[0]:06d}-1", 'available')]
+    assert {r[0] for r in conn.execute("SELECT rowid FROM BooksFTS WHERE BooksFTS MATCH 'zephyr'")} == \
+        {physical[0], audio[0]}
+    # The set-aside triggers are back as they were, and the counters agree with a rebuild
+    assert conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' ORDER BY name").fetchall() == triggers
+    counters = stats.read_stats(conn)
+    stats.rebuild_stats(conn)
+    assert stats.read_stats(conn) == counters
+    conn.rollback()
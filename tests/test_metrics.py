@@ -0,0 +1,34 @@
+import app as library
+import db
+import profiling
+
+GUEST = [['endpoint', 'guest']]
+
+
+def histogram(name, labels):
+    """[per-bucket counts..., sum, count] of one series, None if never observed"""
+    for series_name, series_labels, value in library.metrics.registry.snapshot()['histograms']:
+        if series_name == name and [list(label) for label in series_labels] == labels:
+            return value
+    return None
+
+
+def test_metrics_do_not_profile_connections(client):
+    # Metrics are on by default, SQL profiling is not: statements run unwrapped
+    assert library.metrics.ENABLED and not profiling.ENABLED
+    assert db.pool.factory is not profiling.ProfiledConnection
+
+    client.get("/guest").get_data()
+    page = client.get("/metrics").get_data(as_text=True)
+    assert 'library_db_queries_total{endpoint="guest"}' in page
+    assert 'library_db_pool_checkout_seconds_count{endpoint="guest"}' in page
+    assert "library_db_duration_seconds" not in page
+
+
+def test_checkout_time_is_observed_without_profiling(client):
+    before = histogram('library_db_pool_checkout_seconds', GUEST)
+    client.get("/guest").get_data()
+    after = histogram('library_db_pool_checkout_seconds', GUEST)
+    assert after[-1] == (before[-1] if before else 0) + 1
+    assert after[-2] > (before[-2] if before else 0)
+    assert histogram('library_db_duration_seconds', GUEST) is None
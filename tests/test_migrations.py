@@ -0,0 +1,9 @@
+import migrations
+
+
+def test_schema_is_current(conn):
+    assert migrations.current_version(conn) == migrations.MIGRATIONS[-1][0]
+
+
+def test_no_unexpected_full_scans(conn):
+    assert migrations.check_query_plans(conn=conn) == []
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import scheduler
+
+NOW = datetime(2025, 3, 14, 10, 7)  # a Friday
+
+
+def test_cron_fields():
+    assert scheduler._parse_field("*/15", 0, 59) == {0, 15, 30, 45}
+    assert scheduler._parse_field("1-5,10", 0, 23) == {1, 2, 3, 4, 5, 10}
+    assert scheduler._parse_field("50/5", 0, 59) == {50, 55}
+    for bad in ("60", "5-1", "*/0"):
+        with pytest.raises(ValueError):
+            scheduler._parse_field(bad, 0, 59)
+    with pytest.raises(ValueError):
+        scheduler.CronSchedule("* * * *")
+
+
+def test_cron_next_after():
+    def next_after(expression, now=NOW):
+        return scheduler.CronSchedule(expression).next_after(now)
+
+    assert next_after("*/15 * * * *") == datetime(2025, 3, 14, 10, 15)
+    assert next_after("5 0 * * *") == datetime(2025, 3, 15, 0, 5)
+    assert next_after("30 4 * * 0") == datetime(2025, 3, 16, 4, 30)  # Sunday
+    assert next_after("30 4 * * 7") == datetime(2025, 3, 16, 4, 30)
+    assert next_after("0 0 1 * *") == datetime(2025, 4, 1)
+    # Day and weekday both restricted: either one matches, as in cron
+    assert next_after("0 12 20 * 1") == datetime(2025, 3, 17, 12)
+    assert next_after("0 0 29 2 *") == datetime(2028, 2, 29)
+    with pytest.raises(ValueError):
+        next_after("0 0 30 2 *")
+    assert scheduler.next_run(scheduler.OFF, NOW) == scheduler.NEVER
+
+
+def test_one_lease_per_job(conn, monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_DELAY", 60)
+    scheduler.sync_jobs(conn, NOW)
+    due = NOW + timedelta(days=8)  # every job is due
+
+    assert scheduler.claim(conn, "a", "rebuild_stats", now=due) == "rebuild_stats"
+    # Leased: another worker neither gets it by name nor among the due jobs
+    assert scheduler.claim(conn, "b", "rebuild_stats", now=due) is None
+    taken = {scheduler.claim(conn, "b", now=due) for _ in scheduler.JOBS}
+    assert "rebuild_stats" not in taken and None in taken
+
+    # The lease runs out: the job can be taken over, and the old owner's
+    # late finish records the run but does not reschedule it
+    later = due + timedelta(seconds=scheduler.LEASE_SECONDS + 1)
+    assert scheduler.claim(conn, "c", "rebuild_stats", now=later) == "rebuild_stats"
+    scheduler.finish(conn, "rebuild_stats", "a", 1.0, result="ok", now=later)
+    row = conn.execute("SELECT runs, lease_owner FROM Jobs WHERE name = 'rebuild_stats'").fetchone()
+    assert tuple(row) == (1, "c")
+
+    # A failure is retried with backoff, a success goes back to the schedule
+    attempt, run_at = scheduler.finish(conn, "rebuild_stats", "c", 1.0, error="boom", now=later)
+    assert attempt == 1 and later + timedelta(seconds=47) < datetime.strptime(run_at, scheduler.TIME_FORMAT)
+    assert scheduler.claim(conn, "c", "rebuild_stats", now=later) == "rebuild_stats"
+    attempt, run_at = scheduler.finish(conn, "rebuild_stats", "c", 1.0, result="ok", now=later)
+    assert attempt == 0 and run_at == scheduler.next_run("30 3 * * *", later)
@@ -0,0 +1,43 @@
+import loans
+import stats
+from test_loans import add_book, add_students
+
+
+def assert_counters_match_a_rebuild(conn):
+    counters = stats.read_stats(conn)
+    conn.execute("SAVEPOINT rebuild")
+    stats.rebuild_stats(conn)
+    rebuilt = stats.read_stats(conn)
+    conn.execute("ROLLBACK TO rebuild")
+    conn.execute("RELEASE rebuild")
+    assert counters == rebuilt
+    return counters
+
+
+def test_triggers_keep_the_counters_in_step(conn):
+    before = assert_counters_match_a_rebuild(conn)
+
+    book_id = add_book(conn)
+    first, second = add_students(conn, 2)
+    txn = loans.borrow_book(conn, first, book_id, "2025-01-01")['transaction_id']
+    after = assert_counters_match_a_rebuild(conn)
+    assert after['books'] == before['books'] + 1
+    assert after['patrons.role.Student'] == before['patrons.role.Student'] + 2
+    assert after['loans.open'] == before['loans.open'] + 1
+    assert after['books.borrowed'] == before['books.borrowed'] + 1
+
+    conn.execute("UPDATE Transactions SET fine = 4.5 WHERE transaction_id = ?", (txn,))
+    conn.execute("INSERT INTO Payments (patron_id, amount, payment_date, purpose) VALUES (?, 4.5, '2025-01-09', 'x')",
+                 (first,))
+    conn.commit()
+    after = assert_counters_match_a_rebuild(conn)
+    assert after['fines.outstanding'] == round(before['fines.outstanding'] + 4.5, 2)
+    assert after['payments.total'] == round(before['payments.total'] + 4.5, 2)
+
+    loans.return_loan(conn, txn, "2025-01-10", 6.0)
+    conn.execute("UPDATE Books SET type = 'Reference' WHERE book_id = ?", (book_id,))
+    conn.execute("DELETE FROM Patron WHERE patron_id = ?", (second,))
+    conn.commit()
+    after = assert_counters_match_a_rebuild(conn)
+    assert after['loans.open'] == before['loans.open']
+    assert after['books.type.Reference'] == before.get('books.type.Reference', 0) + 1